@@ -0,0 +1,134 @@
+"""
+Micro-benchmark of page serialization, before and after the slotted,
+one-pass serializer.
+
+The legacy path is rebuilt here the way the code used to work: property
+objects with a __dict__, every column of the database allocated for each
+field, properties merged with repeated dict.update and the payload encoded
+with json.dumps into a str. The current path is BookDatabase._get_page_object
+followed by notion.notion.dumps (orjson bytes when it is installed).
+
+    python benchmarks/serialization.py --pages 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import notion.notion
+from notion.database import BookDatabase
+from notion.notion import dumps
+from notion.property import NotionProperty
+
+BOOK = {
+    "title": "学会提问（原书第12版）",
+    "description": "批判性思维领域“圣经”，授人以渔，学会提问，拒绝被操纵。" * 8,
+    "author": [
+        "0b7d5c3e-4d3c-4c5e-9a1f-2f6e5b9a1c01",
+        "7c1d2e3f-0a9b-4c8d-8e7f-6a5b4c3d2e1f",
+    ],
+    "cover_url": "https://img1.doubanio.com/view/subject/l/public/s33477046.jpg",
+    "icon_url": "https://img1.doubanio.com/view/subject/l/public/s33477046.jpg",
+    "publisher": "机械工业出版社",
+    "original_title": "Asking the Right Questions: A Guide to Critical Thinking",
+    "translator": ["2e3f4a5b-6c7d-4e8f-9a0b-1c2d3e4f5a6b"],
+    "published": "2019-08-01",
+    "pages": 256,
+    "douban_ranking": 8.1,
+    "douban_url": "https://book.douban.com/subject/34434309/",
+    "isbn": "9787111632306",
+    "type": "Book",
+    "source_id": "9f8e7d6c-5b4a-4392-8170-6f5e4d3c2b1a",
+}
+
+# Subclasses without __slots__ get a __dict__ back, like the old classes.
+LEGACY_CLASSES = {}
+
+
+def get_legacy_class(property_class):
+    if property_class not in LEGACY_CLASSES:
+        LEGACY_CLASSES[property_class] = type(
+            f"Legacy{property_class.__name__}", (property_class,), {}
+        )
+    return LEGACY_CLASSES[property_class]
+
+
+def legacy_serialize(database: BookDatabase, data):
+    properties = []
+    for property_name, property_value in data.items():
+        formats = {
+            key: get_legacy_class(column.property_class)(
+                column.name, [property_value] if column.single else property_value
+            )
+            for key, column in database.columns.items()
+        }
+        property_object = formats.get(property_name)
+        if property_object:
+            properties.append(property_object)
+
+    formatted = {}
+    for property_object in properties:
+        assert isinstance(property_object, NotionProperty)
+        property_dict = property_object.get_dict()
+        if property_dict:
+            formatted.update(property_dict)
+
+    page_object = {
+        "parent": {"database_id": database.database_id},
+        "properties": formatted,
+    }
+    page_object.update({"cover": {"external": {"url": data["cover_url"]}}})
+    page_object.update({"icon": {"external": {"url": data["icon_url"]}}})
+    return json.dumps(page_object)
+
+
+def current_serialize(database: BookDatabase, data):
+    return dumps(database._get_page_object(data))
+
+
+def measure(serialize, database, pages):
+    seconds = min(
+        timeit.repeat(lambda: serialize(database, BOOK), number=pages, repeat=5)
+    )
+
+    # Peak memory allocated while serializing a single page.
+    tracemalloc.start()
+    body = serialize(database, BOOK)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "us_per_page": round(seconds / pages * 1e6, 2),
+        "peak_bytes_per_page": peak,
+        "body_bytes": len(body if isinstance(body, bytes) else body.encode()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    args = parser.parse_args()
+
+    database = BookDatabase(None, "book-database")
+    assert json.loads(legacy_serialize(database, BOOK)) == json.loads(
+        current_serialize(database, BOOK)
+    ), "Both serializers should produce the same payload."
+
+    results = {
+        "json_backend": "orjson" if notion.notion.orjson is not None else "json",
+        "legacy": measure(legacy_serialize, database, args.pages),
+        "current": measure(current_serialize, database, args.pages),
+    }
+    results["speedup"] = round(
+        results["legacy"]["us_per_page"] / results["current"]["us_per_page"], 2
+    )
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
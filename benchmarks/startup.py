@@ -0,0 +1,114 @@
+"""
+Measure the cold start of the function app.
+
+Every run starts a fresh interpreter, imports function_app, builds the
+command graph and routes a podcast URL and an ISBN, timing each step and
+recording which heavy modules got loaded along the way. Run it from the
+repository root:
+
+    python benchmarks/startup.py --runs 10 --output startup.json
+
+With --max-import-ms the script exits with 1 when the median import time
+goes over the budget, so it can guard cold-start regressions in CI.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that dominate the cold start when they are imported eagerly.
+HEAVY_MODULES = ("aiohttp", "bs4", "lxml", "extractor.douban", "extractor.zhongdu")
+
+PROBE = """
+import json, sys, time
+
+def loaded():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+timings = {}
+start = time.perf_counter()
+import function_app
+timings["import_ms"] = (time.perf_counter() - start) * 1000
+modules = {"import": loaded()}
+
+start = time.perf_counter()
+function_app.get_add_by_url_command()
+function_app.get_add_by_isbn_command()
+timings["commands_ms"] = (time.perf_counter() - start) * 1000
+
+start = time.perf_counter()
+function_app.registry.find_by_url("https://ny.zdline.cn/mobile/audio?artId=1")
+timings["route_url_ms"] = (time.perf_counter() - start) * 1000
+modules["route_url"] = loaded()
+
+start = time.perf_counter()
+function_app.registry.find_by_isbn("9787111680925")
+timings["route_isbn_ms"] = (time.perf_counter() - start) * 1000
+modules["route_isbn"] = loaded()
+
+print(json.dumps({"timings": timings, "modules": modules}))
+"""
+
+
+def run_once():
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="1")
+    # Keep the measurement offline and free of disk state.
+    for name in ("NOTION_MIRROR_PATH", "EXTRACTOR_CACHE_DIR", "WARMUP_ENABLED"):
+        env.pop(name, None)
+    # The databases refuse to be built without an id, any id will do here.
+    for name in ("PERSON", "SOURCE", "PODCAST", "BOOK"):
+        env.setdefault(f"{name}_DATABASE_ID", f"{name.lower()}-database")
+
+    probe = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{PROBE}"
+    output = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    summary = {}
+    for name in runs[0]["timings"]:
+        values = [run["timings"][name] for run in runs]
+        summary[name] = {
+            "median": round(statistics.median(values), 2),
+            "min": round(min(values), 2),
+            "max": round(max(values), 2),
+        }
+    return {"runs": len(runs), "timings": summary, "modules": runs[-1]["modules"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write the summary to this JSON file.")
+    parser.add_argument("--max-import-ms", type=float)
+    args = parser.parse_args()
+
+    summary = summarize([run_once() for _ in range(args.runs)])
+    print(json.dumps(summary, indent=4))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(summary, file, indent=4)
+
+    import_ms = summary["timings"]["import_ms"]["median"]
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(
+            f"Median import time {import_ms}ms is over {args.max_import_ms}ms.",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""
+Offline benchmarks of the extractors, the Notion payload and AddByISBN.
+
+Everything runs against the corpus in benchmarks/corpus (Douban subject
+pages and Zhongdu newDetailToH5.do responses, listed in manifest.json) and
+the in-memory Notion of tests/fake_notion.py, so a result only depends on
+the code and the machine. Entries marked "synthetic" in the manifest are
+hand-written stand-ins with placeholder ISBNs and ids, not recordings; add
+live pages with `record` for numbers closer to production. Run it from the
+repository root:
+
+    python benchmarks/suite.py run
+    python benchmarks/suite.py run --baseline benchmarks/results/baseline.json
+    python benchmarks/suite.py record --isbn 9787111632306 \
+        --url "http://ny.zdline.cn/mobile/audioText?artId=158504&sm=app"
+
+`run` writes the medians to benchmarks/results/<commit>.json. With
+--baseline it compares them and exits with 1 when a benchmark got slower
+than the baseline by more than --tolerance, so regressions show up between
+commits. Timings only compare on the same machine: a baseline recorded on
+another CPU, Python or JSON backend is reported with a warning and never
+fails the run. After an intended change, or on a new machine, refresh the
+baseline with --output benchmarks/results/baseline.json. `record` downloads
+live pages into the corpus and needs network access.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import notion.notion
+from extractor.douban import DoubanBookExtractor
+from extractor.zhongdu import ART_ID_PATTERN, META_INFO_ENDPOINT, ZhongduExtractor
+from logic.commands import AddByISBNCommand, AsyncAddByISBNCommand
+from notion.database import BookDatabase, PersonDatabase, SourceDatabase
+from notion.notion import NOTION_API_BASE, NotionManager, dumps
+from notion.page import NotionPage
+from notion.scheduler import RequestScheduler
+from tests.fake_notion import FakeNotion
+
+CORPUS = os.path.join(ROOT, "benchmarks", "corpus")
+MANIFEST = os.path.join(CORPUS, "manifest.json")
+RESULTS = os.path.join(ROOT, "benchmarks", "results")
+# Results only compare when all of these match.
+ENVIRONMENT_KEYS = ("python", "machine", "cpu", "cpu_count", "json_backend")
+
+
+def load_manifest():
+    with open(MANIFEST, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def load_corpus():
+    manifest = load_manifest()
+    corpus = {"douban": [], "zhongdu": []}
+    for kind, entries in manifest.items():
+        for entry in entries:
+            with open(os.path.join(CORPUS, entry["file"]), "rb") as file:
+                corpus[kind].append(dict(entry, content=file.read()))
+    return corpus
+
+
+class CorpusExtractor(DoubanBookExtractor):
+    """
+    Serve the Douban pages of the corpus instead of the network.
+    """
+
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = {page["isbn"]: (page["url"], page["content"]) for page in pages}
+
+    def fetch(self, isbn):
+        return self.pages.get(isbn)
+
+
+class CorpusAddByISBNCommand(AddByISBNCommand):
+    def __init__(self, extractor, *databases):
+        self.extractor = extractor
+        super().__init__(*databases)
+
+    def _get_extractor(self, isbn):
+        return self.extractor
+
+
+class AsyncCorpusAddByISBNCommand(CorpusAddByISBNCommand, AsyncAddByISBNCommand):
+    pass
+
+
+def get_databases():
+    """
+    Fresh databases on an empty in-memory Notion, without a query cache so
+    every lookup goes through the client.
+    """
+    fake = FakeNotion()
+    client = NotionManager(
+        "secret_benchmark",
+        session=fake.session(NOTION_API_BASE),
+        scheduler=RequestScheduler(rate=1e9, burst=1e9),
+        async_session=fake.async_session(NOTION_API_BASE),
+    )
+    return (
+        SourceDatabase(client, "source-database"),
+        PersonDatabase(client, "person-database"),
+        BookDatabase(client, "book-database"),
+    )
+
+
+class Benchmark:
+    """
+    `operation(state, item)` runs once per item and round, `setup()` builds
+    the state of every round outside the timing.
+    """
+
+    def __init__(self, name, items, operation, setup=lambda: None, inner=1):
+        self.name = name
+        self.items = items
+        self.operation = operation
+        self.setup = setup
+        self.inner = inner
+
+    def run(self, rounds):
+        timings = []
+        # The first round warms caches and lazy imports up and is dropped.
+        for _ in range(rounds + 1):
+            state = self.setup()
+            start = time.perf_counter()
+            for _ in range(self.inner):
+                for item in self.items:
+                    self.operation(state, item)
+            elapsed = time.perf_counter() - start
+            timings.append(elapsed / (self.inner * len(self.items)) * 1e6)
+        timings = timings[1:]
+
+        median = statistics.median(timings)
+        return {
+            "us_per_op": round(median, 2),
+            "min_us_per_op": round(min(timings), 2),
+            "ops_per_s": round(1e6 / median, 1),
+            "rounds": rounds,
+        }
+
+
+def get_benchmarks(corpus):
+    douban = corpus["douban"]
+    zhongdu = corpus["zhongdu"]
+    lxml_extractor = DoubanBookExtractor(parser="lxml")
+    bs4_extractor = DoubanBookExtractor(parser="bs4")
+    zhongdu_extractor = ZhongduExtractor()
+
+    # Book data as the write stage sees it, with people already resolved.
+    books = []
+    for page in douban:
+        data = lxml_extractor.parse(page["isbn"], page["url"], page["content"])
+        data["author"] = [f"author-{i}" for i, _ in enumerate(data["author"])]
+        data["translator"] = [
+            f"translator-{i}" for i, _ in enumerate(data["translator"] or [])
+        ]
+        data["source_id"] = "source-page"
+        books.append(data)
+    book_database = BookDatabase(None, "book-database")
+    pages = [
+        (book_database._turn_to_notion_property_list(book), book) for book in books
+    ]
+
+    isbns = [page["isbn"] for page in douban]
+
+    def add_by_isbn_setup():
+        return CorpusAddByISBNCommand(CorpusExtractor(douban), *get_databases())
+
+    def add_by_isbn_async_setup():
+        return AsyncCorpusAddByISBNCommand(CorpusExtractor(douban), *get_databases())
+
+    return [
+        Benchmark(
+            "douban_parse_lxml",
+            douban,
+            lambda _, page: lxml_extractor.parse(
+                page["isbn"], page["url"], page["content"]
+            ),
+            inner=10,
+        ),
+        Benchmark(
+            "douban_parse_bs4",
+            douban,
+            lambda _, page: bs4_extractor.parse(
+                page["isbn"], page["url"], page["content"]
+            ),
+            inner=5,
+        ),
+        Benchmark(
+            "zhongdu_parse",
+            zhongdu,
+            lambda _, page: zhongdu_extractor._extract_from_meta_info(
+                json.loads(page["content"])
+            ),
+            inner=200,
+        ),
+        Benchmark(
+            "notion_page_object",
+            pages,
+            lambda _, page: NotionPage(
+                "book-database",
+                page[0],
+                cover_url=page[1]["cover_url"],
+                icon_url=page[1]["icon_url"],
+            ).get_notion_page_object(),
+            inner=500,
+        ),
+        Benchmark(
+            "notion_payload",
+            books,
+            lambda _, book: dumps(book_database._get_page_object(book)),
+            inner=500,
+        ),
+        Benchmark(
+            "add_by_isbn",
+            isbns,
+            lambda command, isbn: command.execute(isbn),
+            setup=add_by_isbn_setup,
+        ),
+        Benchmark(
+            "add_by_isbn_async",
+            isbns,
+            lambda command, isbn: asyncio.run(command.execute(isbn)),
+            setup=add_by_isbn_async_setup,
+        ),
+    ]
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def get_cpu():
+    try:
+        with open("/proc/cpuinfo") as file:
+            for line in file:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or None
+
+
+def get_environment_changes(results, baseline):
+    return [
+        f"{key} {baseline.get(key)} -> {results[key]}"
+        for key in ENVIRONMENT_KEYS
+        if baseline.get(key) != results[key]
+    ]
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the change of every benchmark against the baseline and return the
+    names of the ones slower by more than `tolerance`.
+    """
+    regressions = []
+    print(f"{'benchmark':<24}{'baseline us':>14}{'current us':>14}{'change':>10}")
+    for name, result in results["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            print(f"{name:<24}{'-':>14}{result['us_per_op']:>14.2f}{'new':>10}")
+            continue
+        change = result["us_per_op"] / before["us_per_op"] - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:<24}{before['us_per_op']:>14.2f}{result['us_per_op']:>14.2f}"
+            f"{change:>+10.1%}{flag}"
+        )
+    return regressions
+
+
+def run(args):
+    corpus = load_corpus()
+    benchmarks = get_benchmarks(corpus)
+    if args.only:
+        benchmarks = [
+            benchmark for benchmark in benchmarks if benchmark.name in args.only
+        ]
+
+    results = {
+        "commit": get_commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(
+            timespec="seconds"
+        ),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu": get_cpu(),
+        "cpu_count": os.cpu_count(),
+        "json_backend": "orjson" if notion.notion.orjson is not None else "json",
+        "corpus": dict(
+            {kind: len(entries) for kind, entries in corpus.items()},
+            synthetic=sum(
+                entry.get("synthetic", False)
+                for entries in corpus.values()
+                for entry in entries
+            ),
+        ),
+        "benchmarks": {},
+    }
+    for benchmark in benchmarks:
+        results["benchmarks"][benchmark.name] = benchmark.run(args.rounds)
+        print(f"{benchmark.name}: {results['benchmarks'][benchmark.name]}")
+
+    output = args.output or os.path.join(RESULTS, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=4)
+        file.write("\n")
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        changes = get_environment_changes(results, baseline)
+        if changes:
+            print(
+                f"The baseline comes from another environment ({', '.join(changes)}),"
+                " the timings don't compare. Record one here with --output.",
+                file=sys.stderr,
+            )
+        elif regressions:
+            print(
+                f"Slower than the baseline by more than {args.tolerance:.0%}: "
+                f"{', '.join(regressions)}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+
+def record(args):
+    import requests
+
+    manifest = load_manifest()
+    # The corpus keeps whole pages.
+    extractor = DoubanBookExtractor(stop_marker=None)
+
+    for isbn in args.isbn:
+        page = extractor.fetch(isbn)
+        if page is None:
+            print(f"Douban doesn't know ISBN {isbn}.", file=sys.stderr)
+            continue
+        url, content = page
+        path = f"douban/{url.rstrip('/').rsplit('/', 1)[-1]}.html"
+        with open(os.path.join(CORPUS, path), "wb") as file:
+            file.write(content)
+        manifest["douban"] = [e for e in manifest["douban"] if e["file"] != path]
+        manifest["douban"].append({"isbn": isbn, "url": url, "file": path})
+        print(f"Recorded {url} to {path}")
+
+    for url in args.url:
+        art_id = ART_ID_PATTERN.findall(url)[0]
+        response = requests.get(META_INFO_ENDPOINT.format(art_id))
+        response.raise_for_status()
+        path = f"zhongdu/{art_id}.json"
+        with open(os.path.join(CORPUS, path), "wb") as file:
+            file.write(response.content)
+        manifest["zhongdu"] = [e for e in manifest["zhongdu"] if e["file"] != path]
+        manifest["zhongdu"].append({"url": url, "file": path})
+        print(f"Recorded {url} to {path}")
+
+    with open(MANIFEST, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=4)
+        file.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks.")
+    run_parser.add_argument("--rounds", type=int, default=7)
+    run_parser.add_argument("--only", nargs="+", help="Benchmarks to run.")
+    run_parser.add_argument(
+        "--output", help="Defaults to benchmarks/results/<commit>.json."
+    )
+    run_parser.add_argument("--baseline", help="Results JSON to compare with.")
+    run_parser.add_argument("--tolerance", type=float, default=0.25)
+    run_parser.set_defaults(function=run)
+
+    record_parser = commands.add_parser("record", help="Add live pages to the corpus.")
+    record_parser.add_argument("--isbn", nargs="*", default=[])
+    record_parser.add_argument("--url", nargs="*", default=[], help="Zhongdu URLs.")
+    record_parser.set_defaults(function=record)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,42 @@
 from abc import ABC, abstractmethod
 
+from telemetry import metrics
+from telemetry.tracing import trace_methods
+
+FETCH_SECONDS = metrics.histogram(
+    "extractor_fetch_duration_seconds",
+    "Duration of upstream fetches by extractor, cache hits included.",
+    ("extractor",),
+)
+
 class Extractor(ABC):
+    """
+    Extractors are stateless: a call keeps what it parses in locals or in a
+    per-call context, so one instance can be shared by threads and asyncio
+    tasks.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Every extractor shows up in the request trace.
+        trace_methods(cls, ("extract", "fetch", "parse"))
+
     @abstractmethod
     def match(self, url) -> bool:
         raise NotImplementedError("Classes inherit Extractor should implement a match method.")
     
     @abstractmethod
     def extract(self, url) -> dict:
-        raise NotImplementedError("Classes inherit Extractor should implement a extract method.")
\ No newline at end of file
+        raise NotImplementedError("Classes inherit Extractor should implement a extract method.")
+
+    def fetch(self, url):
+        """
+        Download everything `parse` needs and return it as a tuple, or None if
+        there is nothing to extract. Extractors that don't split the network
+        and parsing work do the whole extraction here.
+        """
+        data = self.extract(url)
+        return None if data is None else (data,)
+
+    def parse(self, url, *page) -> dict:
+        return page[0]
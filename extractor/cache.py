@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+import requests
+
+from telemetry.logs import get_logger
+
+log = get_logger(__name__)
+
+
+class CachedResponse:
+    def __init__(self, url, status_code, content: bytes, encoding="utf-8"):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class HTTPCache:
+    """
+    A disk cache of upstream responses shared by the extractors.
+
+    Bodies are stored zlib-compressed next to a small JSON metadata file.
+    Within `ttl` seconds a cached body is served without touching the
+    network. After that it is revalidated with If-None-Match /
+    If-Modified-Since. The cache also remembers redirects (e.g. ISBN ->
+    Douban subject URL) and keeps short-lived negative entries for lookups
+    that found nothing.
+
+    Every `prune_every` writes, files older than `max_age` seconds are
+    removed, then the oldest ones until the directory fits in `max_size`
+    bytes.
+    """
+
+    def __init__(
+        self,
+        directory,
+        ttl=86400,
+        negative_ttl=3600,
+        session=requests,
+        max_size=256 * 1024 * 1024,
+        max_age=7 * 86400,
+        prune_every=100,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.session = session
+        self.max_size = max_size
+        self.max_age = max_age
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        log.info("Create a HTTPCache object: directory=%s", directory)
+
+    def _get_path(self, key, suffix):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.{suffix}")
+
+    def _write(self, path, content: bytes):
+        # Write to a temporary file first so readers never see half a file.
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """
+        Remove expired files, then the oldest ones above `max_size`. Returns
+        the number of files removed.
+        """
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                # Skip the temporary files of writes in progress.
+                if not entry.name.endswith((".json", ".body")):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        size = sum(entry[1] for entry in entries)
+        expired_before = time.time() - self.max_age
+        removed = 0
+        for mtime, file_size, path in entries:
+            if mtime >= expired_before and size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= file_size
+            removed += 1
+
+        if removed:
+            log.info("Pruned %s files from %s.", removed, self.directory)
+        return removed
+
+    def _read_meta(self, key):
+        try:
+            with open(self._get_path(key, "json"), "rb") as file:
+                return json.loads(file.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, meta):
+        self._write(self._get_path(key, "json"), json.dumps(meta).encode("utf-8"))
+
+    def _read_body(self, url):
+        try:
+            with open(self._get_path(url, "body"), "rb") as file:
+                return zlib.decompress(file.read())
+        except (OSError, zlib.error):
+            return None
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def store(self, response, request_url=None, content: bytes = None, partial=False):
+        """
+        Cache a response fetched elsewhere. `request_url` records the
+        redirect when the response was reached through one. Pass `content`
+        when the body was already consumed from a streamed response, and
+        `partial` when that body was cut short.
+        """
+        if response.status_code >= 400:
+            return
+
+        content = content if content is not None else response.content
+        self._write(self._get_path(response.url, "body"), zlib.compress(content))
+        self._write_meta(
+            response.url,
+            {
+                "url": response.url,
+                "status_code": response.status_code,
+                "encoding": response.encoding,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "fetched_at": time.time(),
+                "partial": partial,
+            },
+        )
+        if request_url and request_url != response.url:
+            self.set_redirect(request_url, response.url)
+
+    def get(self, url, headers=None, timeout=None, partial=False) -> CachedResponse:
+        """
+        Serve `url` from the cache, revalidating stale entries. Entries cut
+        short are only served to callers passing `partial`, the others
+        download the whole body again.
+        """
+        request_url = url
+        url = self._get_location(url) or url
+        meta = self._read_meta(url)
+        if meta and meta.get("partial") and not partial:
+            meta = None
+        body = self._read_body(url) if meta else None
+
+        if body is not None and time.time() - meta["fetched_at"] < self.ttl:
+            self._count("hits")
+            log.info("Serve %s from cache.", url)
+            return CachedResponse(url, meta["status_code"], body, meta["encoding"])
+
+        headers = dict(headers or {})
+        if body is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and body is not None:
+            self._count("revalidated")
+            log.info("Revalidated %s in cache.", url)
+            self._write_meta(url, dict(meta, fetched_at=time.time()))
+            return CachedResponse(url, meta["status_code"], body, meta["encoding"])
+
+        self._count("misses")
+        self.store(response, request_url=request_url)
+        return CachedResponse(
+            response.url, response.status_code, response.content, response.encoding
+        )
+
+    def _get_location(self, url):
+        meta = self._read_meta(f"redirect:{url}")
+        if meta and time.time() - meta["fetched_at"] < self.ttl:
+            return meta["location"]
+        return None
+
+    def get_redirect(self, url):
+        location = self._get_location(url)
+        if location:
+            self._count("hits")
+        return location
+
+    def set_redirect(self, url, location):
+        self._write_meta(
+            f"redirect:{url}", {"location": location, "fetched_at": time.time()}
+        )
+
+    def is_negative(self, key):
+        meta = self._read_meta(f"negative:{key}")
+        if meta and time.time() < meta["expires_at"]:
+            self._count("hits")
+            return True
+        return False
+
+    def set_negative(self, key):
+        self._write_meta(
+            f"negative:{key}", {"expires_at": time.time() + self.negative_ttl}
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    The cache configured through EXTRACTOR_CACHE_DIR, or None if it is unset.
+    """
+    global _default_cache
+    directory = os.getenv("EXTRACTOR_CACHE_DIR")
+    if not directory:
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.directory != directory:
+            _default_cache = HTTPCache(
+                directory,
+                ttl=float(os.getenv("EXTRACTOR_CACHE_TTL", "86400")),
+                negative_ttl=float(os.getenv("EXTRACTOR_CACHE_NEGATIVE_TTL", "3600")),
+                max_size=int(os.getenv("EXTRACTOR_CACHE_MAX_MB", "256")) * 1024 * 1024,
+                max_age=float(os.getenv("EXTRACTOR_CACHE_MAX_AGE", "604800")),
+            )
+    return _default_cache
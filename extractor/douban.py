@@ -1,184 +1,497 @@
 from bs4 import BeautifulSoup
+from lxml import etree, html
 import requests
 import json
 import re
-import logging
+import threading
 from datetime import datetime
 
-from extractor.base import Extractor
-
-log = logging.getLogger(__name__)
+from extractor.base import Extractor, FETCH_SECONDS
+from extractor.cache import HTTPCache, get_default_cache
+from telemetry import metrics
+from telemetry.logs import get_logger, payload
+
+log = get_logger(__name__)
+
+# The author intro comes after every block the extractor reads (schema, #info,
+# rating and the book intro), so streaming stops once it shows up.
+AUTHOR_INTRO_MARKER = "作者简介".encode("utf-8")
+# Without these two blocks the parser silently loses most fields, so a marker
+# showing up before them doesn't stop the read.
+REQUIRED_BLOCKS = (b"application/ld+json", b'id="info"')
+
+PARSERS = ("bs4", "lxml")
+
+ISBN_PATTERN = re.compile(r"^[0-9]*$")
+# Where the ISBN redirect lands for a known book. Anything else, e.g. the
+# sec.douban.com anti-bot check, must not be cached.
+SUBJECT_URL_PATTERN = re.compile(r"^https://book\.douban\.com/subject/\d+/?$")
+
+PERSON_EMOJI = "🧑\u200d🏫"
+
+
+def _format_authors(authors):
+    author_list = []
+    for author in authors:
+        author_name = re.sub(r"\[.*\]", "", author["name"]).strip()
+        if author_name.find("·") != -1:
+            names = author_name.split("·")
+            names = [name.strip() for name in names]
+            author_name = " · ".join(names)
+        author_list.append({"name": author_name, "icon_emoji": PERSON_EMOJI})
+    return author_list
+
+
+def _format_published(raw_date):
+    raw_date = raw_date.split("-")
+    year = int(raw_date[0])
+    month = int(raw_date[1])
+    day = int(raw_date[2]) if len(raw_date) > 2 else 1
+    return datetime.strftime(datetime(year, month, day), "%Y-%m-%d")
+
+
+# lxml parsers and compiled XPath objects must not be shared between threads,
+# so every thread compiles its own set once and reuses it afterwards.
+_lxml_local = threading.local()
+
+
+def _get_lxml_tools():
+    tools = getattr(_lxml_local, "tools", None)
+    if tools is None:
+        tools = {
+            "parser": html.HTMLParser(encoding="utf-8"),
+            "schema": etree.XPath('//script[@type="application/ld+json"][1]'),
+            "cover": etree.XPath('//meta[@property="og:image"][1]/@content'),
+            "info_labels": etree.XPath(
+                '//div[@id="info"]//span[contains(concat(" ", @class, " "), " pl ")]'
+            ),
+            "ranking": etree.XPath('//strong[@property="v:average"][1]'),
+            "intro": etree.XPath(
+                '//div[contains(concat(" ", normalize-space(@class), " "), " intro ")]'
+            ),
+        }
+        _lxml_local.tools = tools
+    return tools
+
+
+def _get_text(text):
+    """
+    BeautifulSoup collapses whitespace-only strings into a single newline or
+    space, do the same so both parsers return the same text.
+    """
+    if text and text.isspace():
+        return "\n" if "\n" in text else " "
+    return text
+
+
+def _is_comment(node):
+    return node.tag is etree.Comment
+
+
+def _get_string(node):
+    """
+    BeautifulSoup's Tag.string for an lxml element: the text of an element
+    with a single child string, looking through single-child wrappers.
+    """
+    if _is_comment(node):
+        return _get_text(node.text)
+    children = list(node)
+    if not children:
+        return _get_text(node.text) or None
+    if len(children) == 1 and not node.text and not children[0].tail:
+        return _get_string(children[0])
+    return None
+
+
+def _get_next_siblings(element):
+    """
+    BeautifulSoup's next_sibling and next_sibling.next_sibling for an lxml
+    element, counting the text between elements as siblings.
+    """
+    if element.tail:
+        return _get_text(element.tail), element.getnext()
+    following = element.getnext()
+    if following is None:
+        return None, None
+    return following, _get_text(following.tail) or following.getnext()
+
+
+def _to_str(node):
+    if node is None or isinstance(node, str):
+        return str(node)
+    return html.tostring(node, encoding=str, with_tail=False)
+
+
+class DoubanPage:
+    """
+    Parse context of one subject page. It lives for a single parse() call so
+    extractors never keep a page around between calls.
+    """
+
+    def __init__(self, url, soup, schema):
+        self.url = url
+        self.soup = soup
+        self.schema = schema
+
+    def close(self):
+        self.soup.decompose()
+        self.soup = None
+        self.schema = None
 
 
 class DoubanBookExtractor(Extractor):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        cache: HTTPCache = None,
+        stop_marker: bytes = AUTHOR_INTRO_MARKER,
+        parser="lxml",
+        timeout=10,
+    ) -> None:
+        """
+        The subject page is streamed and the download stops as soon as
+        `stop_marker` arrives, pass None to always read the whole page.
+        `parser` picks the parsing engine, "lxml" or "bs4". Both return the
+        same data. `timeout` bounds every request to Douban, in seconds.
+        """
+        assert parser in PARSERS, f"Unknown parser {parser}, use one of {PARSERS}."
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 6.1) AppleWebKit/536.7 (KHTML, like Gecko) Chrome/20.0.1099.0 Safari/536.7 QQBrowser/6.14.15493.201"
         }
+        self.cache = cache if cache is not None else get_default_cache()
+        self.stop_marker = stop_marker
+        self.parser = parser
+        self.timeout = timeout
 
         log.info("Create a DoubanBookExtractor object.")
 
     def match(self, isbn: str) -> bool:
         isbn = isbn.replace("-", "")
-        pattern = re.compile(f"^[0-9]*$")
-
-        match_result = bool(pattern.search(isbn))
+        match_result = bool(ISBN_PATTERN.search(isbn))
 
         if match_result:
-            log.info(f"DoubanBook Extractor can process {isbn}.")
+            log.info("DoubanBook Extractor can process %s.", isbn)
         else:
-            log.info(f"DoubanBook Extractor cannot process {isbn}.")
+            log.info("DoubanBook Extractor cannot process %s.", isbn)
 
         return match_result
 
-    def _get_douban_url(self, isbn):
+    def _read_body(self, response):
+        """
+        Read the response body, stopping early at `stop_marker` once the
+        REQUIRED_BLOCKS were read. Returns the bytes and whether the body is
+        complete.
+        """
+        if self.stop_marker is None:
+            return response.content, True
+
+        overlap = max(len(marker) for marker in (self.stop_marker, *REQUIRED_BLOCKS))
+        missing = REQUIRED_BLOCKS
+        chunks = []
+        window = b""
+        complete = True
+        for chunk in response.iter_content(chunk_size=16384):
+            chunks.append(chunk)
+            window = window[-overlap:] + chunk
+            missing = [block for block in missing if block not in window]
+            if not missing and self.stop_marker in window:
+                complete = False
+                break
+        response.close()
+
+        return b"".join(chunks), complete
+
+    def _get_douban_page(self, isbn):
+        """
+        Follow the ISBN redirect and keep the body of the subject page it
+        lands on, so the page is downloaded only once.
+        """
         endpoint = f"https://book.douban.com/isbn/{isbn}/"
-        response = requests.get(endpoint, headers=self.headers)
+        if self.cache is not None:
+            if self.cache.is_negative(endpoint):
+                log.info("Cannot find forwarding url for %s (cached)", isbn)
+                return None
+            douban_url = self.cache.get_redirect(endpoint)
+            if douban_url:
+                log.info(
+                    "Get Douban url for book(isbn=%s) from cache: %s", isbn, douban_url
+                )
+                return douban_url, self._fetch_page(douban_url)
+
+        response = requests.get(
+            endpoint,
+            headers=self.headers,
+            stream=self.stop_marker is not None,
+            timeout=self.timeout,
+        )
         douban_url = response.url
 
         if douban_url == endpoint:
-            log.info(f"Cannot find forwarding url for {isbn}")
-            douban_url = None
-        else:
-            log.info(f"Get Douban url for book(isbn={isbn}): {douban_url}")
+            log.info(
+                "Cannot find forwarding url for %s: status=%s",
+                isbn,
+                response.status_code,
+            )
+            response.close()
+            # Only a 404 means Douban doesn't know the ISBN, throttling and
+            # server errors are worth another try.
+            if self.cache is not None and response.status_code == 404:
+                self.cache.set_negative(endpoint)
+            return None
+
+        log.info("Get Douban url for book(isbn=%s): %s", isbn, douban_url)
+        content, complete = self._read_body(response)
+        if self.cache is not None and SUBJECT_URL_PATTERN.match(douban_url):
+            self.cache.store(response, endpoint, content, partial=not complete)
+
+        return douban_url, content
 
-        return douban_url
+    def _get_douban_url(self, isbn):
+        page = self._get_douban_page(isbn)
+        return page[0] if page else None
+
+    def _fetch_page(self, url):
+        if self.cache is not None:
+            # A page cut at the stop marker still holds everything we parse.
+            return self.cache.get(
+                url,
+                headers=self.headers,
+                timeout=self.timeout,
+                partial=self.stop_marker is not None,
+            ).content
+
+        return requests.get(url, headers=self.headers, timeout=self.timeout).content
 
-    def _load_page(self, url):
-        html_doc = requests.get(url, headers=self.headers).text
-        self.soup = BeautifulSoup(html_doc, "lxml")
+    def _load_page(self, url, html_doc=None) -> DoubanPage:
+        if html_doc is None:
+            html_doc = self._fetch_page(url)
+        soup = BeautifulSoup(html_doc, "lxml")
 
-        schema_tag = self.soup.find("script", type="application/ld+json")
-        self.schema = json.loads(schema_tag.string)
+        schema_tag = soup.find("script", type="application/ld+json")
+        schema = json.loads(schema_tag.string)
 
-        log.info(f"Extract schema object of {url}: {self.schema}")
+        log.info("Extract schema object of %s: %s", url, payload(schema))
+        return DoubanPage(url, soup, schema)
 
-    def _get_title(self):
-        title = self.schema["name"].strip()
-        log.info(f"Get title: {title}")
+    def _get_title(self, page: DoubanPage):
+        title = page.schema["name"].strip()
+        log.info("Get title: %s", title)
 
         return title
 
-    def _get_author(self):
-        author_list = []
-        for author in self.schema["author"]:
-            author_name = re.sub(r"\[.*\]", "", author["name"]).strip()
-            if author_name.find("·") != -1:
-                names = author_name.split("·")
-                names = [name.strip() for name in names]
-                author_name = " · ".join(names)
-            author_list.append({"name": author_name, "icon_emoji": "🧑\u200d🏫"})
-
-        log.info(f"Get author: {author_list}")
+    def _get_author(self, page: DoubanPage):
+        author_list = _format_authors(page.schema["author"])
+        log.info("Get author: %s", author_list)
         return author_list
 
-    def _get_cover(self):
-        cover = self.soup.find("meta", property="og:image")["content"]
-        log.info(f"Get cover: {cover}")
+    def _get_cover(self, page: DoubanPage):
+        cover = page.soup.find("meta", property="og:image")["content"]
+        log.info("Get cover: %s", cover)
 
         return cover
 
-    def _get_publisher(self):
+    def _get_publisher(self, page: DoubanPage):
         publisher = None
-        publisher_tag = self.soup.find("span", string="出版社:")
+        publisher_tag = page.soup.find("span", string="出版社:")
         if publisher_tag:
             publisher = str(publisher_tag.next_sibling.next_sibling.string)
-        log.info(f"Get publisher: {publisher}")
+        log.info("Get publisher: %s", publisher)
 
         return publisher
 
-    def _get_original_title(self):
+    def _get_original_title(self, page: DoubanPage):
         original_title = None
-        original_title_tag = self.soup.find("span", string="原作名:")
+        original_title_tag = page.soup.find("span", string="原作名:")
         if original_title_tag:
             original_title = str(original_title_tag.next_sibling).strip()
-        log.info(f"Get original title: {original_title}")
+        log.info("Get original title: %s", original_title)
 
         return original_title
 
-    def _get_translator(self):
+    def _get_translator(self, page: DoubanPage):
         translator_list = None
-        translator_tag = self.soup.find("span", string=" 译者")
+        translator_tag = page.soup.find("span", string=" 译者")
         if translator_tag:
             translator_tag = translator_tag.find_next_siblings("a")
             translator_list = [
-                {"name": str(translator.string), "icon_emoji": "🧑\u200d🏫"}
+                {"name": str(translator.string), "icon_emoji": PERSON_EMOJI}
                 for translator in translator_tag
             ]
-        log.info(f"Get translator: {translator_list}")
+        log.info("Get translator: %s", translator_list)
 
         return translator_list
 
-    def _get_published(self):
+    def _get_published(self, page: DoubanPage):
         published = None
-        published_tag = self.soup.find("span", string="出版年:")
+        published_tag = page.soup.find("span", string="出版年:")
         if published_tag:
-            raw_date = str(published_tag.next_sibling).split("-")
-            year = int(raw_date[0])
-            month = int(raw_date[1])
-            day = int(raw_date[2]) if len(raw_date) > 2 else 1
-            published_date = datetime(year, month, day)
-            published = datetime.strftime(published_date, "%Y-%m-%d")
-        log.info(f"Get published: {published}")
+            published = _format_published(str(published_tag.next_sibling))
+        log.info("Get published: %s", published)
 
         return published
 
-    def _get_pages(self):
+    def _get_pages(self, page: DoubanPage):
         pages = None
-        pages_tag = self.soup.find("span", string="页数:")
+        pages_tag = page.soup.find("span", string="页数:")
         if pages_tag:
             pages = int(pages_tag.next_sibling.string)
-        log.info(f"Get pages: {pages}")
+        log.info("Get pages: %s", pages)
 
         return pages
 
-    def _get_douban_ranking(self):
+    def _get_douban_ranking(self, page: DoubanPage):
         douban_ranking = None
-        douban_ranking_tag = self.soup.find("strong", property="v:average")
+        douban_ranking_tag = page.soup.find("strong", property="v:average")
         if douban_ranking_tag:
             douban_ranking = float(douban_ranking_tag.string)
-        log.info(f"Get douban ranking: {douban_ranking}")
+        log.info("Get douban ranking: %s", douban_ranking)
         return douban_ranking
 
-    def _get_description(self):
+    def _get_description(self, page: DoubanPage):
         description = None
-        intro_tag_list = self.soup.findAll("div", class_="intro")
+        intro_tag_list = page.soup.findAll("div", class_="intro")
         if len(intro_tag_list) > 0:
             if intro_tag_list[0].find("a"):
                 intro_tag = intro_tag_list[1]
             else:
                 intro_tag = intro_tag_list[0]
 
-            log.info(f"Description tag is: {intro_tag}")
+            log.info("Description tag is: %s", payload(intro_tag))
             description = ""
             for paragraph in intro_tag.children:
                 if paragraph.string:
                     description = description + paragraph.string
                     description = description + "\n"
             description.strip()
-        log.info(f"Get description: {description}")
+        log.info("Get description: %s", description)
         return description
 
-    def extract(self, isbn) -> dict:
-        douban_url = self._get_douban_url(isbn)
-        data = None
-        if douban_url:
-            self._load_page(douban_url)
-            data = {
-                "title": self._get_title(),
-                "description": self._get_description(),
-                "author": self._get_author(),
-                "cover_url": self._get_cover(),
-                "icon_url": self._get_cover(),
-                "publisher": self._get_publisher(),
-                "original_title": self._get_original_title(),
-                "translator": self._get_translator(),
-                "published": self._get_published(),
-                "pages": self._get_pages(),
-                "douban_ranking": self._get_douban_ranking(),
+    def _parse_bs4(self, url, html_doc):
+        page = self._load_page(url, html_doc)
+        try:
+            cover = self._get_cover(page)
+            return {
+                "title": self._get_title(page),
+                "description": self._get_description(page),
+                "author": self._get_author(page),
+                "cover_url": cover,
+                "icon_url": cover,
+                "publisher": self._get_publisher(page),
+                "original_title": self._get_original_title(page),
+                "translator": self._get_translator(page),
+                "published": self._get_published(page),
+                "pages": self._get_pages(page),
+                "douban_ranking": self._get_douban_ranking(page),
+            }
+        finally:
+            page.close()
+
+    def _read_info(self, tools, root):
+        """
+        Walk the #info block once and map every label (e.g. "出版社:") to
+        the span holding it.
+        """
+        info = {}
+        for label_tag in tools["info_labels"](root):
+            info.setdefault(label_tag.text_content(), label_tag)
+        return info
+
+    def _get_lxml_description(self, tools, root):
+        intro_tag_list = tools["intro"](root)
+        if len(intro_tag_list) == 0:
+            return None
+
+        if intro_tag_list[0].find(".//a") is not None:
+            intro_tag = intro_tag_list[1]
+        else:
+            intro_tag = intro_tag_list[0]
+
+        paragraphs = [_get_text(intro_tag.text)]
+        for child in intro_tag:
+            paragraphs.append(_get_string(child))
+            paragraphs.append(_get_text(child.tail))
+        return "".join(paragraph + "\n" for paragraph in paragraphs if paragraph)
+
+    def _parse_lxml(self, url, html_doc):
+        tools = _get_lxml_tools()
+        if isinstance(html_doc, str):
+            html_doc = html_doc.encode("utf-8")
+        root = html.fromstring(html_doc, parser=tools["parser"])
+
+        schema = json.loads(tools["schema"](root)[0].text)
+        log.info("Extract schema object of %s: %s", url, payload(schema))
+        info = self._read_info(tools, root)
+        cover = tools["cover"](root)[0]
+
+        publisher = None
+        if "出版社:" in info:
+            publisher = str(_get_string(_get_next_siblings(info["出版社:"])[1]))
+
+        original_title = None
+        if "原作名:" in info:
+            original_title = _to_str(_get_next_siblings(info["原作名:"])[0]).strip()
+
+        translator_list = None
+        if " 译者" in info:
+            translator_list = [
+                {"name": str(_get_string(translator)), "icon_emoji": PERSON_EMOJI}
+                for translator in info[" 译者"].itersiblings("a")
+            ]
+
+        published = None
+        if "出版年:" in info:
+            published = _format_published(
+                _to_str(_get_next_siblings(info["出版年:"])[0])
+            )
+
+        pages = None
+        if "页数:" in info:
+            pages = int(_get_next_siblings(info["页数:"])[0])
+
+        douban_ranking = None
+        douban_ranking_tag = tools["ranking"](root)
+        if douban_ranking_tag:
+            douban_ranking = float(_get_string(douban_ranking_tag[0]))
+
+        return {
+            "title": schema["name"].strip(),
+            "description": self._get_lxml_description(tools, root),
+            "author": _format_authors(schema["author"]),
+            "cover_url": cover,
+            "icon_url": cover,
+            "publisher": publisher,
+            "original_title": original_title,
+            "translator": translator_list,
+            "published": published,
+            "pages": pages,
+            "douban_ranking": douban_ranking,
+        }
+
+    @metrics.timed(FETCH_SECONDS, "douban")
+    def fetch(self, isbn):
+        """
+        Download the Douban page of the book. Returns (douban_url, html) or
+        None when Douban doesn't know the ISBN. The html is the raw bytes.
+        """
+        return self._get_douban_page(isbn)
+
+    def parse(self, isbn, douban_url, html_doc) -> dict:
+        if self.parser == "lxml":
+            data = self._parse_lxml(douban_url, html_doc)
+        else:
+            data = self._parse_bs4(douban_url, html_doc)
+        data.update(
+            {
                 "douban_url": douban_url,
                 "isbn": isbn,
                 "type": "Book",
             }
-            log.info(f"Extract data from {douban_url}:\n{json.dumps(data, indent=4)}")
+        )
+        log.info("Extract data from %s: %s", douban_url, payload(data))
+        return data
+
+    def extract(self, isbn) -> dict:
+        page = self.fetch(isbn)
+        data = None
+        if page:
+            data = self.parse(isbn, *page)
         return data
@@ -0,0 +1,103 @@
+import importlib
+import threading
+from urllib.parse import urlsplit
+
+from telemetry.logs import get_logger
+
+log = get_logger(__name__)
+
+# Route of extractors that take an ISBN instead of a URL.
+ISBN = "isbn"
+
+URL_SCHEMES = ("http", "https")
+
+
+class ExtractorRegistry:
+    """
+    Route a URL or an ISBN to the extractor that handles it.
+
+    Extractor classes register once under the hosts they serve (or under
+    ISBN), by class or by "module:Class" path, which defers importing the
+    module until a lookup reaches it. A lookup is a dict hit on the host
+    followed by the `match` of the few extractors registered there, so
+    routing doesn't slow down as sources are added. Extractors are
+    stateless, each one is instantiated once on first use and shared
+    afterwards.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def register(self, entry, hosts=(), isbn=False):
+        """
+        Register an extractor class, or its "module:Class" path, under
+        `hosts` and, with `isbn=True`, under the ISBN route.
+        """
+        keys = [host.lower() for host in hosts]
+        if isbn:
+            keys.append(ISBN)
+        for key in keys:
+            self._routes.setdefault(key, []).append(entry)
+        log.info("Register %s for %s.", entry, keys)
+
+    def _get_instance(self, entry):
+        extractor = self._instances.get(entry)
+        if extractor is None:
+            with self._lock:
+                extractor = self._instances.get(entry)
+                if extractor is None:
+                    extractor_class = entry
+                    if isinstance(entry, str):
+                        module_name, class_name = entry.split(":")
+                        module = importlib.import_module(module_name)
+                        extractor_class = getattr(module, class_name)
+                    extractor = extractor_class()
+                    self._instances[entry] = extractor
+        return extractor
+
+    def load(self):
+        """
+        Import and build every registered extractor, e.g. to warm up a worker.
+        """
+        return [
+            self._get_instance(entry)
+            for entries in self._routes.values()
+            for entry in entries
+        ]
+
+    def _find(self, key, target):
+        for entry in self._routes.get(key, ()):
+            extractor = self._get_instance(entry)
+            if extractor.match(target):
+                return extractor
+        log.info("Cannot find a extractor for %s.", target)
+        return None
+
+    def find_by_url(self, url):
+        url = url.strip()
+        # Accept links pasted without a scheme, e.g. "ny.zdline.cn/mobile/...".
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        if parts.scheme not in URL_SCHEMES or not parts.hostname:
+            log.info("Cannot find a extractor for %s.", url)
+            return None
+        return self._find(parts.hostname, url)
+
+    def find_by_isbn(self, isbn):
+        return self._find(ISBN, isbn.strip())
+
+    def clear(self):
+        """
+        Drop the shared instances, e.g. after the cache configuration changed.
+        """
+        with self._lock:
+            self._instances.clear()
+
+
+registry = ExtractorRegistry()
+
+# The built-in extractors are imported on first use, so serving a podcast URL
+# never loads BeautifulSoup or lxml.
+registry.register("extractor.zhongdu:ZhongduExtractor", hosts=("ny.zdline.cn",))
+registry.register("extractor.douban:DoubanBookExtractor", isbn=True)
@@ -1,34 +1,45 @@
-from extractor.base import Extractor
+from extractor.base import Extractor, FETCH_SECONDS
+from extractor.cache import HTTPCache, get_default_cache
+from telemetry import metrics
+from telemetry.logs import get_logger, payload
 import re
 import requests
-import logging
 
-log = logging.getLogger(__name__)
+log = get_logger(__name__)
+
+AUDIO_PATTERN = re.compile(r"ny.zdline.cn/mobile/audio")
+ART_ID_PATTERN = re.compile(r"artId=(\d+)")
+META_INFO_ENDPOINT = "http://ny.zdline.cn/h5/article/newDetailToH5.do?ticket=null&artId={}&code="
 
 
 class ZhongduExtractor(Extractor):
+    def __init__(self, cache: HTTPCache = None) -> None:
+        self.cache = cache if cache is not None else get_default_cache()
+
     def match(self, url):
-        pattern = re.compile(r"ny.zdline.cn/mobile/audio")
-        match_result = bool(pattern.search(url))
+        match_result = bool(AUDIO_PATTERN.search(url))
 
         if match_result:
-            log.info(f"Zhongdu Extractor can process {url}.")
+            log.info("Zhongdu Extractor can process %s.", url)
         else:
-            log.info(f"Zhongdu Extractor cannot process {url}.")
+            log.info("Zhongdu Extractor cannot process %s.", url)
 
         return match_result
 
     def _get_artId(self, url):
-        pattern = re.compile(r"artId=(\d+)")
-        artId = pattern.findall(url)[0]
-        log.info(f"Get artId: {artId}")
+        artId = ART_ID_PATTERN.findall(url)[0]
+        log.info("Get artId: %s", artId)
 
         return artId
 
+    @metrics.timed(FETCH_SECONDS, "zhongdu")
     def _get_meta_info(self, artId):
-        endpoint = f"http://ny.zdline.cn/h5/article/newDetailToH5.do?ticket=null&artId={artId}&code="
-        meta_info = requests.get(endpoint).json()
-        log.info(f"Get meta info from: {endpoint}")
+        endpoint = META_INFO_ENDPOINT.format(artId)
+        if self.cache is not None:
+            meta_info = self.cache.get(endpoint).json()
+        else:
+            meta_info = requests.get(endpoint).json()
+        log.info("Get meta info from: %s", endpoint)
 
         return meta_info
 
@@ -43,24 +54,24 @@ class ZhongduExtractor(Extractor):
                 "description": raw_author["desc"],
             }
             authors.append(author)
-        log.info(f"Get author list: {authors}")
+        log.info("Get author list: %s", authors)
 
         return authors
 
     def _get_published(self, meta_info):
         published = meta_info["model"]["dayStr"]
-        log.info(f"Get dayStr from Zhongdu: {published}")
+        log.info("Get dayStr from Zhongdu: %s", published)
 
         if len(published) <= 5:
             published = "2023-" + published
-        log.info(f"Get published date: {published}")
+        log.info("Get published date: %s", published)
 
         return published
 
     def _get_duration(self, meta_info):
         audio_time = meta_info["model"]["audioInfo"][0]["audioTime"]
         audio_time = audio_time.split(":")[0]
-        log.info(f"Get duration: {audio_time}")
+        log.info("Get duration: %s", audio_time)
         #TODO: Handle float time.
         return int(float(audio_time))
 
@@ -77,7 +88,7 @@ class ZhongduExtractor(Extractor):
             "language": "Chinese",
             "series": meta_info["model"]["zhuanlan"]["name"],
         }
-        log.info(f"Extract data from Zhongdu: {data}")
+        log.info("Extract data from Zhongdu: %s", payload(data))
 
         return data
 
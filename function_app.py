@@ -1,40 +1,189 @@
 import azure.functions as func
-import logging
+from functools import lru_cache, wraps
+import asyncio
+import json
 import os
+from urllib.parse import urljoin
 
-from logic.commands import AddByURLCommand, AddByISBNCommand
-from notion.notion import NotionManager
+from extractor.cache import get_default_cache
+from extractor.registry import registry
+from logic.jobs import JobStore, JobRunner, TableJobStore
+from telemetry import metrics
+from telemetry.logs import get_logger, payload
+from telemetry.tracing import tracer
+from logic.commands import (
+    AsyncAddByURLCommand,
+    AsyncAddByISBNCommand,
+    AddByISBNListCommand,
+)
+from notion.notion import NOTION_API_BASE, NotionManager
+from notion.scheduler import RequestScheduler
+from notion.mirror import NotionMirror
 from notion.database import (
+    QueryCache,
     PersonDatabase,
     SourceDatabase,
     PodcastDatabase,
     BookDatabase,
 )
 
-log = logging.getLogger(__name__)
+log = get_logger(__name__)
 app = func.FunctionApp()
 
-notion = NotionManager(os.getenv("NOTION_TOKEN"))
-person_database = PersonDatabase(notion, os.getenv("PERSON_DATABASE_ID"))
-source_database = SourceDatabase(notion, os.getenv("SOURCE_DATABASE_ID"))
-podcast_database = PodcastDatabase(notion, os.getenv("PODCAST_DATABASE_ID"))
-book_database = BookDatabase(notion, os.getenv("BOOK_DATABASE_ID"))
+notion = NotionManager(
+    os.getenv("NOTION_TOKEN"),
+    base_url=os.getenv("NOTION_API_BASE_URL", NOTION_API_BASE),
+    pool_size=int(os.getenv("NOTION_POOL_SIZE", "10")),
+    timeout=float(os.getenv("NOTION_TIMEOUT", "30")),
+    scheduler=RequestScheduler(rate=float(os.getenv("NOTION_RATE_LIMIT", "3"))),
+)
+# Shared by every database so lookups stay warm across invocations.
+# Set NOTION_QUERY_CACHE_SIZE=0 to disable it. "Not found" results are only
+# cached for NOTION_QUERY_CACHE_NEGATIVE_TTL seconds (default: not at all),
+# so pages created elsewhere show up at once.
+query_cache = None
+if int(os.getenv("NOTION_QUERY_CACHE_SIZE", "1024")) > 0:
+    query_cache = QueryCache(
+        maxsize=int(os.getenv("NOTION_QUERY_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("NOTION_QUERY_CACHE_TTL", "300")),
+        negative_ttl=float(os.getenv("NOTION_QUERY_CACHE_NEGATIVE_TTL", "0")),
+    )
+
+person_database = PersonDatabase(
+    notion, os.getenv("PERSON_DATABASE_ID"), cache=query_cache
+)
+source_database = SourceDatabase(
+    notion, os.getenv("SOURCE_DATABASE_ID"), cache=query_cache
+)
+podcast_database = PodcastDatabase(
+    notion, os.getenv("PODCAST_DATABASE_ID"), cache=query_cache
+)
+book_database = BookDatabase(notion, os.getenv("BOOK_DATABASE_ID"), cache=query_cache)
+
+# Optional on-disk title -> page id index of the Person and Source databases.
+# Every instance keeps its own copy, point NOTION_MIRROR_PATH at local disk
+# (e.g. under /tmp): SQLite can't lock files on the /home share reliably.
+# Each instance syncs its copy in a background thread, starting now and then
+# whenever a lookup finds it older than NOTION_MIRROR_MAX_AGE seconds.
+mirror = None
+if os.getenv("NOTION_MIRROR_PATH"):
+    mirror = NotionMirror(
+        os.getenv("NOTION_MIRROR_PATH"),
+        [person_database, source_database],
+        max_age=int(os.getenv("NOTION_MIRROR_MAX_AGE", "600")),
+        rescan_interval=int(os.getenv("NOTION_MIRROR_RESCAN_INTERVAL", "21600")),
+    )
+    mirror.refresh()
 
 
+# Commands and the extractors behind them are stateless, build them once per
+# worker and reuse them for every invocation.
+@lru_cache(maxsize=None)
 def get_add_by_url_command():
-    add_by_url_command = AddByURLCommand(
-        source_database, person_database, podcast_database
+    add_by_url_command = AsyncAddByURLCommand(
+        source_database, person_database, podcast_database, mirror
     )
     return add_by_url_command
 
 
+@lru_cache(maxsize=None)
 def get_add_by_isbn_command():
-    add_by_isbn_command = AddByISBNCommand(
-        source_database, person_database, book_database
+    add_by_isbn_command = AsyncAddByISBNCommand(
+        source_database, person_database, book_database, mirror
     )
     return add_by_isbn_command
 
 
+@lru_cache(maxsize=None)
+def get_add_by_isbn_list_command():
+    add_by_isbn_list_command = AddByISBNListCommand(
+        source_database, person_database, book_database, mirror
+    )
+    return add_by_isbn_list_command
+
+
+# Opt-in async mode: with async=true the add endpoints only validate the
+# input, queue a job and answer 202. The RunJob queue trigger runs it and
+# /jobs/{job_id} reports its status. The status lives in a table of the
+# AzureWebJobsStorage account holding the queue, so every instance sees it.
+# JOB_STORE_PATH swaps it for a SQLite file, only for a single instance.
+JOB_QUEUE_NAME = os.getenv("JOB_QUEUE_NAME", "ingest-jobs")
+JOB_QUEUE_CONNECTION = "AzureWebJobsStorage"
+ASYNC_UNAVAILABLE = "async=true needs AzureWebJobsStorage or JOB_STORE_PATH."
+
+
+@lru_cache(maxsize=None)
+def get_job_runner():
+    if os.getenv("JOB_STORE_PATH"):
+        job_store = JobStore(os.getenv("JOB_STORE_PATH"))
+    elif os.getenv(JOB_QUEUE_CONNECTION):
+        job_store = TableJobStore.from_connection_string(
+            os.getenv(JOB_QUEUE_CONNECTION), os.getenv("JOB_TABLE_NAME", "jobs")
+        )
+    else:
+        return None
+    return JobRunner(
+        job_store, {"isbn": get_add_by_isbn_command, "url": get_add_by_url_command}
+    )
+
+
+async def load_job_runner():
+    # Building the store opens SQLite or creates the table, off the event loop.
+    return await asyncio.to_thread(get_job_runner)
+
+
+def is_async_request(req: func.HttpRequest):
+    return str(get_parameter(req, "async")).lower() in ("1", "true", "yes")
+
+
+def get_job_response(job, status_url, status_code=200):
+    return func.HttpResponse(
+        json.dumps(dict(job, status_url=status_url), ensure_ascii=False),
+        status_code=status_code,
+        mimetype="application/json",
+        headers={"Location": status_url} if status_code == 202 else None,
+    )
+
+
+def traced_function(name):
+    """
+    Run the function in a trace. HTTP responses get a Server-Timing header
+    summarizing the spans, so a slow call shows where its time went.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        async def wrapper(*args, **kwargs):
+            with tracer.trace(name) as trace:
+                response = await function(*args, **kwargs)
+            if trace is not None and isinstance(response, func.HttpResponse):
+                response.headers["Server-Timing"] = trace.server_timing()
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def get_list_parameter(req: func.HttpRequest, name):
+    """
+    Read a list from the JSON body, or from a comma separated query parameter.
+    """
+    value = req.params.get(name)
+    if value:
+        value = [item for item in value.split(",") if item.strip()]
+    else:
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            pass
+        else:
+            value = req_body.get(name)
+    log.info("Get parameter from request: %s=%s", name, payload(value))
+
+    return value if isinstance(value, list) else None
+
+
 def get_parameter(req: func.HttpRequest, name):
     value = req.params.get(name)
     if not value:
@@ -44,14 +193,18 @@ def get_parameter(req: func.HttpRequest, name):
             pass
         else:
             value = req_body.get(name)
-    log.info(f"Get parameter from request: {name}={value}")
+    log.info("Get parameter from request: %s=%s", name, payload(value))
 
     return value
 
 
 @app.function_name(name="AddByURL")
 @app.route(route="addURL", auth_level=func.AuthLevel.ANONYMOUS)
-def add_source(req: func.HttpRequest) -> func.HttpResponse:
+@app.queue_output(
+    arg_name="jobs", queue_name=JOB_QUEUE_NAME, connection=JOB_QUEUE_CONNECTION
+)
+@traced_function("AddByURL")
+async def add_source(req: func.HttpRequest, jobs: func.Out[str]) -> func.HttpResponse:
     log.info("AddByURL function processed a request.")
 
     add_by_url_command = get_add_by_url_command()
@@ -61,8 +214,17 @@ def add_source(req: func.HttpRequest) -> func.HttpResponse:
         "Cannot find parameter 'url' in request body.", status_code=400
     )
 
+    if url and is_async_request(req):
+        job_runner = await load_job_runner()
+        if job_runner is None:
+            return func.HttpResponse(ASYNC_UNAVAILABLE, status_code=400)
+        if registry.find_by_url(url) is None:
+            return func.HttpResponse("Cannot find a extractor processing this url.", status_code=400)
+        job = await job_runner.enqueue(jobs, "url", url)
+        return get_job_response(job, urljoin(req.url, f"jobs/{job['job_id']}"), 202)
+
     if url:
-        page = add_by_url_command.execute(url)
+        page = await add_by_url_command.execute(url)
         if page:
             response = func.HttpResponse("Source Added", status_code=200)
         else:
@@ -73,7 +235,11 @@ def add_source(req: func.HttpRequest) -> func.HttpResponse:
 
 @app.function_name(name="AddByISBN")
 @app.route(route="addBook", auth_level=func.AuthLevel.ANONYMOUS)
-def add_source(req: func.HttpRequest) -> func.HttpResponse:
+@app.queue_output(
+    arg_name="jobs", queue_name=JOB_QUEUE_NAME, connection=JOB_QUEUE_CONNECTION
+)
+@traced_function("AddByISBN")
+async def add_source(req: func.HttpRequest, jobs: func.Out[str]) -> func.HttpResponse:
     log.info("AddByISBN function processed a request.")
 
     add_by_isbn_command = get_add_by_isbn_command()
@@ -83,11 +249,165 @@ def add_source(req: func.HttpRequest) -> func.HttpResponse:
         "Cannot find parameter 'isbn' in request body.", status_code=400
     )
 
+    if url and is_async_request(req):
+        job_runner = await load_job_runner()
+        if job_runner is None:
+            return func.HttpResponse(ASYNC_UNAVAILABLE, status_code=400)
+        if registry.find_by_isbn(str(url)) is None:
+            return func.HttpResponse("Cannot find a extractor processing this isbn.", status_code=400)
+        job = await job_runner.enqueue(jobs, "isbn", str(url))
+        return get_job_response(job, urljoin(req.url, f"jobs/{job['job_id']}"), 202)
+
     if url:
-        page = add_by_isbn_command.execute(url)
+        page = await add_by_isbn_command.execute(url)
         if page:
             response = func.HttpResponse("Book Added", status_code=200)
         else:
             response = func.HttpResponse("Cannot find a extractor processing this isbn.", status_code=400)
 
     return response
+
+
+# The whole batch runs inside one invocation, keep it well under the function
+# timeout.
+ADD_BOOKS_MAX_BATCH = int(os.getenv("ADD_BOOKS_MAX_BATCH", "50"))
+
+
+@app.function_name(name="AddByISBNList")
+@app.route(route="addBooks", auth_level=func.AuthLevel.ANONYMOUS)
+@traced_function("AddByISBNList")
+async def add_books(req: func.HttpRequest) -> func.HttpResponse:
+    log.info("AddByISBNList function processed a request.")
+
+    isbn_list = get_list_parameter(req, "isbns")
+    if not isbn_list:
+        return func.HttpResponse(
+            "Cannot find parameter 'isbns' in request body.", status_code=400
+        )
+    if len(isbn_list) > ADD_BOOKS_MAX_BATCH:
+        return func.HttpResponse(
+            f"Send at most {ADD_BOOKS_MAX_BATCH} ISBNs per request.", status_code=400
+        )
+
+    results = await get_add_by_isbn_list_command().execute(isbn_list)
+
+    return func.HttpResponse(
+        json.dumps({"results": results}, ensure_ascii=False),
+        status_code=200,
+        mimetype="application/json",
+    )
+
+
+@app.function_name(name="RunJob")
+@app.queue_trigger(
+    arg_name="msg", queue_name=JOB_QUEUE_NAME, connection=JOB_QUEUE_CONNECTION
+)
+@traced_function("RunJob")
+async def run_job(msg: func.QueueMessage) -> None:
+    # The trigger reads AzureWebJobsStorage, so the job store always exists.
+    job_runner = await load_job_runner()
+    job = await job_runner.run(msg.get_body().decode("utf-8"))
+    log.info("RunJob function finished job: %s", payload(job))
+
+
+@app.function_name(name="GetJob")
+@app.route(route="jobs/{job_id}", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+def get_job(req: func.HttpRequest) -> func.HttpResponse:
+    # A sync handler runs in the worker's thread pool, it may block on the store.
+    job_runner = get_job_runner()
+    if job_runner is None:
+        return func.HttpResponse(ASYNC_UNAVAILABLE, status_code=400)
+
+    job = job_runner.store.get(req.route_params.get("job_id"))
+    if job is None:
+        return func.HttpResponse("Cannot find this job.", status_code=404)
+
+    return get_job_response(job, urljoin(req.url, job["job_id"]))
+
+
+# The caches count their own hits and misses, they are read at scrape time.
+def get_cache_stats(key):
+    caches = {"notion_query": query_cache, "extractor_http": get_default_cache()}
+    return {
+        (name,): cache.stats()[key]
+        for name, cache in caches.items()
+        if cache is not None
+    }
+
+
+metrics.callback(
+    "cache_hits_total",
+    "Cache hits by cache.",
+    lambda: get_cache_stats("hits"),
+    labelnames=("cache",),
+)
+metrics.callback(
+    "cache_misses_total",
+    "Cache misses by cache.",
+    lambda: get_cache_stats("misses"),
+    labelnames=("cache",),
+)
+# Time spent waiting for the rate limit, which the request histogram leaves
+# out.
+metrics.callback(
+    "notion_scheduler_queue_depth",
+    "Notion calls waiting for a rate limit token.",
+    lambda: notion.scheduler.stats()["queue_depth"],
+    kind="gauge",
+)
+metrics.callback(
+    "notion_scheduler_wait_seconds_total",
+    "Time Notion calls spent waiting for a rate limit token.",
+    lambda: notion.scheduler.stats()["total_wait_time"],
+)
+metrics.callback(
+    "notion_scheduler_rate",
+    "Current Notion request rate allowed by the scheduler, per second.",
+    lambda: notion.scheduler.stats()["rate"],
+    kind="gauge",
+)
+
+
+# Behind a function key: the metrics reveal traffic and database activity.
+@app.function_name(name="Metrics")
+@app.route(route="metrics", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+def get_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    return func.HttpResponse(
+        metrics.registry.render(), status_code=200, mimetype=metrics.CONTENT_TYPE
+    )
+
+
+async def warm_up():
+    """
+    Build the command graph and the job store, load every extractor, prime
+    the mirror and the extractor cache, and open the aiohttp connection to
+    Notion the handlers use, on the worker loop, before the first real
+    request hits the worker.
+    """
+    get_add_by_url_command()
+    get_add_by_isbn_command()
+    get_add_by_isbn_list_command()
+    registry.load()
+    await load_job_runner()
+    if mirror is not None:
+        mirror.refresh()
+    extractor_cache = get_default_cache()
+    if extractor_cache is not None:
+        await asyncio.to_thread(extractor_cache.prune)
+    try:
+        await notion.aio.connect()
+    except Exception:
+        log.exception("Cannot open a connection to Notion while warming up.")
+    log.info("Worker warmed up.")
+
+
+async def warm_up_trigger(warmup) -> None:
+    await warm_up()
+
+
+# The warmup trigger only fires on plans that pre-warm instances (Premium /
+# Dedicated), set WARMUP_ENABLED=true there.
+if os.getenv("WARMUP_ENABLED", "false").lower() == "true":
+    app.function_name(name="WarmUp")(
+        app.warm_up_trigger(arg_name="warmup")(warm_up_trigger)
+    )
@@ -0,0 +1,268 @@
+"""
+Fire concurrent addBook/addURL traffic at the function app and report the
+throughput and the tail latency.
+
+By default the handlers of function_app.py run in this process, on one
+event loop like in the Functions worker, against a fake Notion API
+(loadtest/fake_notion_server.py) started on a free port. Douban and Zhongdu
+are answered from the benchmark corpus, so the run is offline and only
+measures our code and the Notion round trips. Run it from the repository
+root:
+
+    python loadtest/driver.py --requests 200 --concurrency 16 \
+        --latency-ms 150 --rate 3 --notion-rate 3
+    python loadtest/driver.py --target http://localhost:7071/api \
+        --notion-url http://localhost:8765
+
+With --target the traffic goes to a running Functions host over HTTP
+instead; start it with NOTION_API_BASE_URL pointing at a fake server.
+The options of the fake server (--latency-ms, --rate, --throttle-ratio,
+--error-ratio, ...) apply to the one the driver starts itself.
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_notion_server import add_arguments, create_server
+
+CORPUS = os.path.join(ROOT, "benchmarks", "corpus")
+PERCENTILES = (50, 90, 95, 99)
+
+
+def load_corpus():
+    with open(os.path.join(CORPUS, "manifest.json"), encoding="utf-8") as file:
+        manifest = json.load(file)
+
+    books = {}
+    for entry in manifest["douban"]:
+        with open(os.path.join(CORPUS, entry["file"]), "rb") as file:
+            books[entry["isbn"]] = (entry["url"], file.read())
+    podcasts = {}
+    for entry in manifest["zhongdu"]:
+        with open(os.path.join(CORPUS, entry["file"]), "rb") as file:
+            podcasts[entry["url"]] = json.loads(file.read())
+    return books, podcasts
+
+
+def get_workload(books, podcasts, requests, book_ratio):
+    """
+    `requests` calls spread evenly between addBook and addURL, cycling
+    through the corpus so later calls find existing pages, like re-adds do.
+    """
+    isbns = list(books)
+    urls = list(podcasts)
+    workload = []
+    book_count = 0
+    for i in range(requests):
+        if book_count < round((i + 1) * book_ratio):
+            workload.append(("addBook", {"isbn": isbns[book_count % len(isbns)]}))
+            book_count += 1
+        else:
+            url = urls[(i - book_count) % len(urls)]
+            workload.append(("addURL", {"url": url}))
+    return workload
+
+
+def serve_upstream_from_corpus(books, podcasts, latency):
+    """
+    Answer the Douban and Zhongdu downloads from the corpus, after `latency`
+    seconds, below the timed and traced extractor methods.
+    """
+    from extractor.douban import DoubanBookExtractor
+    from extractor.zhongdu import ZhongduExtractor
+
+    art_ids = {
+        ZhongduExtractor()._get_artId(url): info for url, info in podcasts.items()
+    }
+
+    def get_douban_page(self, isbn):
+        time.sleep(latency)
+        return books.get(isbn)
+
+    def get_meta_info(self, artId):
+        time.sleep(latency)
+        return art_ids[artId]
+
+    DoubanBookExtractor._get_douban_page = get_douban_page
+    ZhongduExtractor._get_meta_info = get_meta_info
+
+
+def get_in_process_call(args, notion_url):
+    """
+    Import the function app configured for the fake Notion. Returns an
+    async `call(route, params) -> status` and an async `close()`.
+    """
+    os.environ["NOTION_API_BASE_URL"] = notion_url
+    os.environ.setdefault("NOTION_TOKEN", "secret_loadtest")
+    for name in ("PERSON", "SOURCE", "PODCAST", "BOOK"):
+        os.environ.setdefault(f"{name}_DATABASE_ID", f"{name.lower()}-database")
+    if args.notion_rate is not None:
+        os.environ["NOTION_RATE_LIMIT"] = str(args.notion_rate)
+    for name in ("NOTION_MIRROR_PATH", "EXTRACTOR_CACHE_DIR", "WARMUP_ENABLED"):
+        os.environ.pop(name, None)
+
+    import azure.functions as func
+    import function_app
+
+    class QueueOutput(func.Out):
+        def set(self, value):
+            self.value = value
+
+        def get(self):
+            return getattr(self, "value", None)
+
+    functions = {
+        function.get_function_name(): function.get_user_function()
+        for function in function_app.app.get_functions()
+    }
+    handlers = {"addBook": functions["AddByISBN"], "addURL": functions["AddByURL"]}
+
+    async def call(route, params):
+        request = func.HttpRequest(
+            "GET", f"http://localhost/api/{route}", params=params, body=b""
+        )
+        response = await handlers[route](request, QueueOutput())
+        return response.status_code
+
+    return call, function_app.notion.aio.close
+
+
+def get_http_call(target):
+    import aiohttp
+
+    session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300))
+
+    async def call(route, params):
+        async with session.get(f"{target}/{route}", params=params) as response:
+            await response.read()
+            return response.status
+
+    return call, session.close
+
+
+async def drive(call, workload, concurrency):
+    """
+    Run the workload with `concurrency` callers. Returns the latencies by
+    route, the status counts and the wall time.
+    """
+    queue = asyncio.Queue()
+    for item in workload:
+        queue.put_nowait(item)
+    latencies = {}
+    statuses = Counter()
+
+    async def caller():
+        while not queue.empty():
+            route, params = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                status = await call(route, params)
+            except Exception as error:
+                status = type(error).__name__
+            latencies.setdefault(route, []).append(time.perf_counter() - start)
+            statuses[f"{route} {status}"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    summary = {"count": len(latencies), "mean_ms": statistics.mean(latencies) * 1000}
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        for percentile in PERCENTILES:
+            summary[f"p{percentile}_ms"] = cuts[percentile - 1] * 1000
+    summary["max_ms"] = latencies[-1] * 1000
+    return {name: round(value, 2) for name, value in summary.items()}
+
+
+def get_notion_stats(args, server):
+    if server is not None:
+        return server.get_stats()
+    if args.notion_url:
+        import requests
+
+        return requests.get(f"{args.notion_url.rstrip('/')}/_stats").json()
+    return None
+
+
+async def main_async(args):
+    books, podcasts = load_corpus()
+    workload = get_workload(books, podcasts, args.requests, args.book_ratio)
+
+    server = None
+    if args.target:
+        call, close = get_http_call(args.target.rstrip("/"))
+    else:
+        notion_url = args.notion_url
+        if notion_url is None:
+            server = create_server(args)
+            server.start()
+            notion_url = server.base_url
+        else:
+            notion_url = f"{notion_url.rstrip('/')}/v1"
+        serve_upstream_from_corpus(books, podcasts, args.upstream_latency_ms / 1000)
+        call, close = get_in_process_call(args, notion_url)
+
+    try:
+        latencies, statuses, elapsed = await drive(call, workload, args.concurrency)
+    finally:
+        await close()
+
+    report = {
+        "requests": len(workload),
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput_per_s": round(len(workload) / elapsed, 2),
+        "latency": summarize(
+            [value for values in latencies.values() for value in values]
+        ),
+        "routes": {route: summarize(values) for route, values in latencies.items()},
+        "statuses": dict(sorted(statuses.items())),
+        "notion": get_notion_stats(args, server),
+    }
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--book-ratio", type=float, default=0.5, help="Share of addBook calls."
+    )
+    parser.add_argument("--target", help="Base URL of a running Functions host.")
+    parser.add_argument("--notion-url", help="A fake Notion server already running.")
+    parser.add_argument(
+        "--notion-rate", type=float, help="NOTION_RATE_LIMIT of the function app."
+    )
+    parser.add_argument("--upstream-latency-ms", type=float, default=0.0)
+    parser.add_argument("--output", help="Write the report to this JSON file.")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    print(json.dumps(report, ensure_ascii=False, indent=4))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
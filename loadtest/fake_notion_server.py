@@ -0,0 +1,273 @@
+"""
+A local stand-in for the Notion API, to load-test the function app offline.
+
+It serves the endpoints NotionManager calls (POST /v1/pages,
+PATCH /v1/pages/{id} and POST /v1/databases/{id}/query) from the in-memory
+databases of tests/fake_notion.py, which honor the title/rich_text
+`equals` filters and the `or`/`and` compounds the databases send. Every
+database id exists and starts empty.
+
+On top of that it injects what the real API does under load: latency,
+429 responses with a Retry-After header, both above a request rate like
+Notion's and at random, and random 5xx errors. Run it from the repository
+root and point the function app at it:
+
+    python loadtest/fake_notion_server.py --port 8765 --latency-ms 150 \
+        --rate 3 --error-ratio 0.01
+    NOTION_API_BASE_URL=http://localhost:8765/v1 func start
+
+GET /_stats returns the counts of requests, 429s and errors, and the number
+of pages per database.
+"""
+
+import argparse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tests.fake_notion import FakeNotion
+
+API_PREFIX = "/v1"
+ERROR_STATUSES = (500, 502, 503)
+
+
+def get_error(status, code, message):
+    return {"object": "error", "status": status, "code": code, "message": message}
+
+
+class RateLimiter:
+    """
+    Token bucket of `rate` requests per second. `acquire` returns None when
+    the request is allowed, else the seconds until a token is available.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            return (1 - self._tokens) / self.rate
+
+
+class FakeNotionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        notion: FakeNotion = None,
+        latency=0.0,
+        jitter=0.0,
+        rate=None,
+        burst=None,
+        throttle_ratio=0.0,
+        retry_after=1.0,
+        error_ratio=0.0,
+        seed=None,
+    ):
+        super().__init__(address, FakeNotionHandler)
+        self.notion = notion if notion is not None else FakeNotion()
+        self.latency = latency
+        self.jitter = jitter
+        self.limiter = RateLimiter(rate, burst) if rate else None
+        self.throttle_ratio = throttle_ratio
+        self.retry_after = retry_after
+        self.error_ratio = error_ratio
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def _random_number(self):
+        with self._lock:
+            return self._random.random()
+
+    def get_delay(self):
+        if not self.jitter:
+            return self.latency
+        with self._lock:
+            return max(0.0, self._random.gauss(self.latency, self.jitter))
+
+    def answer(self, method, path, body):
+        """
+        Returns (status, response object, headers) for one API call.
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+
+        # Notion answers whole seconds, the random 429s send --retry-after as is.
+        retry_after = None
+        if self.limiter is not None:
+            wait = self.limiter.acquire()
+            retry_after = math.ceil(wait) if wait is not None else None
+        if retry_after is None and self._random_number() < self.throttle_ratio:
+            retry_after = self.retry_after
+        if retry_after is not None:
+            with self._lock:
+                self.stats["throttled"] += 1
+            return (
+                429,
+                get_error(429, "rate_limited", "You have been rate limited."),
+                {"Retry-After": f"{retry_after:g}"},
+            )
+
+        # The error is returned before the call is applied, so a retry is safe.
+        if self._random_number() < self.error_ratio:
+            with self._lock:
+                self.stats["errors"] += 1
+                status = self._random.choice(ERROR_STATUSES)
+            return status, get_error(status, "internal_server_error", path), {}
+
+        status, obj = self.notion.handle(method, path, body)
+        with self._lock:
+            self.stats[f"{method} {status}"] += 1
+        return status, obj, {}
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        with self.notion._lock:
+            stats["pages"] = {
+                database_id: len(pages)
+                for database_id, pages in self.notion.databases.items()
+            }
+        return stats
+
+    def start(self):
+        """
+        Serve from a daemon thread, for drivers running in the same process.
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeNotionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeNotionServer
+
+    def _send(self, status, obj, headers=None):
+        content = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _handle(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+
+        if not self.path.startswith(API_PREFIX + "/"):
+            return self._send(404, get_error(404, "invalid_request_url", self.path))
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._send(401, get_error(401, "unauthorized", "API token."))
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            return self._send(400, get_error(400, "invalid_json", self.path))
+
+        delay = self.server.get_delay()
+        if delay:
+            time.sleep(delay)
+
+        status, obj, headers = self.server.answer(
+            method, self.path[len(API_PREFIX) :], body
+        )
+        self._send(status, obj, headers)
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            return self._send(200, self.server.get_stats())
+        self._send(404, get_error(404, "invalid_request_url", self.path))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_arguments(parser):
+    """
+    The server options, shared with the load driver.
+    """
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--rate", type=float, help="Requests per second before 429s, unlimited."
+    )
+    parser.add_argument("--burst", type=float)
+    parser.add_argument(
+        "--throttle-ratio", type=float, default=0.0, help="Share of random 429s."
+    )
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument(
+        "--error-ratio", type=float, default=0.0, help="Share of random 5xx."
+    )
+    parser.add_argument("--seed", type=int)
+
+
+def create_server(args, host="127.0.0.1", port=0):
+    return FakeNotionServer(
+        (host, port),
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        rate=args.rate,
+        burst=args.burst,
+        throttle_ratio=args.throttle_ratio,
+        retry_after=args.retry_after,
+        error_ratio=args.error_ratio,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_server(args, args.host, args.port)
+    print(f"Fake Notion API on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-import logging
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
 from notion.database import (
     SourceDatabase,
@@ -8,13 +9,55 @@ from notion.database import (
     BookDatabase,
     PersistenceLayer,
 )
-from extractor.zhongdu import ZhongduExtractor
-from extractor.douban import DoubanBookExtractor
+from notion.calls import count_calls, counted
+from notion.mirror import NotionMirror
+from logic.pipeline import Pipeline, Stage
+from logic.singleflight import SingleFlight, AsyncSingleFlight
+from extractor.registry import registry
+from telemetry import metrics
+from telemetry.logs import get_logger, payload
+from telemetry.tracing import bind_context, trace_methods
+
+log = get_logger(__name__)
+
+# Shared by every command of the process so concurrent requests for the same
+# book, source or person share one query-then-create instead of racing.
+flight = SingleFlight()
+async_flight = AsyncSingleFlight()
+
+CREATED = "created"
+EXISTING = "existing"
+
+PAGES = metrics.counter(
+    "pages_total",
+    "Pages resolved by the commands, by database and whether they were created.",
+    ("database", "outcome"),
+)
+
+
+def get_isbn_key(isbn):
+    return ("isbn", str(isbn).strip().replace("-", ""))
+
+
+def get_url_key(url):
+    return ("url", url.strip())
+
+
+def get_fetch_key(isbn):
+    # The download alone, shared by addBook and the fetch stage of addBooks.
+    return ("fetch", get_isbn_key(isbn))
 
-log = logging.getLogger(__name__)
+
+def count_page(database: PersistenceLayer, outcome, count=1):
+    if count > 0:
+        PAGES.add(count, database.__class__.__name__, outcome)
 
 
 class Command(ABC):
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        trace_methods(cls, ("execute",))
+
     @abstractmethod
     def execute(self, data):
         raise NotImplementedError(
@@ -23,17 +66,31 @@ class Command(ABC):
 
 
 class GetSourceIDCommand(Command):
-    def __init__(self, source_database: SourceDatabase):
+    def __init__(self, source_database: SourceDatabase, mirror: NotionMirror = None):
         self.source_database = source_database
+        self.mirror = mirror
         log.info("Create a GetSourceIDCommand object.")
 
-    def _query_by_title(self, data):
-        log.info(f"Query source database for: {data}")
+    def _query_mirror(self, title):
+        page = None
+        if self.mirror is not None:
+            page_id = self.mirror.get_page_id(self.source_database, title)
+            if page_id:
+                page = {"id": page_id}
+                log.info("Find page in source mirror.")
 
-        title = data["title"]
-        filter = {"filter": {"property": "Title", "rich_text": {"equals": title}}}
-        pages = self.source_database.query_pages(filter)
+        return page
+
+    def _add_to_mirror(self, title, page):
+        if self.mirror is not None and page is not None:
+            self.mirror.add(
+                self.source_database, title, page["id"], page.get("last_edited_time")
+            )
 
+    def _get_filter(self, data):
+        return self.source_database.get_title_filter(data["title"])
+
+    def _get_first_page(self, pages):
         page = None
         if len(pages) > 0:
             page = pages[0]
@@ -43,33 +100,88 @@ class GetSourceIDCommand(Command):
 
         return page
 
+    def _query_by_title(self, data):
+        page = self._query_mirror(data["title"])
+        if page is None:
+            log.info("Query source database for: %s", payload(data))
+
+            pages = self.source_database.query_pages(self._get_filter(data))
+            page = self._get_first_page(pages)
+            self._add_to_mirror(data["title"], page)
+
+        return page
+
     def _create_page(self, data):
         page = self.source_database.create_page(data)
+        self._add_to_mirror(data["title"], page)
         return page
 
-    def execute(self, data):
-        log.info(f"Execute GetSourceID Command for: {data}")
+    def _get_flight_key(self, data):
+        return ("source", self.source_database.database_id, data["title"])
 
+    def _get_or_create_page(self, data):
         page = self._query_by_title(data)
         if page is None:
             page = self._create_page(data)
-        log.info(f"Get source id: {page['id']}")
+            count_page(self.source_database, CREATED)
+        else:
+            count_page(self.source_database, EXISTING)
+        return page
+
+    def execute(self, data):
+        log.info("Execute GetSourceID Command for: %s", payload(data))
+
+        page = flight.do(self._get_flight_key(data), self._get_or_create_page, data)
+        log.info("Get source id: %s", page["id"])
 
         return page["id"]
 
 
 class GetPersonIDCommand(Command):
-    def __init__(self, person_database: PersonDatabase):
+    def __init__(self, person_database: PersonDatabase, mirror: NotionMirror = None):
         self.person_database = person_database
+        self.mirror = mirror
         log.info("Create a GetPersonIDCommand object.")
 
-    def _query_by_name(self, data):
-        log.info(f"Query person database for: {data}")
+    def _query_mirror(self, name):
+        page = None
+        if self.mirror is not None:
+            page_id = self.mirror.get_page_id(self.person_database, name)
+            if page_id:
+                page = {"id": page_id}
+                log.info("Find page in person mirror.")
 
-        name = data["name"]
-        filter = {"filter": {"property": "Name", "rich_text": {"equals": name}}}
-        pages = self.person_database.query_pages(filter)
+        return page
 
+    def _add_to_mirror(self, name, page):
+        if self.mirror is not None and page is not None:
+            self.mirror.add(
+                self.person_database, name, page["id"], page.get("last_edited_time")
+            )
+
+    def _split_mirrored(self, people):
+        """
+        Return the pages found in the mirror and the names left to query.
+        """
+        pages = {}
+        names = []
+        for person in people:
+            page = self._query_mirror(person["name"])
+            if page is None:
+                names.append(person["name"])
+            else:
+                pages[person["name"]] = page
+
+        return pages, names
+
+    def _add_all_to_mirror(self, pages):
+        for name, page in pages.items():
+            self._add_to_mirror(name, page)
+
+    def _get_filter(self, data):
+        return self.person_database.get_title_filter(data["name"])
+
+    def _get_first_page(self, pages):
         page = None
         if len(pages) > 0:
             page = pages[0]
@@ -79,34 +191,176 @@ class GetPersonIDCommand(Command):
 
         return page
 
-    def _create_page(self, data):
+    def _query_by_name(self, data):
+        page = self._query_mirror(data["name"])
+        if page is None:
+            log.info("Query person database for: %s", payload(data))
+
+            pages = self.person_database.query_pages(self._get_filter(data))
+            page = self._get_first_page(pages)
+            self._add_to_mirror(data["name"], page)
+
+        return page
+
+    def query_by_names(self, people):
+        """
+        Find people by name, in the mirror first and then with one batched
+        query. Returns a dict of name -> page for the people that exist.
+        """
+        pages, names = self._split_mirrored(people)
+        if names:
+            log.info("Query person database for: %s", payload(names))
+
+            found = self.person_database.query_by_titles(names)
+            log.info("Find %s of %s people in person database.", len(found), len(names))
+            self._add_all_to_mirror(found)
+            pages.update(found)
+
+        return pages
+
+    def create_page(self, data):
+        """
+        Create the person without looking it up, and add it to the mirror.
+        """
         page = self.person_database.create_page(data)
+        self._add_to_mirror(data["name"], page)
         return page
 
-    def execute(self, data):
-        log.info(f"Execute GetPersonID Command for: {data}")
+    def _get_flight_key(self, data):
+        return ("person", self.person_database.database_id, data["name"])
 
+    def _get_or_create_page(self, data):
         page = self._query_by_name(data)
         if page is None:
-            page = self._create_page(data)
-        log.info(f"Get person id: {page['id']}")
+            page = self.create_page(data)
+            count_page(self.person_database, CREATED)
+        else:
+            count_page(self.person_database, EXISTING)
+        return page
+
+    def get_page(self, data):
+        """
+        Query-then-create the person, sharing the work with any concurrent
+        request for the same name.
+        """
+        return flight.do(self._get_flight_key(data), self._get_or_create_page, data)
+
+    def _get_created_page(self, name):
+        # A request that missed the same name may have created it meanwhile,
+        # its page is then in the mirror or the query cache.
+        page = self._query_mirror(name)
+        if page is None:
+            page = self.person_database.get_cached_page(name)
+        return page
+
+    def _create_missing_page(self, data):
+        page = self._get_created_page(data["name"])
+        if page is None:
+            page = self.create_page(data)
+            count_page(self.person_database, CREATED)
+        else:
+            count_page(self.person_database, EXISTING)
+        return page
+
+    def create_missing(self, data):
+        """
+        Create a person the batched query didn't find, without querying
+        Notion again. Concurrent calls for the same name share one create.
+        """
+        return flight.do(self._get_flight_key(data), self._create_missing_page, data)
+
+    def execute(self, data):
+        log.info("Execute GetPersonID Command for: %s", payload(data))
+
+        page = self.get_page(data)
+        log.info("Get person id: %s", page["id"])
 
         return page["id"]
 
 
 class GetPeopleIDListCommand(Command):
-    def __init__(self, get_person_id_command: GetPersonIDCommand):
+    def __init__(self, get_person_id_command: GetPersonIDCommand, max_workers=4):
         self.get_person_id_command = get_person_id_command
+        self.max_workers = max_workers
+        # Commands live as long as the worker, so the pool is made once and
+        # its threads are only started by the first concurrent lookup.
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="people"
+        )
         log.info("Create a GetPeopleIDListCommand object.")
 
-    def execute(self, author_list):
-        log.info(f"Get author id list for: {author_list}")
-        author_id_list = [
-            self.get_person_id_command.execute(author) for author in author_list
+    def _get_unique_people(self, people_lists):
+        """
+        Merge the lists by name, keeping the first occurrence of each person.
+        """
+        people = {}
+        for people_list in people_lists:
+            for person in people_list:
+                people.setdefault(person["name"], person)
+
+        return list(people.values())
+
+    def _create_people(self, people):
+        create_missing = self.get_person_id_command.create_missing
+        if len(people) <= 1:
+            return [create_missing(person) for person in people]
+
+        return list(self._pool.map(bind_context(create_missing), people))
+
+    def _get_missing(self, people, pages):
+        missing = [person for person in people if person["name"] not in pages]
+        count_page(
+            self.get_person_id_command.person_database,
+            EXISTING,
+            len(people) - len(missing),
+        )
+        return missing
+
+    def _get_id_list(self, people, pages, missing, created):
+        for person, page in zip(missing, created):
+            pages[person["name"]] = page
+
+        return [pages[person["name"]]["id"] for person in people]
+
+    def _resolve_people(self, people):
+        """
+        Find every person with a single batched query and only create the
+        missing ones.
+        """
+        if len(people) == 0:
+            return []
+
+        pages = self.get_person_id_command.query_by_names(people)
+        missing = self._get_missing(people, pages)
+        created = self._create_people(missing)
+
+        return self._get_id_list(people, pages, missing, created)
+
+    def _get_id_lists(self, people_lists, people, id_list):
+        ids = {person["name"]: id for person, id in zip(people, id_list)}
+        id_lists = [
+            [ids[person["name"]] for person in people_list]
+            for people_list in people_lists
         ]
-        log.info(f"Get author id list: {author_id_list}")
+        log.info("Get people id lists: %s", payload(id_lists))
+
+        return id_lists
+
+    def resolve(self, *people_lists):
+        """
+        Resolve several people lists (e.g. authors and translators) at once.
+        Each name is looked up only once and the returned id lists keep the
+        order of the input lists.
+        """
+        log.info("Get people id lists for: %s", payload(people_lists))
 
-        return author_id_list
+        people = self._get_unique_people(people_lists)
+        id_list = self._resolve_people(people)
+
+        return self._get_id_lists(people_lists, people, id_list)
+
+    def execute(self, author_list):
+        return self.resolve(author_list)[0]
 
 
 class CreateSourceCommand(Command):
@@ -117,143 +371,513 @@ class CreateSourceCommand(Command):
         database: PersistenceLayer,
     ):
         self.get_source_id_command = get_source_id_command
-        self.get_people_id_list_command = GetPeopleIDListCommand(get_person_id_command)
+        self.get_people_id_list_command = self._get_people_id_list_command(
+            get_person_id_command
+        )
         self.database = database
         log.info("Create a CreateSourceCommand object.")
 
-    def _query_by_title(self, title):
-        log.info(
-            f"Query {self.database.__class__.__name__} database for: title={title}"
-        )
+    def _get_people_id_list_command(self, get_person_id_command):
+        return GetPeopleIDListCommand(get_person_id_command)
 
-        filter = {"filter": {"property": "Title", "rich_text": {"equals": title}}}
-        pages = self.database.query_pages(filter)
+    def _get_filter(self, title):
+        return self.database.get_title_filter(title)
 
+    def _get_first_page(self, pages):
         page = None
         if len(pages) > 0:
             page = pages[0]
-            log.info(f"Find source.")
+            log.info("Find source.")
         else:
             log.info("Source didn't exist.")
 
         return page
 
-    # TODO: Separate parse data
+    def _log_query(self, title):
+        log.info(
+            "Query %s database for: title=%s", self.database.__class__.__name__, title
+        )
+
+    def _query_by_title(self, title):
+        self._log_query(title)
+        pages = self.database.query_pages(self._get_filter(title))
+
+        return self._get_first_page(pages)
+
+    def _get_flight_key(self, data):
+        return ("page", self.database.database_id, data["title"])
+
     def execute(self, data):
         log.info("Execute CreateSource command.")
 
-        source_id = self.get_source_id_command.execute(data)
-        author_id_list = self.get_people_id_list_command.execute(data["author"])
-        # TODO: Refactor
+        return flight.do(self._get_flight_key(data), self._create, data)
+
+    def _get_people_lists(self, data):
+        return data["author"], data.get("translator") or []
+
+    # TODO: Refactor
+    def _set_ids(self, data, source_id, id_lists):
+        author_id_list, translator_id_list = id_lists
         if data.get("translator"):
-            translator_id_list = self.get_people_id_list_command.execute(
-                data["translator"]
-            )
             data["translator"] = translator_id_list
         data["source_id"] = source_id
         data["author"] = author_id_list
 
+    # TODO: Separate parse data
+    def _create(self, data):
+        source_id = self.get_source_id_command.execute(data)
+        id_lists = self.get_people_id_list_command.resolve(
+            *self._get_people_lists(data)
+        )
+        self._set_ids(data, source_id, id_lists)
+
         page = self._query_by_title(data["title"])
         if page is None:
             page = self.database.create_page(data)
-        log.info(f"{self.database.__class__.__name__} page created.")
+            count_page(self.database, CREATED)
+        else:
+            count_page(self.database, EXISTING)
+        log.info("%s page created.", self.database.__class__.__name__)
 
         return page
 
 
 class AddByURLCommand(Command):
-    def __init__(self, source_database, person_database, podcast_database):
+    get_source_id_command_class = GetSourceIDCommand
+    get_person_id_command_class = GetPersonIDCommand
+    create_source_command_class = CreateSourceCommand
+
+    def __init__(self, source_database, person_database, podcast_database, mirror=None):
         self.source_database = source_database
         self.person_database = person_database
         self.podcast_database = podcast_database
+        self.mirror = mirror
+        self.create_commands = self._get_create_commands()
         log.info("Create a AddByURLCommand object.")
 
-    def _get_extractors(self):
-        extractors = [
-            ZhongduExtractor(),
-        ]
-        log.info(f"Get extractors: {extractors}")
-        return extractors
+    def _get_extractor(self, url):
+        return registry.find_by_url(url)
 
     def _get_create_commands(self):
-        get_source_id_command = GetSourceIDCommand(self.source_database)
-        get_person_id_command = GetPersonIDCommand(self.person_database)
+        get_source_id_command = self.get_source_id_command_class(
+            self.source_database, self.mirror
+        )
+        get_person_id_command = self.get_person_id_command_class(
+            self.person_database, self.mirror
+        )
         create_commands = {
-            "Podcast": CreateSourceCommand(
+            "Podcast": self.create_source_command_class(
                 get_source_id_command, get_person_id_command, self.podcast_database
             )
         }
-        log.info(f"Get create_commands: {create_commands}")
+        log.info("Get create_commands: %s", payload(create_commands))
 
         return create_commands
 
     def execute(self, url):
-        log.info(f"Execute AddByURL command.")
+        log.info("Execute AddByURL command.")
+
+        return flight.do(get_url_key(url), self._add, url)
 
-        extractors = self._get_extractors()
-        create_commands = self._get_create_commands()
+    @counted("AddByURL")
+    def _add(self, url):
+        extractor = self._get_extractor(url)
+        create_commands = self.create_commands
 
         page = None
 
-        # Find a extractor that match the url
-        for extractor in extractors:
-            if extractor.match(url):
-                data = extractor.extract(url)
-                create_command = create_commands.get(data["type"])
-                page = create_command.execute(data)
-                break
+        if extractor is not None:
+            data = extractor.extract(url)
+            create_command = create_commands.get(data["type"])
+            page = create_command.execute(data)
 
         if page is None:
-            log.info(f"Cannot find a extractor {url}.")
+            log.info("Cannot find a extractor %s.", url)
 
         return page
 
 
 class AddByISBNCommand(Command):
-    def __init__(self, source_database, person_database, book_database):
+    get_source_id_command_class = GetSourceIDCommand
+    get_person_id_command_class = GetPersonIDCommand
+    create_source_command_class = CreateSourceCommand
+
+    def __init__(self, source_database, person_database, book_database, mirror=None):
         self.source_database = source_database
         self.person_database = person_database
         self.database = book_database
+        self.mirror = mirror
+        self.create_commands = self._get_create_commands()
         log.info("Create a AddByISBNCommand object.")
 
-    def _get_extractors(self):
-        extractors = [
-            DoubanBookExtractor(),
-        ]
-        log.info(f"Get extractors: {extractors}")
-        return extractors
+    def _get_extractor(self, isbn):
+        return registry.find_by_isbn(isbn)
 
     def _get_create_commands(self):
-        get_source_id_command = GetSourceIDCommand(self.source_database)
-        get_person_id_command = GetPersonIDCommand(self.person_database)
+        get_source_id_command = self.get_source_id_command_class(
+            self.source_database, self.mirror
+        )
+        get_person_id_command = self.get_person_id_command_class(
+            self.person_database, self.mirror
+        )
         create_commands = {
-            "Book": CreateSourceCommand(
+            "Book": self.create_source_command_class(
                 get_source_id_command, get_person_id_command, self.database
             )
         }
-        log.info(f"Get create_commands: {create_commands}")
+        log.info("Get create_commands: %s", payload(create_commands))
 
         return create_commands
 
     def execute(self, isbn):
-        log.info(f"Execute AddByISBN command.")
+        log.info("Execute AddByISBN command.")
 
-        extractors = self._get_extractors()
-        create_commands = self._get_create_commands()
+        return flight.do(get_isbn_key(isbn), self._add, isbn)
+
+    @counted("AddByISBN")
+    def _add(self, isbn):
+        extractor = self._get_extractor(isbn)
+        create_commands = self.create_commands
 
         page = None
 
-        # Find a extractor that match the url
-        for extractor in extractors:
-            if extractor.match(isbn):
-                data = extractor.extract(isbn)
-                if data is None:
-                    continue
-                create_command = create_commands.get(data["type"])
-                page = create_command.execute(data)
-                break
+        data = extractor.extract(isbn) if extractor is not None else None
+        if data is not None:
+            create_command = create_commands.get(data["type"])
+            page = create_command.execute(data)
 
         if page is None:
-            log.info(f"Cannot find a extractor {isbn}.")
+            log.info("Cannot find a extractor %s.", isbn)
 
         return page
+
+
+# asyncio versions of the commands above. They reuse the filters and the
+# parsing helpers of their synchronous parents and only swap the Notion calls
+# for the awaitable ones, so both pipelines create exactly the same pages.
+
+
+async def call_mirror(mirror, function, *args):
+    """
+    Run a blocking NotionMirror call of a command off the event loop. Without
+    a mirror the call does nothing and runs inline.
+    """
+    if mirror is None:
+        return function(*args)
+    return await asyncio.to_thread(function, *args)
+
+
+class AsyncGetSourceIDCommand(GetSourceIDCommand):
+    async def _query_by_title(self, data):
+        page = await call_mirror(self.mirror, self._query_mirror, data["title"])
+        if page is None:
+            log.info("Query source database for: %s", payload(data))
+
+            pages = await self.source_database.aquery_pages(self._get_filter(data))
+            page = self._get_first_page(pages)
+            await call_mirror(self.mirror, self._add_to_mirror, data["title"], page)
+
+        return page
+
+    async def _create_page(self, data):
+        page = await self.source_database.acreate_page(data)
+        await call_mirror(self.mirror, self._add_to_mirror, data["title"], page)
+        return page
+
+    async def _get_or_create_page(self, data):
+        page = await self._query_by_title(data)
+        if page is None:
+            page = await self._create_page(data)
+            count_page(self.source_database, CREATED)
+        else:
+            count_page(self.source_database, EXISTING)
+        return page
+
+    async def execute(self, data):
+        log.info("Execute GetSourceID Command for: %s", payload(data))
+
+        page = await async_flight.do(
+            self._get_flight_key(data), self._get_or_create_page, data
+        )
+        log.info("Get source id: %s", page["id"])
+
+        return page["id"]
+
+
+class AsyncGetPersonIDCommand(GetPersonIDCommand):
+    async def _query_by_name(self, data):
+        page = await call_mirror(self.mirror, self._query_mirror, data["name"])
+        if page is None:
+            log.info("Query person database for: %s", payload(data))
+
+            pages = await self.person_database.aquery_pages(self._get_filter(data))
+            page = self._get_first_page(pages)
+            await call_mirror(self.mirror, self._add_to_mirror, data["name"], page)
+
+        return page
+
+    async def query_by_names(self, people):
+        pages, names = await call_mirror(self.mirror, self._split_mirrored, people)
+        if names:
+            log.info("Query person database for: %s", payload(names))
+
+            found = await self.person_database.aquery_by_titles(names)
+            log.info("Find %s of %s people in person database.", len(found), len(names))
+            await call_mirror(self.mirror, self._add_all_to_mirror, found)
+            pages.update(found)
+
+        return pages
+
+    async def create_page(self, data):
+        page = await self.person_database.acreate_page(data)
+        await call_mirror(self.mirror, self._add_to_mirror, data["name"], page)
+        return page
+
+    async def _get_or_create_page(self, data):
+        page = await self._query_by_name(data)
+        if page is None:
+            page = await self.create_page(data)
+            count_page(self.person_database, CREATED)
+        else:
+            count_page(self.person_database, EXISTING)
+        return page
+
+    async def get_page(self, data):
+        return await async_flight.do(
+            self._get_flight_key(data), self._get_or_create_page, data
+        )
+
+    async def _create_missing_page(self, data):
+        page = await call_mirror(self.mirror, self._get_created_page, data["name"])
+        if page is None:
+            page = await self.create_page(data)
+            count_page(self.person_database, CREATED)
+        else:
+            count_page(self.person_database, EXISTING)
+        return page
+
+    async def create_missing(self, data):
+        return await async_flight.do(
+            self._get_flight_key(data), self._create_missing_page, data
+        )
+
+    async def execute(self, data):
+        log.info("Execute GetPersonID Command for: %s", payload(data))
+
+        page = await self.get_page(data)
+        log.info("Get person id: %s", page["id"])
+
+        return page["id"]
+
+
+class AsyncGetPeopleIDListCommand(GetPeopleIDListCommand):
+    async def _create_people(self, people):
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def create_person(person):
+            async with semaphore:
+                return await self.get_person_id_command.create_missing(person)
+
+        return await asyncio.gather(*(create_person(person) for person in people))
+
+    async def _resolve_people(self, people):
+        if len(people) == 0:
+            return []
+
+        pages = await self.get_person_id_command.query_by_names(people)
+        missing = self._get_missing(people, pages)
+        created = await self._create_people(missing)
+
+        return self._get_id_list(people, pages, missing, created)
+
+    async def resolve(self, *people_lists):
+        log.info("Get people id lists for: %s", payload(people_lists))
+
+        people = self._get_unique_people(people_lists)
+        id_list = await self._resolve_people(people)
+
+        return self._get_id_lists(people_lists, people, id_list)
+
+    async def execute(self, author_list):
+        return (await self.resolve(author_list))[0]
+
+
+class AsyncCreateSourceCommand(CreateSourceCommand):
+    def _get_people_id_list_command(self, get_person_id_command):
+        return AsyncGetPeopleIDListCommand(get_person_id_command)
+
+    async def _query_by_title(self, title):
+        self._log_query(title)
+        pages = await self.database.aquery_pages(self._get_filter(title))
+
+        return self._get_first_page(pages)
+
+    async def execute(self, data):
+        log.info("Execute CreateSource command.")
+
+        return await async_flight.do(self._get_flight_key(data), self._create, data)
+
+    async def _create(self, data):
+        source_id = await self.get_source_id_command.execute(data)
+        id_lists = await self.get_people_id_list_command.resolve(
+            *self._get_people_lists(data)
+        )
+        self._set_ids(data, source_id, id_lists)
+
+        page = await self._query_by_title(data["title"])
+        if page is None:
+            page = await self.database.acreate_page(data)
+            count_page(self.database, CREATED)
+        else:
+            count_page(self.database, EXISTING)
+        log.info("%s page created.", self.database.__class__.__name__)
+
+        return page
+
+
+class AsyncAddByURLCommand(AddByURLCommand):
+    get_source_id_command_class = AsyncGetSourceIDCommand
+    get_person_id_command_class = AsyncGetPersonIDCommand
+    create_source_command_class = AsyncCreateSourceCommand
+
+    async def execute(self, url):
+        log.info("Execute AddByURL command.")
+
+        return await async_flight.do(get_url_key(url), self._add, url)
+
+    @counted("AddByURL")
+    async def _add(self, url):
+        extractor = self._get_extractor(url)
+        create_commands = self.create_commands
+
+        page = None
+
+        # Extractors are blocking, run them off the event loop.
+        if extractor is not None:
+            data = await asyncio.to_thread(extractor.extract, url)
+            create_command = create_commands.get(data["type"])
+            page = await create_command.execute(data)
+
+        if page is None:
+            log.info("Cannot find a extractor %s.", url)
+
+        return page
+
+
+class AsyncAddByISBNCommand(AddByISBNCommand):
+    get_source_id_command_class = AsyncGetSourceIDCommand
+    get_person_id_command_class = AsyncGetPersonIDCommand
+    create_source_command_class = AsyncCreateSourceCommand
+
+    async def execute(self, isbn):
+        log.info("Execute AddByISBN command.")
+
+        return await async_flight.do(get_isbn_key(isbn), self._add, isbn)
+
+    async def _fetch(self, extractor, isbn):
+        # Extractors are blocking, run them off the event loop.
+        return await async_flight.do(
+            get_fetch_key(isbn), asyncio.to_thread, extractor.fetch, isbn
+        )
+
+    async def _parse(self, extractor, isbn, page):
+        return await asyncio.to_thread(extractor.parse, isbn, *page)
+
+    @counted("AddByISBN")
+    async def _add(self, isbn):
+        extractor = self._get_extractor(isbn)
+        create_commands = self.create_commands
+
+        page = None
+
+        data = None
+        if extractor is not None:
+            fetched = await self._fetch(extractor, isbn)
+            if fetched is not None:
+                data = await self._parse(extractor, isbn, fetched)
+        if data is not None:
+            create_command = create_commands.get(data["type"])
+            page = await create_command.execute(data)
+
+        if page is None:
+            log.info("Cannot find a extractor %s.", isbn)
+
+        return page
+
+
+class AddByISBNListCommand(AsyncAddByISBNCommand):
+    """
+    Add many books at once. Douban fetch, parse and Notion write run as
+    separate pipeline stages with their own concurrency, and every ISBN gets
+    its own result so one bad ISBN doesn't fail the batch.
+    """
+
+    def __init__(
+        self,
+        source_database,
+        person_database,
+        book_database,
+        mirror=None,
+        fetch_concurrency=4,
+        parse_concurrency=2,
+        write_concurrency=2,
+        queue_size=8,
+    ):
+        super().__init__(source_database, person_database, book_database, mirror)
+        self.fetch_concurrency = fetch_concurrency
+        self.parse_concurrency = parse_concurrency
+        self.write_concurrency = write_concurrency
+        self.queue_size = queue_size
+
+    def _get_pipeline(self, create_commands):
+        async def fetch(job):
+            page = await self._fetch(job["extractor"], job["isbn"])
+            return None if page is None else dict(job, page=page)
+
+        async def parse(job):
+            return await self._parse(job["extractor"], job["isbn"], job["page"])
+
+        async def write(data):
+            create_command = create_commands.get(data["type"])
+            with count_calls("AddByISBNList"):
+                return await create_command.execute(data)
+
+        return Pipeline(
+            [
+                Stage("fetch", fetch, self.fetch_concurrency),
+                Stage("parse", parse, self.parse_concurrency),
+                Stage("write", write, self.write_concurrency),
+            ],
+            queue_size=self.queue_size,
+        )
+
+    def _get_result(self, isbn, result):
+        if result["status"] == "done":
+            return {"isbn": isbn, "status": "added", "page_id": result["result"]["id"]}
+        if result["status"] == "skipped":
+            return {"isbn": isbn, "status": "not_found"}
+        return {"isbn": isbn, "status": "error", "error": result["error"]}
+
+    async def execute(self, isbn_list):
+        log.info("Execute AddByISBNList command for %s ISBNs.", len(isbn_list))
+
+        create_commands = self.create_commands
+
+        results = [None] * len(isbn_list)
+        jobs = []
+        for index, isbn in enumerate(isbn_list):
+            isbn = str(isbn).strip()
+            extractor = self._get_extractor(isbn)
+            if extractor is None:
+                results[index] = {"isbn": isbn, "status": "invalid"}
+            else:
+                jobs.append((index, {"isbn": isbn, "extractor": extractor}))
+
+        pipeline = self._get_pipeline(create_commands)
+        job_results = await pipeline.run(job for _, job in jobs)
+        for (index, job), result in zip(jobs, job_results):
+            results[index] = self._get_result(job["isbn"], result)
+
+        log.info("AddByISBNList results: %s", payload(results))
+
+        return results
@@ -0,0 +1,315 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from telemetry.logs import get_logger
+
+log = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+NOT_FOUND = "not_found"
+FAILED = "failed"
+
+FINISHED_STATUSES = (DONE, NOT_FOUND, FAILED)
+
+# A running job whose worker hasn't reported for this long is considered
+# lost, and a redelivered message may run it again.
+LEASE_SECONDS = 300
+
+JOB_FIELDS = (
+    "job_id",
+    "kind",
+    "target",
+    "status",
+    "page_id",
+    "error",
+    "created_at",
+    "updated_at",
+)
+
+
+class JobBusyException(Exception):
+    """
+    The job is running on another worker. Raised so the queue delivers the
+    message again later instead of dropping it.
+    """
+
+
+class JobStore:
+    """
+    Status of the ingest jobs run in the background, kept in SQLite.
+
+    SQLite only coordinates the workers of one machine: use it for tests,
+    local runs and a single instance. Several instances need a store they
+    all reach, see TableJobStore. Don't put the file on the /home share,
+    SQLite can't lock it reliably.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._create_tables()
+
+        log.info("Create a JobStore object: path=%s", path)
+
+    def _create_tables(self):
+        with self._lock, self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    page_id TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """)
+
+    def create(self, kind, target, job_id=None) -> dict:
+        now = time.time()
+        job = {
+            "job_id": job_id or uuid.uuid4().hex,
+            "kind": kind,
+            "target": target,
+            "status": QUEUED,
+            "page_id": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT OR IGNORE INTO jobs ({', '.join(JOB_FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(JOB_FIELDS))})",
+                tuple(job[field] for field in JOB_FIELDS),
+            )
+        log.info("Create job %s for %s=%s", job["job_id"], kind, target)
+
+        return job
+
+    def get(self, job_id) -> dict:
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        return dict(zip(JOB_FIELDS, row)) if row else None
+
+    def _update(self, job_id, status, page_id=None, error=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, page_id = ?, error = ?, updated_at = ? "
+                "WHERE job_id = ?",
+                (status, page_id, error, time.time(), job_id),
+            )
+        log.info("Job %s is %s.", job_id, status)
+
+    def claim(self, job_id, lease=LEASE_SECONDS) -> bool:
+        """
+        Mark the job running if it is queued, or running with an expired
+        lease. Returns False when another worker holds it.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? "
+                "AND (status = ? OR (status = ? AND updated_at <= ?))",
+                (RUNNING, time.time(), job_id, QUEUED, RUNNING, time.time() - lease),
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, page_id):
+        self._update(job_id, DONE, page_id=page_id)
+
+    def set_not_found(self, job_id):
+        self._update(job_id, NOT_FOUND)
+
+    def fail(self, job_id, error):
+        self._update(job_id, FAILED, error=error)
+
+
+class TableJobStore:
+    """
+    Status of the ingest jobs in an Azure Storage table, so every instance
+    reports and claims the same jobs. Build it with
+    `from_connection_string`, e.g. on the AzureWebJobsStorage account that
+    already holds the job queue.
+    """
+
+    def __init__(self, table):
+        # azure.data.tables is only imported by deployments using the table.
+        from azure.core import MatchConditions
+        from azure.core import exceptions
+        from azure.data.tables import UpdateMode
+
+        self.table = table
+        self._match_conditions = MatchConditions
+        self._exceptions = exceptions
+        self._update_mode = UpdateMode
+
+        log.info("Create a TableJobStore object: table=%s", table.table_name)
+
+    @classmethod
+    def from_connection_string(cls, connection_string, table_name="jobs"):
+        from azure.data.tables import TableServiceClient
+
+        service = TableServiceClient.from_connection_string(connection_string)
+        return cls(service.create_table_if_not_exists(table_name))
+
+    def _get_entity(self, job_id):
+        try:
+            return self.table.get_entity(partition_key=job_id, row_key="")
+        except self._exceptions.ResourceNotFoundError:
+            return None
+
+    def create(self, kind, target, job_id=None) -> dict:
+        now = time.time()
+        job = {
+            "job_id": job_id or uuid.uuid4().hex,
+            "kind": kind,
+            "target": target,
+            "status": QUEUED,
+            "page_id": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        try:
+            self.table.create_entity(dict(job, PartitionKey=job["job_id"], RowKey=""))
+        except self._exceptions.ResourceExistsError:
+            pass
+        log.info("Create job %s for %s=%s", job["job_id"], kind, target)
+
+        return job
+
+    def get(self, job_id) -> dict:
+        entity = self._get_entity(job_id) if job_id else None
+        return {field: entity.get(field) for field in JOB_FIELDS} if entity else None
+
+    def _update(self, job_id, status, page_id=None, error=None):
+        entity = self._get_entity(job_id)
+        if entity is not None:
+            self.table.update_entity(
+                dict(
+                    entity,
+                    status=status,
+                    page_id=page_id,
+                    error=error,
+                    updated_at=time.time(),
+                ),
+                mode=self._update_mode.REPLACE,
+            )
+        log.info("Job %s is %s.", job_id, status)
+
+    def claim(self, job_id, lease=LEASE_SECONDS) -> bool:
+        entity = self._get_entity(job_id)
+        if entity is None:
+            return False
+        if entity["status"] != QUEUED and not (
+            entity["status"] == RUNNING and time.time() - entity["updated_at"] >= lease
+        ):
+            return False
+
+        # Only write if nobody claimed the job since it was read.
+        try:
+            self.table.update_entity(
+                dict(entity, status=RUNNING, updated_at=time.time()),
+                mode=self._update_mode.REPLACE,
+                etag=entity.metadata["etag"],
+                match_condition=self._match_conditions.IfNotModified,
+            )
+        except self._exceptions.ResourceModifiedError:
+            return False
+        return True
+
+    def finish(self, job_id, page_id):
+        self._update(job_id, DONE, page_id=page_id)
+
+    def set_not_found(self, job_id):
+        self._update(job_id, NOT_FOUND)
+
+    def fail(self, job_id, error):
+        self._update(job_id, FAILED, error=error)
+
+
+class LocalJobQueue:
+    """
+    In-process stand-in for the Storage Queue output binding. It has the
+    same `set` method, and `drain` hands the queued messages to a JobRunner.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def set(self, message):
+        self.messages.append(message)
+
+    async def drain(self, runner: "JobRunner"):
+        while self.messages:
+            await runner.run(self.messages.pop(0))
+
+
+class JobRunner:
+    """
+    Run queued jobs with the regular add commands and record the outcome.
+    `commands` maps a job kind ("isbn", "url") to a function returning the
+    command, so commands are only built when a job of that kind runs.
+
+    Every store call is a blocking SQLite or HTTP round trip, the runner
+    makes them in a thread to keep the event loop free.
+    """
+
+    def __init__(self, store: JobStore, commands: dict):
+        self.store = store
+        self.commands = commands
+
+    async def _call_store(self, function, *args):
+        return await asyncio.to_thread(function, *args)
+
+    async def get(self, job_id) -> dict:
+        return await self._call_store(self.store.get, job_id)
+
+    async def enqueue(self, queue, kind, target) -> dict:
+        assert kind in self.commands, f"Unknown job kind {kind}."
+        job = await self._call_store(self.store.create, kind, target)
+        # The message carries the whole job, so a worker whose store never
+        # saw the job (e.g. an in-memory store on another instance) can run it.
+        message = {field: job[field] for field in ("job_id", "kind", "target")}
+        queue.set(json.dumps(message))
+        return job
+
+    async def run(self, message):
+        message = json.loads(message)
+        job_id = message["job_id"]
+        job = await self.get(job_id)
+        if job is None:
+            job = await self._call_store(
+                self.store.create, message["kind"], message["target"], job_id
+            )
+        if job["status"] in FINISHED_STATUSES:
+            # The queue delivers at least once, a job may show up again.
+            log.info("Job %s already finished.", job_id)
+            return job
+
+        if not await self._call_store(self.store.claim, job_id):
+            raise JobBusyException(f"Job {job_id} is running on another worker.")
+        command = self.commands[job["kind"]]()
+        try:
+            page = await command.execute(job["target"])
+        except Exception as e:
+            log.exception("Job %s failed.", job_id)
+            await self._call_store(self.store.fail, job_id, str(e))
+        else:
+            if page:
+                await self._call_store(self.store.finish, job_id, page["id"])
+            else:
+                await self._call_store(self.store.set_not_found, job_id)
+
+        return await self.get(job_id)
@@ -0,0 +1,102 @@
+import asyncio
+
+from telemetry.logs import get_logger
+
+log = get_logger(__name__)
+
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline. `handler` is an async callable taking the output
+    of the previous stage. Returning None ends the item early.
+    """
+
+    def __init__(self, name, handler, concurrency=1):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+
+
+class Pipeline:
+    """
+    Run items through a list of stages connected by bounded queues. Every
+    stage has its own pool of workers, so a slow stage never blocks the
+    others beyond the queue size. Failures are recorded per item and never
+    stop the rest of the batch.
+    """
+
+    def __init__(self, stages: list, queue_size=8):
+        assert len(stages) > 0, "Pipeline should contain at least one stage."
+        self.stages = stages
+        self.queue_size = queue_size
+
+    async def _feed(self, items, queue: asyncio.Queue):
+        for index, item in enumerate(items):
+            await queue.put((index, item))
+
+    async def _work(self, stage: Stage, inbox, outbox, results):
+        while True:
+            entry = await inbox.get()
+            if entry is _DONE:
+                return
+
+            index, item = entry
+            try:
+                output = await stage.handler(item)
+            except Exception as e:
+                log.exception("Stage %s failed for item %s.", stage.name, index)
+                results[index] = {
+                    "status": "error",
+                    "stage": stage.name,
+                    "error": str(e),
+                }
+                continue
+
+            if output is None:
+                results[index] = {"status": "skipped", "stage": stage.name}
+            elif outbox is None:
+                results[index] = {"status": "done", "result": output}
+            else:
+                await outbox.put((index, output))
+
+    async def _run_stage(self, stage: Stage, inbox, outbox, results):
+        workers = [
+            asyncio.create_task(self._work(stage, inbox, outbox, results))
+            for _ in range(stage.concurrency)
+        ]
+        await asyncio.gather(*workers)
+        # Every worker of this stage is done, let the next stage wind down.
+        if outbox is not None:
+            for _ in range(self._get_next_concurrency(stage)):
+                await outbox.put(_DONE)
+
+    def _get_next_concurrency(self, stage: Stage):
+        return self.stages[self.stages.index(stage) + 1].concurrency
+
+    async def run(self, items):
+        """
+        Return one result dict per item, in input order.
+        """
+        items = list(items)
+        results = [None] * len(items)
+        queues = [asyncio.Queue(self.queue_size) for _ in self.stages]
+
+        async def feed():
+            await self._feed(items, queues[0])
+            for _ in range(self.stages[0].concurrency):
+                await queues[0].put(_DONE)
+
+        stage_runs = [
+            self._run_stage(
+                stage,
+                queues[i],
+                queues[i + 1] if i + 1 < len(self.stages) else None,
+                results,
+            )
+            for i, stage in enumerate(self.stages)
+        ]
+        await asyncio.gather(feed(), *stage_runs)
+
+        return results
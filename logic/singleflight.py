@@ -0,0 +1,82 @@
+from concurrent.futures import Future
+import asyncio
+import threading
+
+from telemetry.logs import get_logger
+
+log = get_logger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls doing the same work. The first caller for a
+    key runs the function, callers arriving while it is in flight wait for
+    it and get the same result (or exception). Once the call is done the
+    key is free again, nothing is cached.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            log.info("Join the in-flight call for %s.", key)
+            return future.result()
+
+        try:
+            result = function(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared}
+
+
+class AsyncSingleFlight:
+    """
+    asyncio version of SingleFlight. The shared call runs in its own task,
+    so a caller being cancelled doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+
+    async def do(self, key, function, *args):
+        # Tasks belong to a loop, keep calls from different loops apart.
+        key = (asyncio.get_running_loop(), key)
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.calls += 1
+        else:
+            log.info("Join the in-flight call for %s.", key[1])
+            self.shared += 1
+
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared}
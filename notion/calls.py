@@ -0,0 +1,126 @@
+"""
+Accounting of Notion API calls per logical operation.
+
+`count_calls(operation)` opens a scope that counts every NotionManager call
+made inside it by kind (create, update, delete, query), including the calls
+made from asyncio tasks, `asyncio.to_thread` and pools using
+`telemetry.tracing.bind_context`. Scopes nest, a call counts for every open
+scope. When a named operation ends its counts are logged and observed in
+the notion_calls_per_operation histogram, so the Notion spend per ingest
+can be followed.
+
+`assert_max_calls` pins the budget of a block in tests, in the spirit of
+Django's assertNumQueries.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+import contextvars
+import functools
+import inspect
+import threading
+
+from telemetry import metrics
+from telemetry.logs import get_logger
+
+log = get_logger(__name__)
+
+CALLS = metrics.counter("notion_calls_total", "Notion API calls by kind.", ("kind",))
+CALLS_PER_OPERATION = metrics.histogram(
+    "notion_calls_per_operation",
+    "Notion API calls made by one operation, e.g. one ingest.",
+    ("operation",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+_current_calls = contextvars.ContextVar("notion_calls", default=None)
+
+
+class NotionCalls:
+    def __init__(self, operation=None, parent: "NotionCalls" = None):
+        self.operation = operation
+        self.parent = parent
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def record(self, kind):
+        calls = self
+        while calls is not None:
+            with calls._lock:
+                calls.counts[kind] += 1
+            calls = calls.parent
+
+    def __str__(self):
+        kinds = ", ".join(
+            f"{kind}={count}" for kind, count in sorted(self.counts.items())
+        )
+        return f"{self.total} Notion calls ({kinds})"
+
+
+def record_call(kind):
+    CALLS.inc(kind)
+    calls = _current_calls.get()
+    if calls is not None:
+        calls.record(kind)
+
+
+@contextmanager
+def count_calls(operation=None):
+    calls = NotionCalls(operation, _current_calls.get())
+    token = _current_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _current_calls.reset(token)
+        if operation is not None:
+            CALLS_PER_OPERATION.observe(calls.total, operation)
+            log.info("%s made %s", operation, calls)
+
+
+def counted(operation):
+    """
+    Decorator counting the Notion calls of every call of a function or
+    coroutine function as one `operation`.
+    """
+
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with count_calls(operation):
+                    return await function(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with count_calls(operation):
+                    return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def assert_max_calls(maximum, **kinds):
+    """
+    Fail if the block makes more than `maximum` Notion calls, or more calls
+    of a kind than given in `kinds`, e.g. `assert_max_calls(8, create=4)`.
+    """
+    with count_calls() as calls:
+        yield calls
+
+    errors = []
+    if calls.total > maximum:
+        errors.append(f"expected at most {maximum} calls")
+    for kind, limit in sorted(kinds.items()):
+        if calls.counts[kind] > limit:
+            errors.append(f"expected at most {limit} {kind} calls")
+    if errors:
+        raise AssertionError(f"{calls}: {', '.join(errors)}.")
@@ -1,47 +1,159 @@
-from abc import ABC, abstractmethod
-import logging
+from abc import ABC
+import asyncio
+from collections import OrderedDict
+import json
+import threading
+import time
 
 from notion.notion import NotionManager
 from notion.property import *
-from notion.page import NotionPage
-
-log = logging.getLogger(__name__)
+from notion.page import NotionPage, format_properties
+from telemetry.logs import get_logger, payload
+
+log = get_logger(__name__)
+
+# Notion rejects compound filters with more than 100 conditions.
+MAX_FILTER_CONDITIONS = 100
+
+
+def get_page_title(page, property_name):
+    title = page["properties"][property_name]["title"]
+    return "".join(text["plain_text"] for text in title)
+
+
+class QueryCache:
+    """
+    A thread-safe LRU cache of query results with a time-to-live, keyed by
+    (database_id, normalized filter). One instance can be shared by every
+    PersistenceLayer of a worker.
+
+    Empty results live for `negative_ttl` only, and aren't cached by
+    default: a page created by another instance or by hand in Notion would
+    stay invisible to this one until the entry expires, and this instance
+    would create a duplicate.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, negative_ttl=0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(database_id, filter):
+        return database_id, json.dumps(filter, sort_keys=True, ensure_ascii=False)
+
+    def get(self, key):
+        """
+        Return the cached pages, or None on a miss. An empty list is a valid
+        (negative) entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, pages):
+        ttl = self.ttl if pages else self.negative_ttl
+        with self._lock:
+            if ttl <= 0:
+                self._entries.pop(key, None)
+                return
+            self._entries[key] = (self.clock() + ttl, pages)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_page(self, page_id):
+        with self._lock:
+            keys = [
+                key
+                for key, (_, pages) in self._entries.items()
+                if any(page["id"] == page_id for page in pages)
+            ]
+            for key in keys:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class Column:
+    """
+    How one data key is written to a database: the NotionProperty type and
+    the column name. With `single=True` the value is one item of a list
+    property, e.g. the page id of a one-page Relation.
+    """
+
+    __slots__ = ("property_class", "name", "single")
+
+    def __init__(self, property_class, name, single=False):
+        self.property_class = property_class
+        self.name = name
+        self.single = single
+
+    def __call__(self, value) -> NotionProperty:
+        return self.property_class(self.name, [value] if self.single else value)
 
 
 class PersistenceLayer(ABC):
-    def __init__(self, notion: NotionManager, database_id):
+    title_property = "Title"
+    title_key = "title"
+    # Data key -> Column. Keys missing from the map aren't written to Notion.
+    columns = {}
+    # Set by the NotionMirror of the database, deleted pages leave it too.
+    mirror = None
+
+    def __init__(self, notion: NotionManager, database_id, cache: QueryCache = None):
+        # Cache keys and mirror rows are scoped by the id, databases without
+        # one would share them.
+        if not database_id:
+            raise ValueError(f"{self.__class__.__name__} needs a database id.")
         self.notion = notion
         self.database_id = database_id
+        self.cache = cache
 
         log.info(
-            f"Create a {self.__class__.__name__} object: database_id={database_id}"
-        )
-
-    @abstractmethod
-    def _turn_to_notion_property(self, property_name, property_value) -> NotionProperty:
-        raise NotImplementedError(
-            "PersistenceLayer class should implement the _turn_to_notion_property method."
+            "Create a %s object: database_id=%s", self.__class__.__name__, database_id
         )
 
     def _turn_to_notion_property_list(self, data: dict):
-        log.info(f"Format data into Notion property values: {data}")
-
-        properties = []
+        log.info("Format data into Notion property values: %s", payload(data))
 
-        for property_name, property_value in data.items():
-            property_object = self._turn_to_notion_property(
-                property_name, property_value
-            )
-            if property_object:
-                properties.append(property_object)
+        columns = self.columns
+        properties = [
+            columns[property_name](property_value)
+            for property_name, property_value in data.items()
+            if property_name in columns
+        ]
 
-        log.info(f"Properties after formatting: {properties}")
+        log.info("Properties after formatting: %s", payload(properties))
 
         return properties
 
-    def create_page(self, data: dict):
-        log.info(f"Create a page in Notion for: {data}")
-
+    def _get_page_object(self, data: dict):
         properties = self._turn_to_notion_property_list(data)
         page_object = NotionPage(
             self.database_id,
@@ -50,93 +162,262 @@ class PersistenceLayer(ABC):
             icon_emoji=data.get("icon_emoji"),
             icon_url=data.get("icon_url"),
         )
-        response = self.notion.create(page_object.get_notion_page_object())
+        return page_object.get_notion_page_object()
+
+    def _get_properties(self, data: dict):
+        return format_properties(self._turn_to_notion_property_list(data))
+
+    def get_title_filter(self, title):
+        return {
+            "filter": {"property": self.title_property, "rich_text": {"equals": title}}
+        }
+
+    def _get_cache_key(self, filter):
+        return QueryCache.get_key(self.database_id, filter)
+
+    def _write_through(self, data, page):
+        """
+        Make a newly created page visible to later title lookups at once.
+        """
+        if self.cache is not None and data.get(self.title_key):
+            key = self._get_cache_key(self.get_title_filter(data[self.title_key]))
+            self.cache.set(key, [page])
+
+    def _invalidate(self, page_id):
+        if self.cache is not None:
+            self.cache.invalidate_page(page_id)
+
+    def create_page(self, data: dict):
+        log.info("Create a page in Notion for: %s", payload(data))
+
+        response = self.notion.create(self._get_page_object(data))
+        self._write_through(data, response)
 
         log.info("Page created.")
 
         return response
 
-    def update_page_property(self, page_id, data: dict):
-        log.info(f"Update page {page_id} into: {data}")
+    async def acreate_page(self, data: dict):
+        log.info("Create a page in Notion for: %s", payload(data))
+
+        response = await self.notion.aio.create(self._get_page_object(data))
+        self._write_through(data, response)
+
+        log.info("Page created.")
+
+        return response
 
-        property_list = self._turn_to_notion_property_list()
-        properties = {}
-        for property_object in property_list:
-            assert isinstance(property_object, NotionProperty)
-            property_dict = property_object.get_dict()
-            if property_dict:
-                properties.update(property_dict)
+    def update_page_property(self, page_id, data: dict):
+        log.info("Update page %s into: %s", page_id, payload(data))
 
+        properties = self._get_properties(data)
         response = self.notion.update(page_id, {"properties": properties})
+        self._invalidate(page_id)
+        log.info("Page updated.")
+
+        return response
+
+    async def aupdate_page_property(self, page_id, data: dict):
+        log.info("Update page %s into: %s", page_id, payload(data))
+
+        properties = self._get_properties(data)
+        response = await self.notion.aio.update(page_id, {"properties": properties})
+        self._invalidate(page_id)
         log.info("Page updated.")
 
         return response
 
     def delete_page(self, page_id):
-        log.info(f"Delete page: {page_id}")
+        log.info("Delete page: %s", page_id)
 
         self.notion.delete(page_id)
+        self._invalidate(page_id)
+        if self.mirror is not None:
+            self.mirror.remove(self, page_id)
+        log.info("Page deleted.")
+
+        return True
+
+    async def adelete_page(self, page_id):
+        log.info("Delete page: %s", page_id)
+
+        await self.notion.aio.delete(page_id)
+        self._invalidate(page_id)
+        if self.mirror is not None:
+            await asyncio.to_thread(self.mirror.remove, self, page_id)
         log.info("Page deleted.")
 
         return True
 
     def query_pages(self, filter):
-        log.info(f"Query database({self.database_id}) for: {filter}")
+        log.info("Query database(%s) for: %s", self.database_id, payload(filter))
+
+        if self.cache is not None:
+            key = self._get_cache_key(filter)
+            response = self.cache.get(key)
+            if response is not None:
+                log.info("Query hit the cache.")
+                return response
 
         response = self.notion.query(self.database_id, payload=filter)
+        if self.cache is not None:
+            self.cache.set(key, response)
         log.info("Query successfully.")
 
         return response
 
+    async def aquery_pages(self, filter):
+        log.info("Query database(%s) for: %s", self.database_id, payload(filter))
 
-class PersonDatabase(PersistenceLayer):
-    def _turn_to_notion_property(self, property_name, property_value) -> NotionProperty:
-        formats = {
-            "name": Title("Name", property_value),
-            "description": RichText("Description", property_value),
-            "original_name": RichText("Original Name", property_value),
-            "country_id": Relation("Country", [property_value]),
-        }
-        return formats.get(property_name)
+        if self.cache is not None:
+            key = self._get_cache_key(filter)
+            response = self.cache.get(key)
+            if response is not None:
+                log.info("Query hit the cache.")
+                return response
 
+        response = await self.notion.aio.query(self.database_id, payload=filter)
+        if self.cache is not None:
+            self.cache.set(key, response)
+        log.info("Query successfully.")
 
-class SourceDatabase(PersistenceLayer):
-    def _turn_to_notion_property(self, property_name, property_value) -> NotionProperty:
-        formats = {
-            "title": Title("Title", property_value),
-            "type": Select("Type", property_value),
-            "description": RichText("Description", property_value),
-            "language": Select("Language", property_value),
-            "published": Date("Published", property_value),
+        return response
+
+    def query_iter(self, filter=None, page_size=100, prefetch=False):
+        """
+        Stream every page of the database matching `filter`. Results are not
+        cached, this is meant for full scans.
+        """
+        log.info("Iterate database(%s) for: %s", self.database_id, payload(filter))
+
+        return self.notion.query_iter(
+            self.database_id, filter, page_size=page_size, prefetch=prefetch
+        )
+
+    def aquery_iter(self, filter=None, page_size=100):
+        log.info("Iterate database(%s) for: %s", self.database_id, payload(filter))
+
+        return self.notion.aio.query_iter(self.database_id, filter, page_size=page_size)
+
+    def _get_cached_titles(self, titles):
+        """
+        Split titles into the pages already cached and the titles still to be
+        queried.
+        """
+        titles = list(dict.fromkeys(titles))
+        if self.cache is None:
+            return {}, titles
+
+        pages_by_title = {}
+        missing = []
+        for title in titles:
+            pages = self.cache.get(self._get_cache_key(self.get_title_filter(title)))
+            if pages is None:
+                missing.append(title)
+            elif len(pages) > 0:
+                pages_by_title[title] = pages[0]
+
+        return pages_by_title, missing
+
+    def get_cached_page(self, title):
+        """
+        The page titled `title` if the query cache has it, without asking
+        Notion.
+        """
+        return self._get_cached_titles([title])[0].get(title)
+
+    def _get_title_filters(self, titles):
+        for i in range(0, len(titles), MAX_FILTER_CONDITIONS):
+            conditions = [
+                {"property": self.title_property, "rich_text": {"equals": title}}
+                for title in titles[i : i + MAX_FILTER_CONDITIONS]
+            ]
+            yield {"filter": {"or": conditions}}
+
+    def _map_pages_by_title(self, titles, pages):
+        pages_by_title = {}
+        for page in pages:
+            pages_by_title.setdefault(get_page_title(page, self.title_property), page)
+
+        if self.cache is not None:
+            for title in titles:
+                page = pages_by_title.get(title)
+                key = self._get_cache_key(self.get_title_filter(title))
+                self.cache.set(key, [page] if page else [])
+
+        return {
+            title: pages_by_title[title] for title in titles if title in pages_by_title
         }
 
-        return formats.get(property_name)
+    def query_by_titles(self, titles):
+        """
+        Look up many pages by title with one `or` query per 100 titles.
+        Returns a dict of title -> page for the titles that exist.
+        """
+        log.info("Query database(%s) for titles: %s", self.database_id, payload(titles))
+
+        pages_by_title, titles = self._get_cached_titles(titles)
+        pages = []
+        for filter in self._get_title_filters(titles):
+            pages.extend(self.notion.query_iter(self.database_id, filter))
+        pages_by_title.update(self._map_pages_by_title(titles, pages))
+
+        return pages_by_title
+
+    async def aquery_by_titles(self, titles):
+        log.info("Query database(%s) for titles: %s", self.database_id, payload(titles))
+
+        pages_by_title, titles = self._get_cached_titles(titles)
+        pages = []
+        for filter in self._get_title_filters(titles):
+            async for page in self.notion.aio.query_iter(self.database_id, filter):
+                pages.append(page)
+        pages_by_title.update(self._map_pages_by_title(titles, pages))
+
+        return pages_by_title
+
+
+class PersonDatabase(PersistenceLayer):
+    title_property = "Name"
+    title_key = "name"
+    columns = {
+        "name": Column(Title, "Name"),
+        "description": Column(RichText, "Description"),
+        "original_name": Column(RichText, "Original Name"),
+        "country_id": Column(Relation, "Country", single=True),
+    }
+
+
+class SourceDatabase(PersistenceLayer):
+    columns = {
+        "title": Column(Title, "Title"),
+        "type": Column(Select, "Type"),
+        "description": Column(RichText, "Description"),
+        "language": Column(Select, "Language"),
+        "published": Column(Date, "Published"),
+    }
 
 
 class PodcastDatabase(PersistenceLayer):
-    def _turn_to_notion_property(self, property_name, property_value) -> NotionProperty:
-        formats = {
-            "title": Title("Title", property_value),
-            "author": Relation("Author", property_value),
-            "duration": Number("Duration", property_value),
-            "series": Select("Series", property_value),
-            "source_id": Relation("Source", [property_value]),
-        }
-        return formats.get(property_name)
+    columns = {
+        "title": Column(Title, "Title"),
+        "author": Column(Relation, "Author"),
+        "duration": Column(Number, "Duration"),
+        "series": Column(Select, "Series"),
+        "source_id": Column(Relation, "Source", single=True),
+    }
 
 
 class BookDatabase(PersistenceLayer):
-    def _turn_to_notion_property(self, property_name, property_value) -> NotionProperty:
-        formats = {
-            "title": Title("Title", property_value),
-            "original_title": RichText("Original Title", property_value),
-            "author": Relation("Author", property_value),
-            "translator": Relation("Translator", property_value),
-            "pages": Number("Pages", property_value),
-            "publisher": Select("Publisher", property_value),
-            "isbn": RichText("ISBN", property_value),
-            "douban_url": URL("Douban", property_value),
-            "douban_ranking": Number("Douban Ranking", property_value),
-            "source_id": Relation("Source", [property_value]),
-        }
-        return formats.get(property_name)
+    columns = {
+        "title": Column(Title, "Title"),
+        "original_title": Column(RichText, "Original Title"),
+        "author": Column(Relation, "Author"),
+        "translator": Column(Relation, "Translator"),
+        "pages": Column(Number, "Pages"),
+        "publisher": Column(Select, "Publisher"),
+        "isbn": Column(RichText, "ISBN"),
+        "douban_url": Column(URL, "Douban"),
+        "douban_ranking": Column(Number, "Douban Ranking"),
+        "source_id": Column(Relation, "Source", single=True),
+    }
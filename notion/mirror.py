@@ -0,0 +1,251 @@
+from itertools import islice
+import sqlite3
+import threading
+import time
+
+from notion.database import PersistenceLayer, get_page_title
+from telemetry.logs import get_logger
+
+log = get_logger(__name__)
+
+
+class NotionMirror:
+    """
+    A local SQLite index of title -> page id for Notion databases.
+
+    The first sync of the process loads every page again, and so does one
+    every `rescan_interval` seconds. Other syncs only pull the pages whose
+    `last_edited_time` is at or after the stored cursor. Pages deleted
+    through the mirrored databases are removed at once. Pages archived
+    elsewhere are not reported by the query API, they are dropped by the
+    next full sync.
+
+    With a `max_age`, the mirror keeps itself fresh: a lookup starts a
+    sync in a background thread once the last one is older than that, and
+    finds nothing until the first full sync of the process is done.
+    """
+
+    def __init__(
+        self, path, databases: list, max_age=None, rescan_interval=6 * 60 * 60
+    ):
+        self.path = path
+        self.databases = {database.database_id: database for database in databases}
+        for database in databases:
+            database.mirror = self
+        self.max_age = max_age
+        self.rescan_interval = rescan_interval
+        self._synced_at = None
+        self._rescanned_at = None
+        self._refresh_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._create_tables()
+
+        log.info("Create a NotionMirror object: path=%s", path)
+
+    def _create_tables(self):
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    database_id TEXT NOT NULL,
+                    page_id TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    last_edited_time TEXT,
+                    PRIMARY KEY (database_id, page_id)
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS pages_title ON pages (database_id, title)"
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    database_id TEXT PRIMARY KEY,
+                    cursor TEXT NOT NULL
+                )
+                """
+            )
+
+    def _get_cursor(self, database_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT cursor FROM sync_state WHERE database_id = ?", (database_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _get_payload(self, cursor):
+        payload = {
+            "sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}],
+        }
+        if cursor:
+            # Notion rounds last_edited_time to the minute, so pages edited in
+            # the same minute as the cursor are fetched again on purpose.
+            payload["filter"] = {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": cursor},
+            }
+        return payload
+
+    def _save_pages(self, database: PersistenceLayer, pages, cursor):
+        rows = [
+            (
+                database.database_id,
+                page["id"],
+                get_page_title(page, database.title_property),
+                page.get("last_edited_time"),
+            )
+            for page in pages
+        ]
+        for row in rows:
+            if row[3] and (cursor is None or row[3] > cursor):
+                cursor = row[3]
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)", rows
+            )
+            if cursor:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES (?, ?)",
+                    (database.database_id, cursor),
+                )
+
+        return cursor
+
+    def _drop_pages(self, database: PersistenceLayer, page_ids):
+        """
+        Remove the pages of the database a full sync didn't see.
+        """
+        with self._lock, self._connection:
+            rows = self._connection.execute(
+                "SELECT page_id FROM pages WHERE database_id = ?",
+                (database.database_id,),
+            ).fetchall()
+            dropped = [
+                (database.database_id, row[0]) for row in rows if row[0] not in page_ids
+            ]
+            self._connection.executemany(
+                "DELETE FROM pages WHERE database_id = ? AND page_id = ?", dropped
+            )
+
+        return len(dropped)
+
+    def _sync_database(self, database: PersistenceLayer, full):
+        cursor = None if full else self._get_cursor(database.database_id)
+        payload = self._get_payload(cursor)
+        log.info(
+            "Sync mirror of database(%s) from cursor: %s", database.database_id, cursor
+        )
+
+        count = 0
+        page_ids = set()
+        pages = database.query_iter(payload, prefetch=True)
+        while True:
+            batch = list(islice(pages, 100))
+            if not batch:
+                break
+            cursor = self._save_pages(database, batch, cursor)
+            page_ids.update(page["id"] for page in batch)
+            count += len(batch)
+
+        log.info("Synced %s pages of database(%s).", count, database.database_id)
+        if full:
+            dropped = self._drop_pages(database, page_ids)
+            log.info(
+                "Dropped %s archived pages of database(%s).",
+                dropped,
+                database.database_id,
+            )
+
+        return count
+
+    def _needs_rescan(self, now):
+        return (
+            self._rescanned_at is None
+            or now - self._rescanned_at >= self.rescan_interval
+        )
+
+    def sync(self, full=None):
+        """
+        Bring every mirrored database up to date and return the number of
+        pages pulled from Notion. Unless `full` says otherwise, the sync is
+        full when the process hasn't done one for `rescan_interval`.
+        """
+        started_at = time.monotonic()
+        if full is None:
+            full = self._needs_rescan(started_at)
+
+        count = sum(
+            self._sync_database(database, full) for database in self.databases.values()
+        )
+        self._synced_at = started_at
+        if full:
+            self._rescanned_at = started_at
+
+        return count
+
+    def is_stale(self):
+        return (
+            self._synced_at is None
+            or time.monotonic() - self._synced_at >= self.max_age
+        )
+
+    def _refresh(self):
+        try:
+            self.sync()
+        except Exception:
+            log.exception("Cannot sync the mirror.")
+        finally:
+            self._refresh_lock.release()
+
+    def refresh(self):
+        """
+        Start a sync in a background thread if the mirror is stale and no
+        sync is running. Returns whether one was started.
+        """
+        if self.max_age is None or not self.is_stale():
+            return False
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+
+        threading.Thread(target=self._refresh, name="mirror-sync", daemon=True).start()
+        return True
+
+    def is_loaded(self):
+        return self._rescanned_at is not None
+
+    def reset(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM pages")
+            self._connection.execute("DELETE FROM sync_state")
+
+    def get_page_id(self, database: PersistenceLayer, title):
+        if self.max_age is not None:
+            self.refresh()
+            # Rows left on disk by an earlier process may point at archived
+            # pages, the caller asks Notion until the full sync replaced them.
+            if not self.is_loaded():
+                return None
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT page_id FROM pages WHERE database_id = ? AND title = ? LIMIT 1",
+                (database.database_id, title),
+            ).fetchone()
+        return row[0] if row else None
+
+    def add(self, database: PersistenceLayer, title, page_id, last_edited_time=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                (database.database_id, page_id, title, last_edited_time),
+            )
+
+    def remove(self, database: PersistenceLayer, page_id):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM pages WHERE database_id = ? AND page_id = ?",
+                (database.database_id, page_id),
+            )
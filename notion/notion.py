@@ -1,83 +1,523 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import inspect
 import requests
+from requests.adapters import HTTPAdapter
 import json
-import logging
+import threading
+import time
 
-log = logging.getLogger(__name__)
+from notion.calls import record_call
+from notion.scheduler import RequestScheduler, RETRY_STATUSES, get_retry_after
+from telemetry import metrics
+from telemetry.logs import get_logger, payload as log_payload
+from telemetry.tracing import bind_context, traced
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library is the fallback.
+    orjson = None
+
+log = get_logger(__name__)
+
+NOTION_API_BASE = "https://api.notion.com/v1"
+
+REQUEST_SECONDS = metrics.histogram(
+    "notion_request_duration_seconds",
+    "Duration of Notion API round trips by endpoint, pacing and backoff excluded.",
+    ("endpoint",),
+)
+RESPONSES = metrics.counter(
+    "notion_responses_total", "Notion API responses by HTTP status.", ("status",)
+)
+RETRIES = metrics.counter(
+    "notion_retries_total", "Notion API requests retried after a 429 or a 5xx."
+)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(pool_size=10) -> requests.Session:
+    """
+    Return a process-wide keep-alive session for the given pool size.
+
+    Module-level state survives between invocations on a warm Azure Functions
+    worker, so the TCP+TLS connections to api.notion.com are reused.
+    """
+    with _sessions_lock:
+        session = _sessions.get(pool_size)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(
+                {"Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"}
+            )
+            _sessions[pool_size] = session
+            log.info("Create a pooled HTTP session: pool_size=%d", pool_size)
+
+    return session
 
 
 class NotionAPIException(Exception):
     pass
 
-class NotionManager:
-    def __init__(self, token):
+
+def dumps(payload) -> bytes:
+    """
+    Encode a request body straight to UTF-8 bytes, with orjson when it's
+    installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+
+
+def loads(body):
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+def _parse_body(status, text):
+    try:
+        return loads(text)
+    except ValueError:
+        # Gateways answer 502/504 with HTML, keep them in Notion's error shape.
+        return {
+            "object": "error",
+            "status": status,
+            "code": "invalid_response",
+            "message": text[:200],
+        }
+
+
+def _should_retry(status, attempt, max_retries, idempotent):
+    if status not in RETRY_STATUSES or attempt >= max_retries:
+        return False
+    # A 429 is rejected before Notion does anything, so it is always safe.
+    return idempotent or status == 429
+
+
+def api_call(kind):
+    """
+    Trace and count a NotionManager method as one `kind` of Notion API call.
+    Only its round trips to Notion are timed, see `_send`.
+    """
+
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                record_call(kind)
+                return await function(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                record_call(kind)
+                return function(*args, **kwargs)
+
+        return traced(f"notion.{kind}")(wrapper)
+
+    return decorator
+
+
+def _raise_for_error(response):
+    if response["object"] == "error":
+        raise NotionAPIException(
+            f"Response {response['status']}: {response['code']}. {response['message']}"
+        )
+
+
+class BaseNotionManager:
+    """
+    What NotionManager and AsyncNotionManager share: the headers, how every
+    call is built, logged and checked, and when a response is retried. The
+    subclasses only do the I/O.
+    """
+
+    def __init__(
+        self,
+        token,
+        pool_size=10,
+        timeout=(3.05, 30),
+        base_url=NOTION_API_BASE,
+        scheduler: RequestScheduler = None,
+        max_retries=3,
+    ):
         self.header = {
             "Accept": "application/json",
             "Notion-Version": "2022-06-28",
             "content-type": "application/json",
             "Authorization": f"Bearer {token}",
         }
+        self.token = token
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.base_url = base_url.rstrip("/")
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.max_retries = max_retries
 
-        log.info("Create a NotionManager object.")
+    def _get_call(
+        self, kind, method, path, payload, action, idempotent=True, check_error=False
+    ):
+        return {
+            "kind": kind,
+            "method": method,
+            "endpoint": f"{self.base_url}{path}",
+            "payload": payload,
+            "action": action,
+            "idempotent": idempotent,
+            "check_error": check_error,
+        }
 
-    def create(self, payload: dict):
-        endpoint = "https://api.notion.com/v1/pages"
+    def _get_create_call(self, payload):
+        return self._get_call(
+            "create",
+            "POST",
+            "/pages",
+            payload,
+            "creating a page",
+            idempotent=False,
+            check_error=True,
+        )
 
-        log.info(
-            f"Send a HTTP request to {endpoint} for creating a page. Payload is: {payload}"
+    def _get_update_call(self, page_id, payload):
+        return self._get_call(
+            "update", "PATCH", f"/pages/{page_id}", payload, "updating a page"
         )
-        response = requests.post(
-            endpoint, json.dumps(payload), headers=self.header
-        ).json()
-        log.info(f"Receive HTTP response from {endpoint}: {response}")
-
-        if response["object"] == "error":
-            raise NotionAPIException(
-                f"Response {response['status']}: {response['code']}. {response['message']}"
-            )
 
-        return response
+    def _get_delete_call(self, page_id):
+        return self._get_call(
+            "delete",
+            "PATCH",
+            f"/pages/{page_id}",
+            {"archived": True},
+            "deleting a page",
+        )
 
-    def update(self, page_id, payload):
-        endpoint = f"https://api.notion.com/v1/pages/{page_id}"
+    def _get_query_call(self, database_id, payload):
+        return self._get_call(
+            "query",
+            "POST",
+            f"/databases/{database_id}/query",
+            payload,
+            "query pages",
+            check_error=True,
+        )
 
+    def _log_call(self, call):
         log.info(
-            f"Send a HTTP request to {endpoint} for updating a page. Payload is: {payload}"
+            "Send a HTTP request to %s for %s. Payload is: %s",
+            call["endpoint"],
+            call["action"],
+            log_payload(call["payload"]),
         )
-        response = requests.patch(
-            endpoint, json.dumps(payload), headers=self.header
-        ).json()
-        log.info(f"Receive HTTP response from {endpoint}: {response}")
-
-        return response
-
-    def delete(self, page_id):
-        endpoint = f"https://api.notion.com/v1/pages/{page_id}"
-        payload = {"archived": True}
 
+    def _get_result(self, call, response):
         log.info(
-            f"Send a HTTP request to {endpoint} for deleting a page. Payload is: {payload}"
+            "Receive HTTP response from %s: %s",
+            call["endpoint"],
+            log_payload(response),
         )
-        response = requests.patch(
-            endpoint, json.dumps(payload), headers=self.header
-        ).json()
-        log.info(f"Receive HTTP response from {endpoint}: {response}")
+        if call["check_error"]:
+            _raise_for_error(response)
 
         return response
 
-    def query(self, database_id, payload):
-        endpoint = f"https://api.notion.com/v1/databases/{database_id}/query"
+    def _get_retry_delay(self, call, status, headers, attempt):
+        """
+        Return how long to wait before sending the call again, or None when
+        this response is the final one.
+        """
+        RESPONSES.inc(str(status))
+        if status not in RETRY_STATUSES:
+            self.scheduler.on_success()
+            return None
 
+        retry_after = get_retry_after(headers)
+        self.scheduler.on_throttle(retry_after)
+        if not _should_retry(status, attempt, self.max_retries, call["idempotent"]):
+            return None
+        RETRIES.inc()
         log.info(
-            f"Send a HTTP request to {endpoint} for query pages. Payload is: {payload}"
+            "Retry %s %s: attempt=%d", call["method"], call["endpoint"], attempt + 1
         )
-        response = requests.post(
-            endpoint, json.dumps(payload), headers=self.header
-        ).json()
-        log.info(f"Receive HTTP response from {endpoint}: {response}")
-
-        if response["object"] == "error":
-            raise NotionAPIException(
-                f"Response {response['status']}: {response['code']}. {response['message']}"
+        # With a Retry-After the scheduler already holds the queue back.
+        return 0 if retry_after is not None else self.scheduler.get_backoff(attempt)
+
+
+class NotionManager(BaseNotionManager):
+    def __init__(
+        self,
+        token,
+        pool_size=10,
+        timeout=(3.05, 30),
+        session: requests.Session = None,
+        base_url=NOTION_API_BASE,
+        scheduler: RequestScheduler = None,
+        max_retries=3,
+        async_session: "aiohttp.ClientSession" = None,
+    ):
+        super().__init__(token, pool_size, timeout, base_url, scheduler, max_retries)
+        self.session = session if session is not None else get_session(pool_size)
+        self.async_session = async_session
+        self._aio = None
+
+        log.info("Create a NotionManager object.")
+
+    @property
+    def aio(self) -> "AsyncNotionManager":
+        """
+        The asyncio counterpart sharing this manager's token and settings.
+        A requests session can't serve aiohttp calls, so `session` is not
+        shared: pass `async_session` to inject the aiohttp one as well.
+        """
+        if self._aio is None:
+            self._aio = AsyncNotionManager(
+                self.token,
+                pool_size=self.pool_size,
+                timeout=self.timeout,
+                session=self.async_session,
+                base_url=self.base_url,
+                scheduler=self.scheduler,
+                max_retries=self.max_retries,
             )
+        return self._aio
+
+    def _send(self, call, timeout=None):
+        self._log_call(call)
+        data = dumps(call["payload"])
+
+        for attempt in range(self.max_retries + 1):
+            self.scheduler.acquire()
+            with REQUEST_SECONDS.time(call["kind"]):
+                response = self.session.request(
+                    call["method"],
+                    call["endpoint"],
+                    data=data,
+                    headers=self.header,
+                    timeout=timeout if timeout is not None else self.timeout,
+                )
+            delay = self._get_retry_delay(
+                call, response.status_code, response.headers, attempt
+            )
+            if delay is None:
+                break
+            if delay:
+                time.sleep(delay)
+
+        return self._get_result(call, _parse_body(response.status_code, response.text))
+
+    @api_call("create")
+    def create(self, payload: dict, timeout=None):
+        return self._send(self._get_create_call(payload), timeout)
+
+    @api_call("update")
+    def update(self, page_id, payload, timeout=None):
+        return self._send(self._get_update_call(page_id, payload), timeout)
+
+    @api_call("delete")
+    def delete(self, page_id, timeout=None):
+        return self._send(self._get_delete_call(page_id), timeout)
+
+    @api_call("query")
+    def query_database(self, database_id, payload, timeout=None):
+        """
+        Query a database and return the whole response, including
+        `has_more` and `next_cursor`.
+        """
+        return self._send(self._get_query_call(database_id, payload), timeout)
+
+    def query(self, database_id, payload, timeout=None):
+        return self.query_database(database_id, payload, timeout)["results"]
+
+    def query_iter(
+        self, database_id, payload=None, page_size=100, prefetch=False, timeout=None
+    ):
+        """
+        Yield every page matching the query, following `next_cursor` until
+        Notion reports no more results. Only one response is held in memory.
+        With `prefetch`, the next response is requested in a background
+        thread while the caller consumes the current one.
+        """
+        payload = dict(payload or {}, page_size=page_size)
+
+        if not prefetch:
+            while True:
+                response = self.query_database(database_id, payload, timeout)
+                yield from response["results"]
+                if not response.get("has_more"):
+                    return
+                payload = dict(payload, start_cursor=response["next_cursor"])
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            query_database = bind_context(self.query_database)
+            future = pool.submit(query_database, database_id, payload, timeout)
+            try:
+                while future is not None:
+                    response = future.result()
+                    future = None
+                    if response.get("has_more"):
+                        payload = dict(payload, start_cursor=response["next_cursor"])
+                        future = pool.submit(
+                            query_database, database_id, payload, timeout
+                        )
+                    yield from response["results"]
+            finally:
+                if future is not None:
+                    future.cancel()
+
+
+class AsyncNotionManager(BaseNotionManager):
+    """
+    asyncio version of NotionManager with the same create/update/delete/query
+    surface. The aiohttp session is created lazily inside the running event
+    loop and reused by every call made from that loop. aiohttp itself is only
+    imported then, which keeps it out of the cold start of sync callers.
+    """
+
+    def __init__(
+        self,
+        token,
+        pool_size=10,
+        timeout=(3.05, 30),
+        session: "aiohttp.ClientSession" = None,
+        base_url=NOTION_API_BASE,
+        scheduler: RequestScheduler = None,
+        max_retries=3,
+    ):
+        super().__init__(token, pool_size, timeout, base_url, scheduler, max_retries)
+        self.session = session
+        self._session_loop = None
+        self._session_closer = None
+
+        log.info("Create a AsyncNotionManager object.")
+
+    def _client_timeout(self, timeout):
+        import aiohttp
+
+        timeout = timeout if timeout is not None else self.timeout
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        return aiohttp.ClientTimeout(total=timeout)
+
+    async def _close_with_loop(self, session):
+        # asyncio.run() cancels the tasks left when its coroutine returns, so
+        # the session is closed on its own loop before that loop goes away.
+        try:
+            await asyncio.get_running_loop().create_future()
+        finally:
+            await session.close()
+
+    def _release_session(self):
+        """
+        Drop a session made on another event loop. It can only be closed on
+        that loop: asyncio.run() already did it, a loop still running in
+        another thread is asked to.
+        """
+        if not self.session.closed and self._session_loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.session.close(), self._session_loop)
+        self.session = None
+        self._session_loop = None
+        self._session_closer = None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        if self._session_loop is not None and self._session_loop is not loop:
+            self._release_session()
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+            self._session_closer = loop.create_task(self._close_with_loop(self.session))
+            log.info("Create a pooled aiohttp session: pool_size=%d", self.pool_size)
+
+        return self.session
+
+    async def connect(self, timeout=None):
+        """
+        Open a pooled connection to Notion before the first call, e.g. from a
+        warmup trigger. Any answer will do, the request only sets up TCP and
+        TLS, so it isn't paced or counted as an API call.
+        """
+        session = self._get_session()
+        async with session.head(
+            self.base_url, timeout=self._client_timeout(timeout)
+        ) as response:
+            log.info("Connect to %s: status=%s", self.base_url, response.status)
+
+    async def close(self):
+        if self._session_closer is not None:
+            self._session_closer.cancel()
+            self._session_closer = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+            self._session_loop = None
+
+    async def _send(self, call, timeout=None):
+        self._log_call(call)
+        session = self._get_session()
+        data = dumps(call["payload"])
+
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire_async()
+            with REQUEST_SECONDS.time(call["kind"]):
+                async with session.request(
+                    call["method"],
+                    call["endpoint"],
+                    data=data,
+                    headers=self.header,
+                    timeout=self._client_timeout(timeout),
+                ) as response:
+                    status = response.status
+                    headers = response.headers
+                    text = await response.text()
+
+            delay = self._get_retry_delay(call, status, headers, attempt)
+            if delay is None:
+                break
+            if delay:
+                await asyncio.sleep(delay)
+
+        return self._get_result(call, _parse_body(status, text))
+
+    @api_call("create")
+    async def create(self, payload: dict, timeout=None):
+        return await self._send(self._get_create_call(payload), timeout)
+
+    @api_call("update")
+    async def update(self, page_id, payload, timeout=None):
+        return await self._send(self._get_update_call(page_id, payload), timeout)
+
+    @api_call("delete")
+    async def delete(self, page_id, timeout=None):
+        return await self._send(self._get_delete_call(page_id), timeout)
+
+    @api_call("query")
+    async def query_database(self, database_id, payload, timeout=None):
+        return await self._send(self._get_query_call(database_id, payload), timeout)
+
+    async def query(self, database_id, payload, timeout=None):
+        return (await self.query_database(database_id, payload, timeout))["results"]
+
+    async def query_iter(self, database_id, payload=None, page_size=100, timeout=None):
+        payload = dict(payload or {}, page_size=page_size)
 
-        return response["results"]
+        while True:
+            response = await self.query_database(database_id, payload, timeout)
+            for page in response["results"]:
+                yield page
+            if not response.get("has_more"):
+                return
+            payload = dict(payload, start_cursor=response["next_cursor"])
@@ -1,7 +1,25 @@
 from notion.property import NotionProperty
 
 
+def format_properties(properties: list) -> dict:
+    """
+    Write the `properties` object of a page in one pass, skipping the
+    properties without a value.
+    """
+    formatted = {}
+    for property_object in properties:
+        assert isinstance(property_object, NotionProperty)
+        if property_object.value:
+            formatted[property_object.notion_column_name] = (
+                property_object._format_value()
+            )
+
+    return formatted
+
+
 class NotionPage:
+    __slots__ = ("database_id", "cover_url", "icon_emoji", "icon_url", "properties")
+
     def __init__(
         self, database_id, properties: list, cover_url="", icon_emoji="", icon_url=""
     ):
@@ -17,42 +35,33 @@ class NotionPage:
     def _format_cover(self):
         cover = None
         if self.cover_url:
-            cover = {"cover": {"external": {"url": self.cover_url}}}
+            cover = {"external": {"url": self.cover_url}}
 
         return cover
 
     def _format_icon(self):
         icon = None
         if self.icon_url:
-            icon = {"icon": {"external": {"url": self.icon_url}}}
+            icon = {"external": {"url": self.icon_url}}
         elif self.icon_emoji:
-            icon = {"icon": {"emoji": self.icon_emoji}}
+            icon = {"emoji": self.icon_emoji}
 
         return icon
 
     def _format_properties(self):
-        properties = {}
-        for property_object in self.properties:
-            assert isinstance(property_object, NotionProperty)
-            property_dict = property_object.get_dict()
-            if property_dict:
-                properties.update(property_dict)
-
-        return properties
+        return format_properties(self.properties)
 
     def get_notion_page_object(self):
-        properties = self._format_properties()
-        cover = self._format_cover()
-        icon = self._format_icon()
-
         page_object = {
             "parent": {"database_id": self.database_id},
-            "properties": properties,
+            "properties": self._format_properties(),
         }
 
+        cover = self._format_cover()
         if cover:
-            page_object.update(cover)
+            page_object["cover"] = cover
+        icon = self._format_icon()
         if icon:
-            page_object.update(icon)
+            page_object["icon"] = icon
 
         return page_object
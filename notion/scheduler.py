@@ -0,0 +1,142 @@
+import asyncio
+import random
+import threading
+import time
+
+from telemetry.logs import get_logger
+
+log = get_logger(__name__)
+
+# Statuses that mean "slow down and try again" rather than a bad request.
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+def get_retry_after(headers):
+    """
+    Parse a Retry-After header given in seconds. HTTP dates are not used by
+    Notion and are ignored.
+    """
+    value = headers.get("Retry-After")
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RequestScheduler:
+    """
+    A token bucket pacing every request sent with one Notion integration.
+
+    Callers reserve a token before sending. When the bucket is empty the
+    reservation goes into debt and the caller sleeps until its turn, so
+    concurrent callers are served in order without busy waiting. The refill
+    rate adapts with AIMD: it grows by `increase` after every successful
+    call and is multiplied by `decrease` on a throttled one. A Retry-After
+    pushes the whole queue back by that many seconds.
+    """
+
+    def __init__(
+        self,
+        rate=3.0,
+        burst=3,
+        min_rate=0.5,
+        max_rate=None,
+        increase=0.05,
+        decrease=0.5,
+        clock=time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.increase = increase
+        self.decrease = decrease
+        self.clock = clock
+
+        self.queue_depth = 0
+        self.total_wait_time = 0.0
+        self.last_wait_time = 0.0
+        self.throttled = 0
+
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        """
+        Take a token and return how many seconds the caller must wait
+        before sending its request.
+        """
+        with self._lock:
+            self._refill(self.clock())
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+            self.last_wait_time = wait
+            self.total_wait_time += wait
+
+        return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            with self._lock:
+                self.queue_depth += 1
+            try:
+                time.sleep(wait)
+            finally:
+                with self._lock:
+                    self.queue_depth -= 1
+
+        return wait
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait > 0:
+            with self._lock:
+                self.queue_depth += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                with self._lock:
+                    self.queue_depth -= 1
+
+        return wait
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self._refill(self.clock())
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            if retry_after:
+                self._tokens = min(self._tokens, -retry_after * self.rate)
+
+        log.warning(
+            "Notion throttled the request: rate=%.2f/s retry_after=%s",
+            self.rate,
+            retry_after,
+        )
+
+    def get_backoff(self, attempt, base=0.5, cap=8.0):
+        """
+        Full-jitter exponential backoff for the given retry attempt.
+        """
+        return random.uniform(0, min(cap, base * 2**attempt))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "queue_depth": self.queue_depth,
+                "last_wait_time": self.last_wait_time,
+                "total_wait_time": self.total_wait_time,
+                "throttled": self.throttled,
+            }
@@ -0,0 +1,156 @@
+"""
+A thin facade over the standard logging module for the hot path.
+
+- Messages use %-style arguments and are only formatted when a handler
+  actually emits the record.
+- `payload()` wraps request/response bodies, page data or HTML so they are
+  serialized lazily, truncated to LOG_PAYLOAD_LIMIT characters and
+  stripped of secrets (Authorization headers, Notion tokens).
+- INFO and DEBUG records can be sampled per logger with LOG_SAMPLE_RATE
+  (default for every logger) and LOG_SAMPLE_RATES, e.g.
+  "notion.notion=0.01,extractor=0.1". The longest matching logger prefix
+  wins. Warnings and errors are never sampled.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+
+SENSITIVE_KEYS = ("authorization", "token", "password", "secret", "cookie", "api_key")
+
+# Bearer headers and Notion integration tokens ("secret_..." / "ntn_...").
+SECRET_PATTERN = re.compile(r"(Bearer\s+)[\w\-.]+|\b(?:secret|ntn)_\w+")
+
+REDACTED = "***"
+
+
+def redact(text: str) -> str:
+    return SECRET_PATTERN.sub(
+        lambda match: f"{match.group(1)}{REDACTED}" if match.group(1) else REDACTED,
+        text,
+    )
+
+
+def _redact_keys(value):
+    if isinstance(value, dict):
+        return {
+            key: (
+                REDACTED
+                if isinstance(key, str) and key.lower() in SENSITIVE_KEYS
+                else _redact_keys(item)
+            )
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_redact_keys(item) for item in value]
+    return value
+
+
+def get_payload_limit():
+    return int(os.getenv("LOG_PAYLOAD_LIMIT", "500"))
+
+
+class Payload:
+    """
+    A value logged as a message argument. Nothing is serialized until the
+    record is emitted.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        value = self.value
+        if isinstance(value, (dict, list, tuple)):
+            text = json.dumps(_redact_keys(value), ensure_ascii=False, default=str)
+        else:
+            text = str(value)
+
+        limit = self.limit if self.limit is not None else get_payload_limit()
+        if len(text) > limit:
+            text = f"{text[:limit]}... ({len(text) - limit} more chars)"
+        return redact(text)
+
+    __repr__ = __str__
+
+
+def payload(value, limit=None) -> Payload:
+    return Payload(value, limit)
+
+
+class LazyMessage:
+    """
+    The message of a record, formatted and redacted on first use.
+    """
+
+    __slots__ = ("msg", "args", "_text")
+
+    def __init__(self, msg, args):
+        self.msg = msg
+        self.args = args
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            text = str(self.msg)
+            if self.args:
+                text = text % self.args
+            self._text = redact(text)
+        return self._text
+
+
+def _parse_sample_rates(value):
+    rates = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def get_sample_rate(name):
+    rates = _parse_sample_rates(os.getenv("LOG_SAMPLE_RATES"))
+    prefixes = [
+        prefix for prefix in rates if name == prefix or name.startswith(f"{prefix}.")
+    ]
+    if prefixes:
+        return rates[max(prefixes, key=len)]
+    return float(os.getenv("LOG_SAMPLE_RATE", "1"))
+
+
+class Logger(logging.LoggerAdapter):
+    """
+    Drop-in for logging.Logger that samples INFO/DEBUG records and defers
+    formatting and redaction until a record is emitted.
+    """
+
+    def __init__(self, logger: logging.Logger, sample_rate=1.0):
+        super().__init__(logger, {})
+        self.sample_rate = sample_rate
+        self.dropped = 0
+
+    def _is_sampled_out(self, level):
+        if level >= logging.WARNING or self.sample_rate >= 1:
+            return False
+        if random.random() < self.sample_rate:
+            return False
+        self.dropped += 1
+        return True
+
+    def log(self, level, msg, *args, **kwargs):
+        if not self.isEnabledFor(level) or self._is_sampled_out(level):
+            return
+        # Point the record at the caller instead of this facade.
+        kwargs["stacklevel"] = kwargs.get("stacklevel", 1) + 1
+        self.logger.log(level, LazyMessage(msg, args), **kwargs)
+
+
+def get_logger(name, sample_rate=None) -> Logger:
+    if sample_rate is None:
+        sample_rate = get_sample_rate(name)
+    return Logger(logging.getLogger(name), sample_rate)
@@ -0,0 +1,266 @@
+"""
+Process-wide counters and histograms, rendered in the Prometheus text format.
+
+Recording takes no lock: every thread writes to its own shard of a metric
+and the shards are only summed when the metrics are rendered. The shard of a
+finished thread is folded into the metric's retired totals, so short-lived
+pool threads don't pile up.
+
+Metrics are declared where they are recorded, with the module-level
+`counter` and `histogram` helpers. Declaring the same name twice returns the
+existing metric. Values that components already count themselves (e.g.
+cache hits) are exposed with `callback`, which reads them at scrape time.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import functools
+import inspect
+import threading
+import time
+import weakref
+
+# Latency buckets in seconds, from a cache hit to a slow upstream page.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = [*zip(labelnames, labels), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Shard:
+    """
+    The values one thread recorded, keyed by label values. Only the
+    owning thread writes to it.
+    """
+
+    __slots__ = ("values", "__weakref__")
+
+    def __init__(self):
+        self.values = {}
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        # id(shard) -> values of the live threads.
+        self._shards = {}
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _get_values(self) -> dict:
+        try:
+            return self._local.shard.values
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards[id(shard)] = shard.values
+            weakref.finalize(shard, self._retire, id(shard), shard.values)
+            return shard.values
+
+    def _retire(self, shard_id, values):
+        with self._lock:
+            del self._shards[shard_id]
+            for labels, value in values.items():
+                self._retired[labels] = self._merge(self._retired.get(labels), value)
+
+    def _merge(self, total, value):
+        raise NotImplementedError("Classes inherit Metric must implement _merge.")
+
+    def collect(self) -> dict:
+        """
+        Sum the shards, label values -> value.
+        """
+        with self._lock:
+            # dict.copy holds the GIL, the owning thread can't change it midway.
+            shards = [values.copy() for values in self._shards.values()]
+            totals = {
+                labels: self._merge(None, value)
+                for labels, value in self._retired.items()
+            }
+
+        for values in shards:
+            for labels, value in values.items():
+                totals[labels] = self._merge(totals.get(labels), value)
+
+        return totals
+
+    def _render_samples(self, totals):
+        for labels, value in sorted(totals.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples(self.collect()))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels):
+        values = self._get_values()
+        values[labels] = values.get(labels, 0) + 1
+
+    def add(self, amount, *labels):
+        values = self._get_values()
+        values[labels] = values.get(labels, 0) + amount
+
+    def _merge(self, total, value):
+        return value if total is None else total + value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        values = self._get_values()
+        counts = values.get(labels)
+        if counts is None:
+            # One count per bucket and +Inf, then the sum and the count.
+            counts = values[labels] = [0] * (len(self.buckets) + 3)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def _render_samples(self, totals):
+        for labels, counts in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = (("le", _format_value(float(bound))),)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            suffix = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{suffix} {_format_value(counts[-2])}"
+            yield f"{self.name}_count{suffix} {counts[-1]}"
+
+
+class Callback(Metric):
+    """
+    A metric whose values are read from `function` at scrape time. The
+    function returns a number, or a dict of label values -> number.
+    """
+
+    def __init__(self, name, help, kind, function, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.function = function
+
+    def collect(self):
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return {labels: value for labels, value in values.items() if value is not None}
+
+
+def timed(histogram: Histogram, *labels):
+    """
+    Decorator observing the duration of every call of a function or
+    coroutine function.
+    """
+
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with histogram.time(*labels):
+                    return await function(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with histogram.time(*labels):
+                    return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_class, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            assert isinstance(
+                metric, metric_class
+            ), f"Metric {name} is already a {metric.kind}."
+            return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(
+        self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def callback(self, name, help, function, kind="counter", labelnames=()) -> Callback:
+        """
+        Register (or replace) a metric read from `function` at scrape time.
+        """
+        with self._lock:
+            metric = self._metrics[name] = Callback(
+                name, help, kind, function, labelnames
+            )
+            return metric
+
+    def get(self, name) -> Metric:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return "".join(f"{metric.render()}\n" for metric in metrics)
+
+
+registry = MetricRegistry()
+counter = registry.counter
+histogram = registry.histogram
+callback = registry.callback
@@ -0,0 +1,343 @@
+"""
+Lightweight spans for the request path.
+
+A trace is opened per invocation with `tracer.trace(name)`. Inside it,
+`span(name)` and the `traced(name)` decorator record child spans with their
+parent, start time and wall-clock duration. The current span lives in a
+context variable, so asyncio tasks and `asyncio.to_thread` calls attach to
+the right parent; use `bind_context` to carry it into other thread pools.
+Outside a trace, spans cost one context variable lookup and record nothing.
+
+A finished trace can be summarized as a Server-Timing header and is handed to
+the tracer's exporters. OTLPExporter posts it as OTLP/JSON to an
+OpenTelemetry collector, configured with the standard
+OTEL_EXPORTER_OTLP_ENDPOINT (or OTEL_EXPORTER_OTLP_TRACES_ENDPOINT) and
+OTEL_SERVICE_NAME settings. Set TRACING_ENABLED=false to turn traces off.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import time
+
+import requests
+
+from telemetry.logs import get_logger
+
+log = get_logger(__name__)
+
+SERVICE_NAME = "notion-knowledge-base"
+
+# OTLP span kinds and status codes.
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = (
+        "trace",
+        "name",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "error",
+        "_start_counter",
+    )
+
+    def __init__(self, trace: "Trace", name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._start_counter = time.perf_counter_ns()
+
+    @property
+    def duration_ms(self):
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        # Durations come from the monotonic clock, the start from the wall clock.
+        self.end_ns = self.start_ns + time.perf_counter_ns() - self._start_counter
+        self.trace.spans.append(self)
+
+
+class Trace:
+    """
+    The spans of one invocation. `root` is the span opened by Tracer.trace,
+    `spans` holds every finished span, children before their parents.
+    """
+
+    def __init__(self, name, attributes=None):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans = []
+        self.root = Span(self, name, attributes=attributes)
+
+    def server_timing(self) -> str:
+        """
+        Sum the finished spans by name, e.g.
+        `total;dur=912.4, DoubanBookExtractor.fetch;dur=640.2,
+        notion.query;desc="x3";dur=201.7`.
+        """
+        totals = {}
+        for span in sorted(self.spans, key=lambda span: span.start_ns):
+            if span is self.root:
+                continue
+            count, duration = totals.get(span.name, (0, 0.0))
+            totals[span.name] = (count + 1, duration + span.duration_ms)
+
+        metrics = []
+        if self.root.end_ns is not None:
+            metrics.append(f"total;dur={self.root.duration_ms:.1f}")
+        for name, (count, duration) in totals.items():
+            desc = f';desc="x{count}"' if count > 1 else ""
+            metrics.append(f"{name}{desc};dur={duration:.1f}")
+
+        return ", ".join(metrics)
+
+    def to_otlp(self, service_name=SERVICE_NAME) -> dict:
+        """
+        The trace as an OTLP/JSON ExportTraceServiceRequest.
+        """
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _format_attributes({"service.name": service_name})
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [self._format_span(span) for span in self.spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def _format_span(self, span: Span):
+        span_object = {
+            "traceId": self.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": SPAN_KIND_SERVER if span is self.root else SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _format_attributes(span.attributes),
+        }
+        if span.parent_id:
+            span_object["parentSpanId"] = span.parent_id
+        if span.error:
+            span_object["status"] = {"code": STATUS_ERROR, "message": span.error}
+
+        return span_object
+
+
+def _format_attributes(attributes):
+    formatted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            value = {"boolValue": value}
+        elif isinstance(value, int):
+            value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            value = {"doubleValue": value}
+        else:
+            value = {"stringValue": str(value)}
+        formatted.append({"key": key, "value": value})
+
+    return formatted
+
+
+@contextmanager
+def _activate(span: Span):
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def get_current_span() -> Span:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Record a child of the current span. Yields None outside a trace.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    with _activate(Span(parent.trace, name, parent.span_id, attributes)) as child:
+        yield child
+
+
+def traced(name):
+    """
+    Decorator recording a span around every call of a function or coroutine
+    function.
+    """
+
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_methods(cls, names):
+    """
+    Wrap the methods `names` defined by `cls` itself in spans named
+    "<class>.<method>". Meant for `__init_subclass__` of base classes.
+    """
+    for name in names:
+        function = cls.__dict__.get(name)
+        if function is None or getattr(function, "__isabstractmethod__", False):
+            continue
+        setattr(cls, name, traced(f"{cls.__name__}.{name}")(function))
+
+
+def bind_context(function):
+    """
+    Make `function` run in the current context, e.g. to keep the parent span
+    of work handed to a ThreadPoolExecutor.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time.
+        return context.copy().run(function, *args, **kwargs)
+
+    return wrapper
+
+
+class InMemoryExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace: Trace):
+        self.traces.append(trace)
+
+
+class OTLPExporter:
+    """
+    Post finished traces as OTLP/JSON to an OpenTelemetry collector. Exports
+    run in a background thread so they never delay a response.
+    """
+
+    def __init__(self, endpoint, service_name=SERVICE_NAME, headers=None, timeout=5):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.headers = dict(headers or {}, **{"content-type": "application/json"})
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+    def export(self, trace: Trace):
+        self._pool.submit(self._post, trace.to_otlp(self.service_name))
+
+    def _post(self, body):
+        try:
+            response = requests.post(
+                self.endpoint,
+                data=json.dumps(body),
+                headers=self.headers,
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except Exception:
+            log.exception("Cannot export trace to %s", self.endpoint)
+
+
+def _parse_headers(value):
+    headers = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            key, header = item.split("=", 1)
+            headers[key.strip()] = header.strip()
+    return headers
+
+
+def get_default_exporters():
+    endpoint = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")
+    if not endpoint and os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        endpoint = f"{os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT').rstrip('/')}/v1/traces"
+    if not endpoint:
+        return []
+
+    return [
+        OTLPExporter(
+            endpoint,
+            service_name=os.getenv("OTEL_SERVICE_NAME", SERVICE_NAME),
+            headers=_parse_headers(os.getenv("OTEL_EXPORTER_OTLP_HEADERS")),
+        )
+    ]
+
+
+class Tracer:
+    def __init__(self, exporters=(), enabled=True):
+        self.exporters = list(exporters)
+        self.enabled = enabled
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """
+        Open a trace whose root span covers the block. Yields None when
+        tracing is disabled.
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        trace = Trace(name, attributes)
+        try:
+            with _activate(trace.root):
+                yield trace
+        finally:
+            for exporter in self.exporters:
+                exporter.export(trace)
+
+
+tracer = Tracer(
+    get_default_exporters(),
+    enabled=os.getenv("TRACING_ENABLED", "true").lower() == "true",
+)
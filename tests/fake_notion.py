@@ -0,0 +1,177 @@
+"""
+An in-memory Notion API for tests and benchmarks, enough for the commands:
+create, update and archive pages, and query a database by title (`equals`
+conditions, alone or under `or`/`and`). `FakeNotion.session` and
+`FakeNotion.async_session` stand in for the HTTP sessions of NotionManager
+and AsyncNotionManager, so the whole client runs without a network.
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+
+
+def get_plain_text(property_value):
+    for key in ("title", "rich_text"):
+        if key in property_value:
+            return "".join(text["plain_text"] for text in property_value[key])
+    return None
+
+
+def matches(page, filter):
+    if "or" in filter:
+        return any(matches(page, condition) for condition in filter["or"])
+    if "and" in filter:
+        return all(matches(page, condition) for condition in filter["and"])
+
+    property_value = page["properties"].get(filter["property"])
+    if property_value is None:
+        return False
+    condition = filter.get("rich_text") or filter.get("title")
+    return get_plain_text(property_value) == condition["equals"]
+
+
+class FakeNotion:
+    def __init__(self):
+        self.databases = {}
+        self.pages = {}
+        self.requests = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _to_page_properties(self, properties):
+        page_properties = {}
+        for name, value in properties.items():
+            value = dict(value)
+            for key in ("title", "rich_text"):
+                if key in value:
+                    value[key] = [
+                        dict(text, plain_text=text["text"]["content"])
+                        for text in value[key]
+                    ]
+            page_properties[name] = value
+        return page_properties
+
+    def _create(self, body):
+        page = {
+            "object": "page",
+            "id": f"page-{next(self._ids)}",
+            "archived": False,
+            "parent": body["parent"],
+            "properties": self._to_page_properties(body["properties"]),
+        }
+        self.pages[page["id"]] = page
+        self.databases.setdefault(body["parent"]["database_id"], []).append(page)
+        return 200, page
+
+    def _update(self, page_id, body):
+        page = self.pages.get(page_id)
+        if page is None:
+            return 404, {
+                "object": "error",
+                "status": 404,
+                "code": "object_not_found",
+                "message": page_id,
+            }
+        page["properties"].update(self._to_page_properties(body.get("properties", {})))
+        page["archived"] = body.get("archived", page["archived"])
+        return 200, page
+
+    def _query(self, database_id, body):
+        results = [
+            page
+            for page in self.databases.get(database_id, [])
+            if not page["archived"]
+            and ("filter" not in body or matches(page, body["filter"]))
+        ]
+        start = int(body.get("start_cursor") or 0)
+        end = start + body.get("page_size", 100)
+        return 200, {
+            "object": "list",
+            "results": results[start:end],
+            "has_more": end < len(results),
+            "next_cursor": str(end) if end < len(results) else None,
+        }
+
+    def handle(self, method, path, body):
+        """
+        Answer one API call, `path` is relative to the API base URL.
+        Returns (status, response object).
+        """
+        parts = path.strip("/").split("/")
+        with self._lock:
+            self.requests.append((method, path))
+            if method == "POST" and parts == ["pages"]:
+                return self._create(body)
+            if method == "PATCH" and parts[0] == "pages":
+                return self._update(parts[1], body)
+            if method == "POST" and parts[0] == "databases" and parts[2] == "query":
+                return self._query(parts[1], body)
+        return 400, {
+            "object": "error",
+            "status": 400,
+            "code": "invalid_request_url",
+            "message": path,
+        }
+
+    def session(self, base_url):
+        return FakeSession(self, base_url)
+
+    def async_session(self, base_url):
+        return FakeAsyncSession(self, base_url)
+
+
+class FakeResponse:
+    def __init__(self, status, body):
+        self.status_code = status
+        self.text = json.dumps(body)
+        self.headers = {}
+
+
+class FakeSession:
+    """
+    Stands in for the requests.Session of a NotionManager.
+    """
+
+    def __init__(self, notion: FakeNotion, base_url):
+        self.notion = notion
+        self.base_url = base_url
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        status, body = self.notion.handle(
+            method, url[len(self.base_url) :], json.loads(data)
+        )
+        return FakeResponse(status, body)
+
+
+class FakeAsyncResponse:
+    def __init__(self, status, body):
+        self.status = status
+        self.headers = {}
+        self._text = json.dumps(body)
+
+    async def __aenter__(self):
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def text(self):
+        return self._text
+
+
+class FakeAsyncSession(FakeSession):
+    """
+    Stands in for the aiohttp.ClientSession of an AsyncNotionManager.
+    """
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        status, body = self.notion.handle(
+            method, url[len(self.base_url) :], json.loads(data)
+        )
+        return FakeAsyncResponse(status, body)
+
+    async def close(self):
+        pass
@@ -0,0 +1,238 @@
+import asyncio
+import json
+
+import pytest
+
+from logic.commands import (
+    AsyncCreateSourceCommand,
+    AsyncGetPersonIDCommand,
+    AsyncGetSourceIDCommand,
+)
+from notion.database import PersonDatabase, PodcastDatabase, SourceDatabase
+from notion.mirror import NotionMirror
+from notion.notion import (
+    NOTION_API_BASE,
+    REQUEST_SECONDS,
+    AsyncNotionManager,
+    NotionAPIException,
+    NotionManager,
+)
+from notion.scheduler import RequestScheduler
+from tests.fake_notion import FakeNotion
+
+
+class FakeAsyncResponse:
+    def __init__(self, status, body, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self._text = json.dumps(body) if isinstance(body, dict) else body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def text(self):
+        return self._text
+
+
+class FakeAsyncSession:
+    """
+    Answers the requests of an AsyncNotionManager with scripted responses.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def request(self, method, endpoint, data=None, **kwargs):
+        self.requests.append((method, endpoint, json.loads(data)))
+        return self.responses.pop(0)
+
+    def head(self, endpoint, **kwargs):
+        self.requests.append(("HEAD", endpoint, None))
+        return self.responses.pop(0)
+
+
+THROTTLED = FakeAsyncResponse(
+    429,
+    {"object": "error", "status": 429, "code": "rate_limited", "message": "Slow down"},
+    {"Retry-After": "0"},
+)
+BAD_GATEWAY = FakeAsyncResponse(502, "<html>Bad Gateway</html>")
+PAGE = FakeAsyncResponse(200, {"object": "page", "id": "page-id"})
+
+
+def get_results(results, next_cursor=None):
+    return FakeAsyncResponse(
+        200,
+        {
+            "object": "list",
+            "results": results,
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor,
+        },
+    )
+
+
+class TestAsyncNotionManager:
+    def get_notion(self, responses):
+        self.session = FakeAsyncSession(responses)
+        scheduler = RequestScheduler(rate=1000, burst=1000)
+        scheduler.get_backoff = lambda attempt: 0
+        return NotionManager(
+            "token",
+            base_url="http://localhost/v1/",
+            scheduler=scheduler,
+            async_session=self.session,
+        )
+
+    def test_shares_settings(self):
+        notion = self.get_notion([])
+        assert notion.aio is notion.aio
+        assert notion.aio.session is self.session
+        assert notion.aio.base_url == "http://localhost/v1"
+        assert notion.aio.scheduler is notion.scheduler
+        assert notion.aio.header == notion.header
+
+    def test_create(self):
+        notion = self.get_notion([PAGE])
+        assert asyncio.run(notion.aio.create({"properties": {}}))["id"] == "page-id"
+        assert self.session.requests == [
+            ("POST", "http://localhost/v1/pages", {"properties": {}})
+        ]
+
+    def test_retry_on_429(self):
+        notion = self.get_notion([THROTTLED, THROTTLED, PAGE])
+        assert asyncio.run(notion.aio.create({}))["id"] == "page-id"
+        assert len(self.session.requests) == 3
+
+    def test_create_is_not_retried_on_502(self):
+        notion = self.get_notion([BAD_GATEWAY, PAGE])
+        with pytest.raises(NotionAPIException):
+            asyncio.run(notion.aio.create({}))
+        assert len(self.session.requests) == 1
+
+    def test_query_is_retried_on_502(self):
+        notion = self.get_notion([BAD_GATEWAY, get_results([])])
+        assert asyncio.run(notion.aio.query("database", {})) == []
+        assert len(self.session.requests) == 2
+
+    def test_query_iter_follows_cursor(self):
+        notion = self.get_notion(
+            [get_results([{"id": "1"}, {"id": "2"}], "2"), get_results([{"id": "3"}])]
+        )
+
+        async def collect():
+            return [page["id"] async for page in notion.aio.query_iter("database")]
+
+        assert asyncio.run(collect()) == ["1", "2", "3"]
+        assert [body for _, _, body in self.session.requests] == [
+            {"page_size": 100},
+            {"page_size": 100, "start_cursor": "2"},
+        ]
+
+    def test_only_round_trips_are_timed(self):
+        notion = self.get_notion([THROTTLED, PAGE])
+
+        async def acquire_async():
+            await asyncio.sleep(0.05)
+
+        notion.scheduler.acquire_async = acquire_async
+        before = REQUEST_SECONDS.collect().get(("create",), [0] * 3)
+        asyncio.run(notion.aio.create({}))
+        after = REQUEST_SECONDS.collect()[("create",)]
+
+        assert after[-1] - before[-1] == 2
+        assert after[-2] - before[-2] < 0.05
+
+    def test_connect(self):
+        notion = self.get_notion([FakeAsyncResponse(400, "")])
+        asyncio.run(notion.aio.connect())
+        assert self.session.requests == [("HEAD", "http://localhost/v1", None)]
+
+    def test_session_is_closed_with_its_loop(self):
+        notion = AsyncNotionManager("token")
+
+        async def get_session():
+            return notion._get_session()
+
+        first = asyncio.run(get_session())
+        second = asyncio.run(get_session())
+
+        assert first.closed
+        assert second is not first
+        assert second.closed
+
+
+class TestAsyncCommands:
+    def setup_method(self, test_method):
+        self.fake = FakeNotion()
+        notion = NotionManager(
+            "secret_test",
+            session=self.fake.session(NOTION_API_BASE),
+            scheduler=RequestScheduler(rate=1000, burst=1000),
+            async_session=self.fake.async_session(NOTION_API_BASE),
+        )
+        self.source_database = SourceDatabase(notion, "source-database")
+        self.person_database = PersonDatabase(notion, "person-database")
+        self.podcast_database = PodcastDatabase(notion, "podcast-database")
+
+    def test_get_source_id(self):
+        command = AsyncGetSourceIDCommand(self.source_database)
+
+        async def run():
+            return [await command.execute({"title": "思维课"}) for _ in range(2)]
+
+        first, second = asyncio.run(run())
+        assert first == second
+        assert len(self.fake.databases["source-database"]) == 1
+
+    def test_get_person_id(self):
+        page = self.person_database.create_page({"name": "张三"})
+        command = AsyncGetPersonIDCommand(self.person_database)
+
+        assert asyncio.run(command.execute({"name": "张三"})) == page["id"]
+        assert len(self.fake.databases["person-database"]) == 1
+
+    def test_create_source(self):
+        existing = self.person_database.create_page({"name": "李四"})
+        command = AsyncCreateSourceCommand(
+            AsyncGetSourceIDCommand(self.source_database),
+            AsyncGetPersonIDCommand(self.person_database),
+            self.podcast_database,
+        )
+        data = {
+            "title": "什么是批判性思维",
+            "type": "Podcast",
+            "author": [{"name": "张三"}, {"name": "李四"}, {"name": "张三"}],
+        }
+
+        page = asyncio.run(command.execute(data))
+
+        author_ids = [
+            relation["id"] for relation in page["properties"]["Author"]["relation"]
+        ]
+        assert len(author_ids) == 3
+        assert author_ids[0] == author_ids[2]
+        assert author_ids[1] == existing["id"]
+        assert len(self.fake.databases["person-database"]) == 2
+        assert len(self.fake.databases["podcast-database"]) == 1
+
+    def test_mirror(self):
+        mirror = NotionMirror(":memory:", [self.person_database])
+        page = self.person_database.create_page({"name": "张三"})
+        mirror.add(self.person_database, "张三", page["id"])
+        command = AsyncGetPersonIDCommand(self.person_database, mirror)
+
+        async def run():
+            person_id = await command.execute({"name": "张三"})
+            created_id = await command.execute({"name": "李四"})
+            await self.person_database.adelete_page(person_id)
+            return person_id, created_id
+
+        person_id, created_id = asyncio.run(run())
+        assert person_id == page["id"]
+        assert mirror.get_page_id(self.person_database, "李四") == created_id
+        assert mirror.get_page_id(self.person_database, "张三") is None
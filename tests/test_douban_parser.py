@@ -0,0 +1,104 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from extractor.douban import AUTHOR_INTRO_MARKER, DoubanBookExtractor
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "douban_subject.html")
+DOUBAN_URL = "https://book.douban.com/subject/34434309/"
+CORPUS = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "benchmarks", "corpus"
+)
+
+
+def get_corpus_pages():
+    with open(os.path.join(CORPUS, "manifest.json"), encoding="utf-8") as file:
+        return json.load(file)["douban"]
+
+
+class TestDoubanParser:
+    def setup_method(self, test_method):
+        with open(FIXTURE, "rb") as file:
+            self.html_doc = file.read()
+
+    def parse(self, parser, html_doc=None):
+        extractor = DoubanBookExtractor(parser=parser)
+        return extractor.parse("9787111632306", DOUBAN_URL, html_doc or self.html_doc)
+
+    def test_lxml(self):
+        data = self.parse("lxml")
+        assert data["title"] == "学会提问（原书第12版）"
+        assert data["author"][0]["name"] == "尼尔 · 布朗"
+        assert data["publisher"] == "机械工业出版社"
+        assert (
+            data["original_title"]
+            == "Asking the Right Questions: A Guide to Critical Thinking"
+        )
+        assert [translator["name"] for translator in data["translator"]] == [
+            "许蔚翰",
+            "吴礼敬",
+        ]
+        assert data["published"] == "2019-08-01"
+        assert data["pages"] == 256
+        assert data["douban_ranking"] == 8.1
+        assert "(展开全部)" not in data["description"]
+
+    def test_parsers_agree(self):
+        assert self.parse("lxml") == self.parse("bs4")
+
+    def test_parsers_agree_on_missing_fields(self):
+        html_doc = self.html_doc.replace(" 译者".encode("utf-8"), b"").replace(
+            b'property="v:average"', b""
+        )
+        data = self.parse("lxml", html_doc)
+        assert data["translator"] is None
+        assert data["douban_ranking"] is None
+        assert data == self.parse("bs4", html_doc)
+
+    @pytest.mark.parametrize("parser", ["lxml", "bs4"])
+    def test_page_up_to_stop_marker(self, parser):
+        end = self.html_doc.index(AUTHOR_INTRO_MARKER) + len(AUTHOR_INTRO_MARKER)
+        assert self.parse(parser, self.html_doc[:end]) == self.parse(parser)
+
+    def test_text_input(self):
+        assert self.parse("lxml", self.html_doc.decode("utf-8")) == self.parse("lxml")
+
+    def test_unknown_parser(self):
+        with pytest.raises(AssertionError):
+            DoubanBookExtractor(parser="html5lib")
+
+    @pytest.mark.parametrize("parser", ["lxml", "bs4"])
+    def test_shared_extractor(self, parser):
+        extractor = DoubanBookExtractor(parser=parser)
+        other_doc = self.html_doc.replace(
+            "学会提问".encode("utf-8"), "思考的艺术".encode("utf-8")
+        )
+        docs = [self.html_doc, other_doc] * 8
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            titles = list(
+                executor.map(
+                    lambda html_doc: extractor.parse("isbn", DOUBAN_URL, html_doc)[
+                        "title"
+                    ],
+                    docs,
+                )
+            )
+
+        assert titles == ["学会提问（原书第12版）", "思考的艺术（原书第12版）"] * 8
+        assert not hasattr(extractor, "soup")
+
+
+@pytest.mark.parametrize("page", get_corpus_pages(), ids=lambda page: page["file"])
+def test_benchmark_corpus(page):
+    with open(os.path.join(CORPUS, page["file"]), "rb") as file:
+        html_doc = file.read()
+
+    data = DoubanBookExtractor(parser="lxml").parse(page["isbn"], page["url"], html_doc)
+    assert data["title"]
+    assert data["author"]
+    assert data == DoubanBookExtractor(parser="bs4").parse(
+        page["isbn"], page["url"], html_doc
+    )
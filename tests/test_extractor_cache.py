@@ -0,0 +1,195 @@
+import os
+import time
+
+from extractor import douban
+from extractor.cache import HTTPCache
+from extractor.douban import DoubanBookExtractor
+
+
+class FakeResponse:
+    def __init__(self, url, status_code, content=b"", headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = "utf-8"
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start : start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+        self.timeouts = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests.append((url, headers))
+        self.timeouts.append(timeout)
+        return self.responses.pop(0)
+
+
+class TestHTTPCache:
+    def setup_method(self, test_method):
+        self.url = "https://book.douban.com/subject/35513147/"
+
+    def get_cache(self, tmp_path, responses, ttl=60):
+        self.session = FakeSession(responses)
+        return HTTPCache(str(tmp_path), ttl=ttl, session=self.session)
+
+    def test_fresh_entry_is_served_from_disk(self, tmp_path):
+        cache = self.get_cache(
+            tmp_path, [FakeResponse(self.url, 200, "学会提问".encode("utf-8"))]
+        )
+        assert cache.get(self.url).text == "学会提问"
+        assert cache.get(self.url).text == "学会提问"
+        assert len(self.session.requests) == 1
+        assert cache.stats() == {"hits": 1, "misses": 1, "revalidated": 0}
+
+    def test_stale_entry_is_revalidated(self, tmp_path):
+        cache = self.get_cache(
+            tmp_path,
+            [
+                FakeResponse(self.url, 200, b"body", {"ETag": '"v1"'}),
+                FakeResponse(self.url, 304),
+            ],
+            ttl=0,
+        )
+        cache.get(self.url)
+        assert cache.get(self.url).content == b"body"
+        assert self.session.requests[1][1]["If-None-Match"] == '"v1"'
+        assert cache.stats()["revalidated"] == 1
+
+    def test_redirect(self, tmp_path):
+        isbn_url = "https://book.douban.com/isbn/9787111680925/"
+        cache = self.get_cache(tmp_path, [])
+        cache.store(FakeResponse(self.url, 200, b"body"), isbn_url)
+        assert cache.get_redirect(isbn_url) == self.url
+        assert cache.get(isbn_url).content == b"body"
+        assert len(self.session.requests) == 0
+
+    def test_negative_entry(self, tmp_path):
+        cache = self.get_cache(tmp_path, [])
+        assert cache.is_negative("9780593418239") is False
+        cache.set_negative("9780593418239")
+        assert cache.is_negative("9780593418239") is True
+
+    def test_errors_are_not_cached(self, tmp_path):
+        cache = self.get_cache(
+            tmp_path,
+            [FakeResponse(self.url, 500, b"error"), FakeResponse(self.url, 200, b"ok")],
+        )
+        assert cache.get(self.url).status_code == 500
+        assert cache.get(self.url).content == b"ok"
+
+    def test_prune_expired(self, tmp_path):
+        cache = HTTPCache(str(tmp_path), max_age=60)
+        cache.set_negative("old")
+        cache.set_negative("new")
+        old_path = cache._get_path("negative:old", "json")
+        expired = time.time() - 120
+        os.utime(old_path, (expired, expired))
+
+        assert cache.prune() == 1
+        assert not os.path.exists(old_path)
+        assert cache.is_negative("new") is True
+
+    def test_prune_to_size(self, tmp_path):
+        cache = HTTPCache(str(tmp_path), max_size=0, prune_every=2)
+        cache.set_negative("a")
+        assert os.listdir(tmp_path)
+        cache.set_negative("b")
+        assert os.listdir(tmp_path) == []
+
+
+ISBN = "9787111632306"
+ISBN_URL = f"https://book.douban.com/isbn/{ISBN}/"
+SUBJECT_URL = "https://book.douban.com/subject/34434309/"
+
+
+class TestDoubanCache:
+    def get_extractor(self, tmp_path, monkeypatch, responses, stop_marker=None):
+        self.session = FakeSession(responses)
+        monkeypatch.setattr(douban.requests, "get", self.session.get)
+        self.cache = HTTPCache(str(tmp_path), session=self.session)
+        return DoubanBookExtractor(cache=self.cache, stop_marker=stop_marker, timeout=5)
+
+    def test_subject_page_is_cached(self, tmp_path, monkeypatch):
+        extractor = self.get_extractor(
+            tmp_path, monkeypatch, [FakeResponse(SUBJECT_URL, 200, b"subject")]
+        )
+        assert extractor.fetch(ISBN) == (SUBJECT_URL, b"subject")
+        assert extractor.fetch(ISBN) == (SUBJECT_URL, b"subject")
+        assert self.cache.get_redirect(ISBN_URL) == SUBJECT_URL
+        assert self.session.timeouts == [5]
+
+    def test_missing_book_is_cached(self, tmp_path, monkeypatch):
+        extractor = self.get_extractor(
+            tmp_path, monkeypatch, [FakeResponse(ISBN_URL, 404)]
+        )
+        assert extractor.fetch(ISBN) is None
+        assert extractor.fetch(ISBN) is None
+        assert len(self.session.requests) == 1
+
+    def test_errors_are_not_cached(self, tmp_path, monkeypatch):
+        extractor = self.get_extractor(
+            tmp_path,
+            monkeypatch,
+            [FakeResponse(ISBN_URL, 403), FakeResponse(SUBJECT_URL, 200, b"subject")],
+        )
+        assert extractor.fetch(ISBN) is None
+        assert extractor.fetch(ISBN) == (SUBJECT_URL, b"subject")
+
+    def test_anti_bot_redirect_is_not_cached(self, tmp_path, monkeypatch):
+        check_url = "https://sec.douban.com/b?r=https%3A%2F%2Fbook.douban.com%2F"
+        extractor = self.get_extractor(
+            tmp_path,
+            monkeypatch,
+            [
+                FakeResponse(check_url, 200, b"captcha"),
+                FakeResponse(SUBJECT_URL, 200, b"subject"),
+            ],
+        )
+        assert extractor.fetch(ISBN) == (check_url, b"captcha")
+        assert self.cache.get_redirect(ISBN_URL) is None
+        assert extractor.fetch(ISBN) == (SUBJECT_URL, b"subject")
+
+    def test_stop_marker(self, tmp_path, monkeypatch):
+        head = b'<script type="application/ld+json"></script><div id="info">'
+        subject = FakeResponse(
+            SUBJECT_URL, 200, head + b"a" * 20000 + b"STOP" + b"b" * 40000
+        )
+        extractor = self.get_extractor(
+            tmp_path,
+            monkeypatch,
+            [subject, FakeResponse(SUBJECT_URL, 200, b"full")],
+            stop_marker=b"STOP",
+        )
+        # The body is read in 16 KiB chunks up to the one holding the marker.
+        assert extractor.fetch(ISBN) == (SUBJECT_URL, subject.content[:32768])
+        assert subject.closed
+
+        # The cut page is cached for the extractor, not for other readers.
+        assert extractor.fetch(ISBN) == (SUBJECT_URL, subject.content[:32768])
+        assert len(self.session.requests) == 1
+        assert self.cache.get(SUBJECT_URL).content == b"full"
+        assert self.session.requests[1][0] == SUBJECT_URL
+
+    def test_stop_marker_before_required_blocks(self, tmp_path, monkeypatch):
+        subject = FakeResponse(
+            SUBJECT_URL,
+            200,
+            b"STOP" + b"a" * 40000 + b'<script type="application/ld+json"></script>'
+            b'<div id="info">' + b"b" * 20000,
+        )
+        extractor = self.get_extractor(
+            tmp_path, monkeypatch, [subject], stop_marker=b"STOP"
+        )
+        assert extractor.fetch(ISBN) == (SUBJECT_URL, subject.content)
+        assert self.cache.get(SUBJECT_URL).content == subject.content
+        assert len(self.session.requests) == 1
@@ -0,0 +1,71 @@
+from extractor.base import Extractor
+from extractor.registry import ExtractorRegistry, registry
+from extractor.douban import DoubanBookExtractor
+from extractor.zhongdu import ZhongduExtractor
+
+
+def get_extractor_class(pattern):
+    class FakeExtractor(Extractor):
+        instances = 0
+
+        def __init__(self):
+            FakeExtractor.instances += 1
+
+        def match(self, url):
+            return pattern in url
+
+        def extract(self, url):
+            return {"url": url}
+
+    return FakeExtractor
+
+
+class TestExtractorRegistry:
+    def setup_method(self, test_method):
+        self.registry = ExtractorRegistry()
+        self.episode = get_extractor_class("/episode/")
+        self.podcast = get_extractor_class("/podcast/")
+        self.registry.register(self.episode, hosts=("www.xiaoyuzhoufm.com",))
+        self.registry.register(self.podcast, hosts=("WWW.XIAOYUZHOUFM.COM",))
+
+    def test_find_by_host(self):
+        url = "https://www.xiaoyuzhoufm.com/podcast/5e280fab418a84a0461fa6a1"
+        assert isinstance(self.registry.find_by_url(url), self.podcast)
+        url = "https://www.xiaoyuzhoufm.com/episode/6493d6ae932d2b6e4a6d1d4b"
+        assert isinstance(self.registry.find_by_url(url), self.episode)
+
+    def test_unknown_url(self):
+        assert self.registry.find_by_url("https://www.bilibili.com/video/1") is None
+        assert self.registry.find_by_url("ftp://www.xiaoyuzhoufm.com/episode/") is None
+        assert self.registry.find_by_url("9787111680925") is None
+        assert self.registry.find_by_isbn("9787111680925") is None
+
+    def test_instances_are_shared(self):
+        url = "https://www.xiaoyuzhoufm.com/episode/6493d6ae932d2b6e4a6d1d4b"
+        assert self.registry.find_by_url(url) is self.registry.find_by_url(url)
+        assert self.episode.instances == 1
+
+    def test_lazy_registration(self):
+        self.registry.register(
+            "extractor.zhongdu:ZhongduExtractor", hosts=("ny.zdline.cn",)
+        )
+        assert self.registry._instances == {}
+        url = "https://ny.zdline.cn/mobile/audio?artId=8802"
+        assert isinstance(self.registry.find_by_url(url), ZhongduExtractor)
+        assert len(self.registry.load()) == 3
+
+
+class TestBuiltinExtractors:
+    def test_zhongdu(self):
+        url = "https://ny.zdline.cn/mobile/audio?artId=8802"
+        assert isinstance(registry.find_by_url(url), ZhongduExtractor)
+        assert isinstance(
+            registry.find_by_url("ny.zdline.cn/mobile/audio?artId=8802"),
+            ZhongduExtractor,
+        )
+        assert registry.find_by_url("https://ny.zdline.cn/mobile/video") is None
+
+    def test_douban(self):
+        assert isinstance(registry.find_by_isbn("9787111680925"), DoubanBookExtractor)
+        assert registry.find_by_isbn("https://book.douban.com/") is None
+        assert registry.find_by_url("9787111680925") is None
@@ -0,0 +1,63 @@
+import pytest
+
+from loadtest.fake_notion_server import FakeNotionServer
+from notion.database import SourceDatabase
+from notion.notion import NotionAPIException, NotionManager
+from notion.scheduler import RequestScheduler
+
+
+@pytest.fixture
+def start_server():
+    servers = []
+
+    def start(**kwargs):
+        server = FakeNotionServer(("127.0.0.1", 0), seed=1, **kwargs)
+        server.start()
+        servers.append(server)
+        notion = NotionManager(
+            "secret_test",
+            base_url=server.base_url,
+            scheduler=RequestScheduler(rate=1000, burst=1000),
+        )
+        return server, notion
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_pages_and_queries(start_server):
+    server, notion = start_server()
+    source_database = SourceDatabase(notion, "source-database")
+
+    page = source_database.create_page({"title": "学会提问"})
+    source_database.create_page({"title": "思考的艺术"})
+
+    pages = source_database.query_by_titles(["学会提问", "人类简史"])
+    assert {title: found["id"] for title, found in pages.items()} == {
+        "学会提问": page["id"]
+    }
+    assert server.get_stats()["pages"] == {"source-database": 2}
+
+
+def test_throttle_is_retried(start_server):
+    server, notion = start_server(throttle_ratio=0.3, retry_after=0)
+    source_database = SourceDatabase(notion, "source-database")
+
+    for i in range(5):
+        source_database.create_page({"title": f"Source {i}"})
+
+    stats = server.get_stats()
+    assert stats["throttled"] > 0
+    assert stats["pages"] == {"source-database": 5}
+
+
+def test_error_injection(start_server):
+    server, notion = start_server(error_ratio=1)
+
+    with pytest.raises(NotionAPIException):
+        SourceDatabase(notion, "source-database").create_page({"title": "A"})
+
+    assert server.get_stats()["errors"] == 1
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import time
+
+import pytest
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ResourceExistsError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+)
+from azure.data.tables import TableEntity, UpdateMode
+
+from logic.jobs import (
+    JobBusyException,
+    JobRunner,
+    JobStore,
+    LocalJobQueue,
+    TableJobStore,
+)
+
+
+class FakeAddCommand:
+    def __init__(self, pages):
+        self.pages = pages
+        self.executed = []
+
+    async def execute(self, target):
+        self.executed.append(target)
+        page = self.pages[target]
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+
+class FakeTableClient:
+    """
+    The TableClient calls of TableJobStore on a dict, with etags.
+    """
+
+    table_name = "jobs"
+
+    def __init__(self):
+        self.entities = {}
+        self.version = 0
+
+    def _save(self, entity):
+        self.version += 1
+        entity = TableEntity(entity)
+        entity._metadata = {"etag": str(self.version), "timestamp": None}
+        key = (entity["PartitionKey"], entity["RowKey"])
+        self.entities[key] = entity
+
+    def create_entity(self, entity):
+        if (entity["PartitionKey"], entity["RowKey"]) in self.entities:
+            raise ResourceExistsError("The entity already exists.")
+        self._save(entity)
+
+    def get_entity(self, partition_key, row_key):
+        if (partition_key, row_key) not in self.entities:
+            raise ResourceNotFoundError("The entity doesn't exist.")
+        entity = self.entities[partition_key, row_key]
+        copy = TableEntity(entity)
+        copy._metadata = dict(entity.metadata)
+        return copy
+
+    def update_entity(self, entity, mode, etag=None, match_condition=None):
+        assert mode == UpdateMode.REPLACE
+        current = self.entities[entity["PartitionKey"], entity["RowKey"]]
+        if match_condition == MatchConditions.IfNotModified:
+            if current.metadata["etag"] != etag:
+                raise ResourceModifiedError("The entity was modified.")
+        self._save({key: value for key, value in entity.items() if value is not None})
+
+
+class TestJobRunner:
+    def get_store(self):
+        return JobStore()
+
+    def setup_method(self, test_method):
+        self.store = self.get_store()
+        self.command = FakeAddCommand(
+            {
+                "9787111680925": {"id": "page-id"},
+                "9780593418239": None,
+                "9787115564672": RuntimeError("Notion is down"),
+            }
+        )
+        self.runner = JobRunner(self.store, {"isbn": lambda: self.command})
+        self.queue = LocalJobQueue()
+
+    def run_job(self, isbn):
+        job = asyncio.run(self.runner.enqueue(self.queue, "isbn", isbn))
+        assert self.store.get(job["job_id"])["status"] == "queued"
+        asyncio.run(self.queue.drain(self.runner))
+        return self.store.get(job["job_id"])
+
+    def test_done(self):
+        job = self.run_job("9787111680925")
+        assert job["status"] == "done"
+        assert job["page_id"] == "page-id"
+
+    def test_not_found(self):
+        assert self.run_job("9780593418239")["status"] == "not_found"
+
+    def test_failed(self):
+        job = self.run_job("9787115564672")
+        assert job["status"] == "failed"
+        assert job["error"] == "Notion is down"
+
+    def test_redelivered_job_runs_once(self):
+        job = asyncio.run(self.runner.enqueue(self.queue, "isbn", "9787111680925"))
+        message = self.queue.messages[0]
+        asyncio.run(self.queue.drain(self.runner))
+        asyncio.run(self.runner.run(message))
+        assert self.command.executed == ["9787111680925"]
+        assert self.store.get(job["job_id"])["status"] == "done"
+
+    def test_job_from_another_instance(self):
+        message = json.dumps(
+            {"job_id": "job-id", "kind": "isbn", "target": "9787111680925"}
+        )
+        assert asyncio.run(self.runner.run(message))["page_id"] == "page-id"
+        assert self.store.get("job-id")["status"] == "done"
+
+    def test_unknown_job(self):
+        assert self.store.get("job-id") is None
+
+    def test_running_job_is_not_run_twice(self):
+        job = asyncio.run(self.runner.enqueue(self.queue, "isbn", "9787111680925"))
+        assert self.store.claim(job["job_id"])
+
+        with pytest.raises(JobBusyException):
+            asyncio.run(self.runner.run(self.queue.messages[0]))
+        assert self.command.executed == []
+
+    def test_expired_lease_is_claimed_again(self):
+        job = asyncio.run(self.runner.enqueue(self.queue, "isbn", "9787111680925"))
+        assert self.store.claim(job["job_id"])
+        assert not self.store.claim(job["job_id"])
+        time.sleep(0.01)
+        assert self.store.claim(job["job_id"], lease=0.01)
+
+
+class TestTableJobRunner(TestJobRunner):
+    def get_store(self):
+        return TableJobStore(FakeTableClient())
+
+    def test_concurrent_claim(self):
+        job = self.store.create("isbn", "9787111680925")
+        other = TableJobStore(self.store.table)
+        entity = other._get_entity(job["job_id"])
+        assert self.store.claim(job["job_id"])
+
+        # The other worker read the job before the claim, its write loses.
+        other._get_entity = lambda job_id: entity
+        assert not other.claim(job["job_id"])
+
+    def test_finished_job_clears_fields(self):
+        job = self.run_job("9787115564672")
+        assert job["error"] == "Notion is down"
+        self.store.finish(job["job_id"], "page-id")
+        assert self.store.get(job["job_id"])["error"] is None
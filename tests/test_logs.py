@@ -0,0 +1,94 @@
+import logging
+
+import pytest
+
+from telemetry.logs import get_logger, get_sample_rate, payload, redact
+
+
+class Exploding:
+    def __str__(self):
+        raise AssertionError("The message was formatted.")
+
+
+class TestPayload:
+    def test_truncate(self):
+        text = str(payload({"description": "x" * 100}, limit=20))
+
+        assert text.startswith('{"description": "xxx')
+        assert text.endswith("... (99 more chars)")
+
+    def test_limit_from_env(self, monkeypatch):
+        monkeypatch.setenv("LOG_PAYLOAD_LIMIT", "5")
+
+        assert str(payload("abcdefgh")) == "abcde... (3 more chars)"
+
+    def test_keep_unicode(self):
+        assert str(payload({"title": "学会提问"})) == '{"title": "学会提问"}'
+
+    def test_redact_sensitive_keys(self):
+        text = str(
+            payload(
+                {
+                    "headers": {"Authorization": "Bearer abc", "Accept": "json"},
+                    "items": [{"token": "abc"}],
+                }
+            )
+        )
+
+        assert "abc" not in text
+        assert '"Accept": "json"' in text
+
+
+class TestRedact:
+    @pytest.mark.parametrize(
+        "text, expected",
+        [
+            ("Authorization: Bearer secret_abc123", "Authorization: Bearer ***"),
+            ("token=secret_abc123;", "token=***;"),
+            ("token=ntn_abc123", "token=***"),
+            ("Nothing secret here", "Nothing secret here"),
+        ],
+    )
+    def test_redact(self, text, expected):
+        assert redact(text) == expected
+
+
+class TestLogger:
+    def test_lazy_formatting(self, caplog):
+        log = get_logger("tests.lazy", sample_rate=1)
+
+        with caplog.at_level(logging.WARNING, logger="tests.lazy"):
+            log.info("Payload is: %s", Exploding())
+
+        assert caplog.records == []
+
+    def test_format_and_redact(self, caplog):
+        log = get_logger("tests.format", sample_rate=1)
+
+        with caplog.at_level(logging.INFO, logger="tests.format"):
+            log.info("Send %s with %s", "POST", {"Authorization": "Bearer secret_a"})
+
+        assert caplog.messages == ["Send POST with {'Authorization': 'Bearer ***'}"]
+        assert caplog.records[0].funcName == "test_format_and_redact"
+
+    def test_sample(self, caplog, monkeypatch):
+        log = get_logger("tests.sample", sample_rate=0.5)
+        values = iter([0.1, 0.9, 0.4, 0.6])
+        monkeypatch.setattr("telemetry.logs.random.random", lambda: next(values))
+
+        with caplog.at_level(logging.INFO, logger="tests.sample"):
+            for i in range(4):
+                log.info("Message %d", i)
+            log.warning("Never sampled")
+
+        assert caplog.messages == ["Message 0", "Message 2", "Never sampled"]
+        assert log.dropped == 2
+
+    def test_sample_rate_from_env(self, monkeypatch):
+        monkeypatch.setenv("LOG_SAMPLE_RATE", "0.5")
+        monkeypatch.setenv("LOG_SAMPLE_RATES", "notion=0.1,notion.notion=0.01")
+
+        assert get_sample_rate("notion.notion") == 0.01
+        assert get_sample_rate("notion.database") == 0.1
+        assert get_sample_rate("notional") == 0.5
+        assert get_sample_rate("logic.commands") == 0.5
@@ -0,0 +1,114 @@
+import asyncio
+import gc
+import threading
+
+import pytest
+
+from telemetry.metrics import MetricRegistry, timed
+
+
+class TestCounter:
+    def test_shards(self):
+        registry = MetricRegistry()
+        counter = registry.counter("requests_total", "Requests.", ("status",))
+
+        def record():
+            for _ in range(1000):
+                counter.inc("200")
+            counter.add(2, "429")
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc("200")
+
+        assert counter.collect() == {("200",): 8001, ("429",): 16}
+
+    def test_retire_finished_threads(self):
+        registry = MetricRegistry()
+        counter = registry.counter("requests_total", "Requests.")
+
+        threads = [threading.Thread(target=counter.inc) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        del threads
+        gc.collect()
+
+        assert len(counter._shards) == 0
+        assert counter.collect() == {(): 4}
+
+    def test_render(self):
+        registry = MetricRegistry()
+        counter = registry.counter("requests_total", "Requests.", ("path",))
+        counter.inc('/a"b')
+
+        assert registry.render() == (
+            "# HELP requests_total Requests.\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{path="/a\\"b"} 1\n'
+        )
+
+
+class TestHistogram:
+    def test_render(self):
+        registry = MetricRegistry()
+        histogram = registry.histogram(
+            "latency_seconds", "Latency.", ("endpoint",), buckets=(0.1, 1)
+        )
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value, "query")
+
+        assert registry.render().splitlines()[2:] == [
+            'latency_seconds_bucket{endpoint="query",le="0.1"} 2',
+            'latency_seconds_bucket{endpoint="query",le="1"} 3',
+            'latency_seconds_bucket{endpoint="query",le="+Inf"} 4',
+            'latency_seconds_sum{endpoint="query"} 2.65',
+            'latency_seconds_count{endpoint="query"} 4',
+        ]
+
+    def test_timed(self):
+        registry = MetricRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency.", ("endpoint",))
+
+        @timed(histogram, "create")
+        def create():
+            return "page"
+
+        @timed(histogram, "query")
+        async def query():
+            await asyncio.sleep(0.01)
+            return []
+
+        assert create() == "page"
+        assert asyncio.run(query()) == []
+        totals = histogram.collect()
+        assert totals[("create",)][-1] == 1
+        assert totals[("query",)][-1] == 1
+        assert totals[("query",)][-2] >= 0.01
+
+
+class TestRegistry:
+    def test_get_or_create(self):
+        registry = MetricRegistry()
+        counter = registry.counter("requests_total", "Requests.")
+
+        assert registry.counter("requests_total", "Requests.") is counter
+        with pytest.raises(AssertionError):
+            registry.histogram("requests_total", "Requests.")
+
+    def test_callback(self):
+        registry = MetricRegistry()
+        stats = {"hits": 3}
+        registry.callback(
+            "cache_hits_total",
+            "Cache hits.",
+            lambda: {("query",): stats["hits"], ("http",): None},
+            labelnames=("cache",),
+        )
+        stats["hits"] = 5
+
+        assert registry.render().splitlines()[-1] == 'cache_hits_total{cache="query"} 5'
@@ -0,0 +1,163 @@
+import asyncio
+import os
+
+import pytest
+
+from extractor.douban import DoubanBookExtractor
+from extractor.zhongdu import ZhongduExtractor
+from logic.commands import (
+    AddByISBNCommand,
+    AddByURLCommand,
+    AsyncAddByISBNCommand,
+    AsyncAddByURLCommand,
+)
+from notion.calls import assert_max_calls, count_calls, record_call
+from notion.database import (
+    QueryCache,
+    BookDatabase,
+    PersonDatabase,
+    PodcastDatabase,
+    SourceDatabase,
+)
+from notion.notion import NOTION_API_BASE, NotionManager
+from notion.scheduler import RequestScheduler
+from tests.fake_notion import FakeNotion
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "douban_subject.html")
+DOUBAN_URL = "https://book.douban.com/subject/34434309/"
+ISBN = "9787111632306"
+ZHONGDU_URL = "http://ny.zdline.cn/mobile/audioText?artId=158504&sm=app"
+ZHONGDU_META_INFO = {
+    "model": {
+        "title": "什么是批判性思维",
+        "daodu": "从提问开始。",
+        "openPic": "https://example.com/cover.jpg",
+        "aboutAuthors": [
+            {"name": "张三", "pic": "https://example.com/a.jpg", "desc": "作者"},
+            {"name": "李四", "pic": "https://example.com/b.jpg", "desc": "作者"},
+        ],
+        "dayStr": "05-20",
+        "audioInfo": [{"audioTime": "12:30"}],
+        "zhuanlan": {"name": "思维课"},
+    }
+}
+
+# The Notion calls one ingest may make. Raise them only on purpose.
+# A new book of the fixture (4 people): one query for the source, the people
+# batch and the book, then one create per page.
+ADD_BOOK_BUDGET = 9
+ADD_BOOK_CREATES = 6
+# A book already in Notion only looks up its source, people and title.
+EXISTING_BOOK_BUDGET = 3
+ADD_PODCAST_BUDGET = 7
+ADD_PODCAST_CREATES = 4
+
+
+@pytest.fixture
+def notion(monkeypatch):
+    with open(FIXTURE, "rb") as f:
+        html = f.read()
+    monkeypatch.setattr(
+        DoubanBookExtractor, "fetch", lambda self, isbn: (DOUBAN_URL, html)
+    )
+    monkeypatch.setattr(
+        ZhongduExtractor, "_get_meta_info", lambda self, artId: ZHONGDU_META_INFO
+    )
+
+    fake = FakeNotion()
+    notion = NotionManager(
+        "secret_test",
+        session=fake.session(NOTION_API_BASE),
+        scheduler=RequestScheduler(rate=1000, burst=1000),
+        async_session=fake.async_session(NOTION_API_BASE),
+    )
+    return notion
+
+
+def get_databases(notion, cache=None):
+    return (
+        SourceDatabase(notion, "source-database", cache=cache),
+        PersonDatabase(notion, "person-database", cache=cache),
+        BookDatabase(notion, "book-database", cache=cache),
+        PodcastDatabase(notion, "podcast-database", cache=cache),
+    )
+
+
+class TestCountCalls:
+    def test_nested_scopes(self):
+        with count_calls() as outer:
+            with count_calls("AddByISBN") as inner:
+                record_call("query")
+                record_call("create")
+            record_call("query")
+
+        assert inner.counts == {"query": 1, "create": 1}
+        assert outer.counts == {"query": 2, "create": 1}
+        assert str(outer) == "3 Notion calls (create=1, query=2)"
+
+    def test_assert_max_calls(self, notion):
+        source_database = get_databases(notion)[0]
+
+        with pytest.raises(AssertionError) as error:
+            with assert_max_calls(3, create=1):
+                source_database.create_page({"title": "A"})
+                source_database.create_page({"title": "B"})
+
+        assert str(error.value) == (
+            "2 Notion calls (create=2): expected at most 1 create calls."
+        )
+
+
+class TestBudget:
+    def test_add_book(self, notion):
+        source_database, person_database, book_database, _ = get_databases(notion)
+        command = AddByISBNCommand(source_database, person_database, book_database)
+
+        with assert_max_calls(ADD_BOOK_BUDGET, create=ADD_BOOK_CREATES):
+            assert command.execute(ISBN) is not None
+
+        with assert_max_calls(EXISTING_BOOK_BUDGET, create=0):
+            assert command.execute(ISBN) is not None
+
+    def test_add_book_with_cache(self, notion):
+        source_database, person_database, book_database, _ = get_databases(
+            notion, QueryCache()
+        )
+        command = AddByISBNCommand(source_database, person_database, book_database)
+
+        with assert_max_calls(ADD_BOOK_BUDGET, create=ADD_BOOK_CREATES):
+            assert command.execute(ISBN) is not None
+
+        with assert_max_calls(0):
+            assert command.execute(ISBN) is not None
+
+    def test_add_book_async(self, notion):
+        source_database, person_database, book_database, _ = get_databases(notion)
+        command = AsyncAddByISBNCommand(source_database, person_database, book_database)
+
+        async def run():
+            with assert_max_calls(ADD_BOOK_BUDGET, create=ADD_BOOK_CREATES):
+                assert await command.execute(ISBN) is not None
+            with assert_max_calls(EXISTING_BOOK_BUDGET, create=0):
+                assert await command.execute(ISBN) is not None
+
+        asyncio.run(run())
+
+    def test_add_podcast(self, notion):
+        source_database, person_database, _, podcast_database = get_databases(notion)
+        command = AddByURLCommand(source_database, person_database, podcast_database)
+
+        with assert_max_calls(ADD_PODCAST_BUDGET, create=ADD_PODCAST_CREATES):
+            assert command.execute(ZHONGDU_URL) is not None
+
+    def test_add_podcast_async(self, notion):
+        source_database, person_database, _, podcast_database = get_databases(notion)
+        command = AsyncAddByURLCommand(
+            source_database, person_database, podcast_database
+        )
+
+        async def run():
+            with assert_max_calls(ADD_PODCAST_BUDGET, create=ADD_PODCAST_CREATES):
+                assert await command.execute(ZHONGDU_URL) is not None
+
+        asyncio.run(run())
@@ -0,0 +1,149 @@
+from notion.database import PersonDatabase
+from notion.mirror import NotionMirror
+from notion.notion import NotionManager
+
+
+def get_person_page(page_id, name, last_edited_time):
+    return {
+        "id": page_id,
+        "last_edited_time": last_edited_time,
+        "properties": {"Name": {"title": [{"plain_text": name}]}},
+    }
+
+
+class FakeNotionManager(NotionManager):
+    def __init__(self, responses):
+        super().__init__("token")
+        self.responses = responses
+        self.payloads = []
+        self.deleted = []
+
+    def query_database(self, database_id, payload, timeout=None):
+        self.payloads.append(dict(payload))
+        return self.responses.pop(0)
+
+    def delete(self, page_id, timeout=None):
+        self.deleted.append(page_id)
+
+
+class TestNotionMirror:
+    def setup_method(self, test_method):
+        self.notion = FakeNotionManager(
+            [
+                {
+                    "results": [
+                        get_person_page("1", "梁永安", "2023-01-01T00:00:00.000Z")
+                    ],
+                    "has_more": True,
+                    "next_cursor": "cursor-1",
+                },
+                {
+                    "results": [
+                        get_person_page("2", "周飞舟", "2023-02-01T00:00:00.000Z")
+                    ],
+                    "has_more": False,
+                    "next_cursor": None,
+                },
+            ]
+        )
+        self.person_database = PersonDatabase(self.notion, "person")
+        self.mirror = NotionMirror(":memory:", [self.person_database])
+
+    def test_full_load_follows_cursor(self):
+        assert self.mirror.sync() == 2
+        assert self.notion.payloads[1]["start_cursor"] == "cursor-1"
+        assert self.notion.payloads[1]["page_size"] == 100
+        assert "filter" not in self.notion.payloads[0]
+        assert self.mirror.get_page_id(self.person_database, "梁永安") == "1"
+        assert self.mirror.get_page_id(self.person_database, "周飞舟") == "2"
+        assert self.mirror.get_page_id(self.person_database, "渠敬东") is None
+
+    def test_incremental_sync(self):
+        self.mirror.sync()
+        self.notion.responses.append(
+            {
+                "results": [
+                    get_person_page("1", "梁永安 ", "2023-03-01T00:00:00.000Z")
+                ],
+                "has_more": False,
+                "next_cursor": None,
+            }
+        )
+        assert self.mirror.sync() == 1
+        assert self.notion.payloads[2]["filter"] == {
+            "timestamp": "last_edited_time",
+            "last_edited_time": {"on_or_after": "2023-02-01T00:00:00.000Z"},
+        }
+        assert self.mirror.get_page_id(self.person_database, "梁永安") is None
+        assert self.mirror.get_page_id(self.person_database, "梁永安 ") == "1"
+
+    def test_delete_page_leaves_mirror(self):
+        self.mirror.sync()
+        assert self.person_database.delete_page("1")
+        assert self.notion.deleted == ["1"]
+        assert self.mirror.get_page_id(self.person_database, "梁永安") is None
+        assert self.mirror.get_page_id(self.person_database, "周飞舟") == "2"
+
+    def test_full_sync_drops_archived_pages(self):
+        self.mirror.sync()
+        self.mirror.add(self.person_database, "渠敬东", "3")
+        self.notion.responses.append(
+            {
+                "results": [
+                    get_person_page("2", "周飞舟", "2023-02-01T00:00:00.000Z")
+                ],
+                "has_more": False,
+                "next_cursor": None,
+            }
+        )
+        assert self.mirror.sync(full=True) == 1
+        assert "filter" not in self.notion.payloads[2]
+        assert self.mirror.get_page_id(self.person_database, "梁永安") is None
+        assert self.mirror.get_page_id(self.person_database, "渠敬东") is None
+        assert self.mirror.get_page_id(self.person_database, "周飞舟") == "2"
+
+    def test_rescan_interval(self):
+        self.mirror.rescan_interval = 0
+        self.mirror.sync()
+        self.notion.responses.append(
+            {"results": [], "has_more": False, "next_cursor": None}
+        )
+        self.mirror.sync()
+        assert "filter" not in self.notion.payloads[2]
+        assert self.mirror.get_page_id(self.person_database, "梁永安") is None
+
+    def test_refresh_in_background(self):
+        self.mirror.max_age = 60
+        assert self.mirror.get_page_id(self.person_database, "梁永安") is None
+        # The lookup started the first load, wait for it to finish.
+        with self.mirror._refresh_lock:
+            pass
+        assert self.mirror.is_loaded()
+        assert not self.mirror.refresh()
+        assert self.mirror.get_page_id(self.person_database, "梁永安") == "1"
+        assert len(self.notion.payloads) == 2
+
+
+class TestQueryIter:
+    def setup_method(self, test_method):
+        self.responses = [
+            {
+                "results": [{"id": "1"}, {"id": "2"}],
+                "has_more": True,
+                "next_cursor": "a",
+            },
+            {"results": [{"id": "3"}], "has_more": False, "next_cursor": None},
+        ]
+
+    def test_query_iter(self):
+        notion = FakeNotionManager(list(self.responses))
+        pages = notion.query_iter("database", {"filter": {}}, page_size=2)
+        assert [page["id"] for page in pages] == ["1", "2", "3"]
+        assert notion.payloads[0] == {"filter": {}, "page_size": 2}
+        assert notion.payloads[1]["start_cursor"] == "a"
+
+    def test_query_iter_with_prefetch(self):
+        notion = FakeNotionManager(list(self.responses))
+        pages = notion.query_iter("database", page_size=2, prefetch=True)
+        assert [page["id"] for page in pages] == ["1", "2", "3"]
+        assert len(notion.payloads) == 2
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from notion.notion import NotionManager, NotionAPIException
+from notion.scheduler import RequestScheduler, get_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResponse:
+    def __init__(self, status_code, body, headers=None):
+        self.status_code = status_code
+        self.text = json.dumps(body) if isinstance(body, dict) else body
+        self.headers = headers or {}
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def request(self, method, endpoint, **kwargs):
+        self.requests.append((method, endpoint))
+        return self.responses.pop(0)
+
+
+THROTTLED = FakeResponse(
+    429,
+    {"object": "error", "status": 429, "code": "rate_limited", "message": "Slow down"},
+    {"Retry-After": "0"},
+)
+BAD_GATEWAY = FakeResponse(502, "<html>Bad Gateway</html>")
+PAGE = FakeResponse(200, {"object": "page", "id": "page-id"})
+
+
+class TestRequestScheduler:
+    def setup_method(self, test_method):
+        self.clock = FakeClock()
+        self.scheduler = RequestScheduler(rate=2, burst=2, clock=self.clock)
+
+    def test_burst_then_pace(self):
+        assert self.scheduler.reserve() == 0
+        assert self.scheduler.reserve() == 0
+        assert self.scheduler.reserve() == 0.5
+        assert self.scheduler.reserve() == 1.0
+
+    def test_refill(self):
+        self.scheduler.reserve()
+        self.scheduler.reserve()
+        self.clock.now = 1
+        assert self.scheduler.reserve() == 0
+
+    def test_throttle_backs_off(self):
+        self.scheduler.on_throttle(retry_after=2)
+        assert self.scheduler.rate == 1
+        assert self.scheduler.reserve() == 3
+        assert self.scheduler.stats()["throttled"] == 1
+
+    def test_success_recovers_rate(self):
+        self.scheduler.on_throttle()
+        for _ in range(100):
+            self.scheduler.on_success()
+        assert self.scheduler.rate == 2
+
+    def test_retry_after(self):
+        assert get_retry_after({"Retry-After": "1.5"}) == 1.5
+        assert get_retry_after({"Retry-After": "Wed, 21 Oct 2015"}) is None
+        assert get_retry_after({}) is None
+
+
+class TestNotionManagerRetry:
+    def get_notion(self, responses):
+        self.session = FakeSession(responses)
+        scheduler = RequestScheduler(rate=1000, burst=1000)
+        scheduler.get_backoff = lambda attempt: 0
+        return NotionManager("token", session=self.session, scheduler=scheduler)
+
+    def test_retry_on_429(self):
+        notion = self.get_notion([THROTTLED, THROTTLED, PAGE])
+        assert notion.create({})["id"] == "page-id"
+        assert len(self.session.requests) == 3
+
+    def test_create_is_not_retried_on_502(self):
+        notion = self.get_notion([BAD_GATEWAY, PAGE])
+        with pytest.raises(NotionAPIException):
+            notion.create({})
+        assert len(self.session.requests) == 1
+
+    def test_query_is_retried_on_502(self):
+        results = FakeResponse(200, {"object": "list", "results": []})
+        notion = self.get_notion([BAD_GATEWAY, results])
+        assert notion.query("database", {}) == []
+        assert len(self.session.requests) == 2
+
+    def test_give_up_after_max_retries(self):
+        notion = self.get_notion([THROTTLED] * 4)
+        with pytest.raises(NotionAPIException):
+            notion.query("database", {})
+        assert len(self.session.requests) == 4
@@ -0,0 +1,45 @@
+from notion.database import BookDatabase, PersonDatabase, Column
+from notion.property import Relation
+
+
+class TestColumnSchema:
+    def setup_method(self, test_method):
+        self.database = BookDatabase(None, "book-database")
+
+    def test_book_properties(self):
+        properties = self.database._get_properties(
+            {
+                "title": "学会提问",
+                "author": ["author-id"],
+                "pages": 256,
+                "douban_url": "https://book.douban.com/subject/34434309/",
+                "source_id": "source-id",
+            }
+        )
+        assert properties == {
+            "Title": {"title": [{"text": {"content": "学会提问"}}]},
+            "Author": {"relation": [{"id": "author-id"}]},
+            "Pages": {"number": 256},
+            "Douban": {"url": "https://book.douban.com/subject/34434309/"},
+            "Source": {"relation": [{"id": "source-id"}]},
+        }
+
+    def test_unknown_and_empty_keys_are_skipped(self):
+        properties = self.database._get_properties(
+            {"title": "学会提问", "cover_url": "https://img", "translator": None}
+        )
+        assert list(properties) == ["Title"]
+
+    def test_page_object(self):
+        page = PersonDatabase(None, "person-database")._get_page_object(
+            {"name": "尼尔 · 布朗", "icon_emoji": "🧑‍🏫", "country_id": "country-id"}
+        )
+        assert page["parent"] == {"database_id": "person-database"}
+        assert page["properties"]["Country"] == {"relation": [{"id": "country-id"}]}
+        assert page["icon"] == {"emoji": "🧑‍🏫"}
+
+    def test_single_column(self):
+        column = Column(Relation, "Source", single=True)
+        assert column("source-id").get_dict() == {
+            "Source": {"relation": [{"id": "source-id"}]}
+        }
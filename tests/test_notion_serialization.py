@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import notion.notion
+from notion.database import BookDatabase
+from notion.notion import dumps, loads
+from notion.property import Date, Title
+
+BOOK = {
+    "title": "学会提问",
+    "original_title": "Asking the Right Questions",
+    "author": ["author-id"],
+    "pages": 256,
+    "douban_ranking": 8.1,
+    "source_id": "source-id",
+    "cover_url": "https://img1.doubanio.com/view/subject/l/public/s33477046.jpg",
+}
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(notion.notion, "orjson", None)
+    elif notion.notion.orjson is None:
+        pytest.skip("orjson is not installed.")
+    return request.param
+
+
+class TestSerialization:
+    def test_round_trip(self, backend):
+        page = BookDatabase(None, "book-database")._get_page_object(BOOK)
+        body = dumps(page)
+        assert isinstance(body, bytes)
+        assert "学会提问".encode("utf-8") in body
+        assert loads(body) == json.loads(json.dumps(page)) == page
+
+    def test_properties_have_no_dict(self):
+        for property_object in [Title("Title", "学会提问"), Date("Published", "2019")]:
+            with pytest.raises(AttributeError):
+                property_object.__dict__
+
+    def test_date(self):
+        assert Date("Published", "2019-08-01", end="2019-08-02").get_dict() == {
+            "Published": {"date": {"start": "2019-08-01", "end": "2019-08-02"}}
+        }
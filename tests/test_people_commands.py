@@ -0,0 +1,85 @@
+import threading
+import time
+
+from logic.commands import GetPeopleIDListCommand, GetPersonIDCommand
+from notion.database import PersonDatabase, QueryCache
+from notion.notion import NOTION_API_BASE, NotionManager
+from notion.scheduler import RequestScheduler
+from tests.fake_notion import FakeNotion
+
+
+class SlowPersonDatabase(PersonDatabase):
+    """
+    Creates the first people slowest, so concurrent creates finish out of
+    order.
+    """
+
+    delays = {"张三": 0.06, "李四": 0.03}
+
+    def create_page(self, data):
+        time.sleep(self.delays.get(data["name"], 0))
+        return super().create_page(data)
+
+
+class TestGetPeopleIDListCommand:
+    def setup_method(self, test_method):
+        self.fake = FakeNotion()
+        notion = NotionManager(
+            "secret_test",
+            session=self.fake.session(NOTION_API_BASE),
+            scheduler=RequestScheduler(rate=1000, burst=1000),
+        )
+        self.person_database = SlowPersonDatabase(notion, "person-database")
+        self.command = GetPeopleIDListCommand(GetPersonIDCommand(self.person_database))
+
+    def get_names(self, ids):
+        return [
+            self.fake.pages[id]["properties"]["Name"]["title"][0]["plain_text"]
+            for id in ids
+        ]
+
+    def test_result_order(self):
+        people = [{"name": name} for name in ("张三", "李四", "王五", "赵六")]
+
+        ids = self.command.execute(people)
+
+        assert self.get_names(ids) == ["张三", "李四", "王五", "赵六"]
+
+    def test_dedupe_by_name(self):
+        existing = self.person_database.create_page({"name": "王五"})
+        authors = [{"name": "张三"}, {"name": "王五"}, {"name": "张三"}]
+        translators = [{"name": "李四"}, {"name": "张三"}]
+
+        author_ids, translator_ids = self.command.resolve(authors, translators)
+
+        assert self.get_names(author_ids) == ["张三", "王五", "张三"]
+        assert self.get_names(translator_ids) == ["李四", "张三"]
+        assert author_ids[1] == existing["id"]
+        assert author_ids[0] == translator_ids[1]
+        assert len(self.fake.databases["person-database"]) == 3
+
+    def get_pool_threads(self):
+        return {
+            thread.ident
+            for thread in threading.enumerate()
+            if thread.name.startswith("people")
+        }
+
+    def test_reuses_pool(self):
+        self.command.execute([{"name": "张三"}, {"name": "李四"}])
+        threads = self.get_pool_threads()
+        self.command.execute([{"name": "王五"}, {"name": "赵六"}])
+
+        assert threads and self.get_pool_threads() == threads
+
+    def test_create_missing_reuses_created_person(self):
+        person_database = PersonDatabase(
+            self.person_database.notion, "person-database", cache=QueryCache()
+        )
+        command = GetPersonIDCommand(person_database)
+        assert command.query_by_names([{"name": "张三"}]) == {}
+        # Another request creates the person after the batched miss.
+        page = GetPersonIDCommand(person_database).create_page({"name": "张三"})
+
+        assert command.create_missing({"name": "张三"}) == page
+        assert len(self.fake.databases["person-database"]) == 1
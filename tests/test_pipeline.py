@@ -0,0 +1,150 @@
+import asyncio
+import time
+
+from logic.commands import AddByISBNListCommand
+from logic.pipeline import Pipeline, Stage
+from notion.database import BookDatabase, PersonDatabase, SourceDatabase
+from notion.notion import NOTION_API_BASE, NotionManager
+from notion.scheduler import RequestScheduler
+from tests.fake_notion import FakeNotion
+
+
+class TestPipeline:
+    def setup_method(self, test_method):
+        self.events = []
+
+    def get_stage(self, name, function, concurrency=1):
+        async def handler(item):
+            self.events.append((name, item))
+            # Later items finish first.
+            await asyncio.sleep(0.01 / (item + 1))
+            return function(item)
+
+        return Stage(name, handler, concurrency)
+
+    def test_stage_order(self):
+        pipeline = Pipeline(
+            [
+                self.get_stage("double", lambda item: item * 2, concurrency=3),
+                self.get_stage("increment", lambda item: item + 1, concurrency=2),
+            ],
+            queue_size=1,
+        )
+
+        results = asyncio.run(pipeline.run(range(5)))
+
+        assert results == [{"status": "done", "result": i * 2 + 1} for i in range(5)]
+        for i in range(5):
+            assert self.events.index(("double", i)) < self.events.index(
+                ("increment", i * 2)
+            )
+
+    def test_item_errors_are_isolated(self):
+        def check(item):
+            if item == 1:
+                raise ValueError("bad item")
+            return None if item == 2 else item
+
+        pipeline = Pipeline(
+            [
+                self.get_stage("check", check, concurrency=2),
+                self.get_stage("keep", lambda item: item),
+            ]
+        )
+
+        results = asyncio.run(pipeline.run(range(4)))
+
+        assert results == [
+            {"status": "done", "result": 0},
+            {"status": "error", "stage": "check", "error": "bad item"},
+            {"status": "skipped", "stage": "check"},
+            {"status": "done", "result": 3},
+        ]
+        assert ("keep", 1) not in self.events
+        assert ("keep", 2) not in self.events
+
+
+class FakeBookExtractor:
+    """
+    Books by ISBN. Unknown ISBNs aren't found and "broken" pages fail to
+    parse.
+    """
+
+    def __init__(self, books, delay=0):
+        self.books = books
+        self.delay = delay
+        self.fetched = []
+
+    def fetch(self, isbn):
+        self.fetched.append(isbn)
+        time.sleep(self.delay)
+        if isbn not in self.books:
+            return None
+        return f"https://book.douban.com/subject/{isbn}/", self.books[isbn]
+
+    def parse(self, isbn, url, content):
+        if content == "broken":
+            raise ValueError(f"Cannot parse {url}")
+        return {
+            "type": "Book",
+            "title": content,
+            "isbn": isbn,
+            "author": [{"name": "张三"}],
+            "translator": None,
+        }
+
+
+class FakeAddByISBNListCommand(AddByISBNListCommand):
+    def __init__(self, extractor, *databases):
+        self.extractor = extractor
+        super().__init__(*databases)
+
+    def _get_extractor(self, isbn):
+        return self.extractor if isbn.isdigit() else None
+
+
+class TestAddByISBNListCommand:
+    def setup_method(self, test_method):
+        self.fake = FakeNotion()
+        notion = NotionManager(
+            "secret_test",
+            session=self.fake.session(NOTION_API_BASE),
+            scheduler=RequestScheduler(rate=1000, burst=1000),
+            async_session=self.fake.async_session(NOTION_API_BASE),
+        )
+        self.extractor = FakeBookExtractor(
+            {"1": "学会提问", "2": "broken", "4": "思考的艺术"}
+        )
+        self.command = FakeAddByISBNListCommand(
+            self.extractor,
+            SourceDatabase(notion, "source-database"),
+            PersonDatabase(notion, "person-database"),
+            BookDatabase(notion, "book-database"),
+        )
+
+    def test_results(self):
+        results = asyncio.run(self.command.execute(["1", "2", "x", "3", " 4 "]))
+
+        books = self.fake.databases["book-database"]
+        assert [result["isbn"] for result in results] == ["1", "2", "x", "3", "4"]
+        assert [result["status"] for result in results] == [
+            "added",
+            "error",
+            "invalid",
+            "not_found",
+            "added",
+        ]
+        assert results[1]["error"] == "Cannot parse https://book.douban.com/subject/2/"
+        assert {results[0]["page_id"], results[4]["page_id"]} == {
+            book["id"] for book in books
+        }
+        assert len(self.fake.databases["person-database"]) == 1
+
+    def test_duplicates_are_fetched_once(self):
+        self.extractor.delay = 0.05
+        results = asyncio.run(self.command.execute(["1", " 1", "1"]))
+
+        assert self.extractor.fetched == ["1"]
+        assert [result["status"] for result in results] == ["added"] * 3
+        assert len({result["page_id"] for result in results}) == 1
+        assert len(self.fake.databases["book-database"]) == 1
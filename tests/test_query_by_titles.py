@@ -0,0 +1,57 @@
+from notion.database import PersonDatabase, QueryCache
+from notion.notion import NOTION_API_BASE, NotionManager
+from notion.scheduler import RequestScheduler
+from tests.fake_notion import FakeNotion
+
+
+class RecordingNotion(FakeNotion):
+    def __init__(self):
+        super().__init__()
+        self.filters = []
+
+    def handle(self, method, path, body):
+        if path.endswith("/query"):
+            self.filters.append(body["filter"])
+        return super().handle(method, path, body)
+
+
+class TestQueryByTitles:
+    def setup_method(self, test_method):
+        self.fake = RecordingNotion()
+        self.notion = NotionManager(
+            "secret_test",
+            session=self.fake.session(NOTION_API_BASE),
+            scheduler=RequestScheduler(rate=1000, burst=1000),
+        )
+
+    def test_chunks_conditions(self):
+        person_database = PersonDatabase(self.notion, "person-database")
+        for i in range(150):
+            person_database.create_page({"name": f"Person {i}"})
+        names = [f"Person {i}" for i in range(250)]
+
+        pages = person_database.query_by_titles(names)
+
+        assert sorted(pages) == sorted(names[:150])
+        assert all(get_page_name(page) == name for name, page in pages.items())
+        assert [len(filter["or"]) for filter in self.fake.filters] == [100, 100, 50]
+
+    def test_duplicates_and_cache(self):
+        person_database = PersonDatabase(
+            self.notion, "person-database", cache=QueryCache()
+        )
+        person_database.create_page({"name": "Person 0"})
+        names = [f"Person {i}" for i in range(120)] * 2
+
+        pages = person_database.query_by_titles(names)
+        assert list(pages) == ["Person 0"]
+        # The created page is cached, so only 119 names are queried.
+        assert [len(filter["or"]) for filter in self.fake.filters] == [100, 19]
+
+        # Only the hit is cached, the misses are asked again.
+        assert person_database.query_by_titles(names) == pages
+        assert [len(filter["or"]) for filter in self.fake.filters[2:]] == [100, 19]
+
+
+def get_page_name(page):
+    return page["properties"]["Name"]["title"][0]["plain_text"]
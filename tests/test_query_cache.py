@@ -0,0 +1,153 @@
+import pytest
+
+from notion.database import QueryCache, PersonDatabase
+from notion.notion import NotionManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeNotionManager(NotionManager):
+    def __init__(self):
+        super().__init__("token")
+        self.pages = []
+        self.queries = 0
+
+    def create(self, payload):
+        name = payload["properties"]["Name"]["title"][0]["text"]["content"]
+        page = {
+            "id": f"page-{len(self.pages)}",
+            "properties": {"Name": {"title": [{"plain_text": name}]}},
+        }
+        self.pages.append(page)
+        return page
+
+    def delete(self, page_id):
+        self.pages = [page for page in self.pages if page["id"] != page_id]
+
+    def query_database(self, database_id, payload, timeout=None):
+        self.queries += 1
+        conditions = payload["filter"].get("or", [payload["filter"]])
+        names = [condition["rich_text"]["equals"] for condition in conditions]
+        self.last_names = names
+        results = [
+            page
+            for page in self.pages
+            if page["properties"]["Name"]["title"][0]["plain_text"] in names
+        ]
+        return {"results": results, "has_more": False, "next_cursor": None}
+
+
+class TestQueryCache:
+    def setup_method(self, test_method):
+        self.clock = FakeClock()
+        self.cache = QueryCache(maxsize=2, ttl=10, negative_ttl=5, clock=self.clock)
+
+    def test_key_is_normalized(self):
+        assert QueryCache.get_key("db", {"a": 1, "b": 2}) == QueryCache.get_key(
+            "db", {"b": 2, "a": 1}
+        )
+        assert QueryCache.get_key("db", {"a": 1}) != QueryCache.get_key(
+            "other", {"a": 1}
+        )
+
+    def test_hit_and_miss(self):
+        assert self.cache.get("a") is None
+        self.cache.set("a", [])
+        assert self.cache.get("a") == []
+        assert self.cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+    def test_ttl(self):
+        self.cache.set("a", [{"id": "1"}])
+        self.clock.now = 11
+        assert self.cache.get("a") is None
+
+    def test_negative_ttl(self):
+        self.cache.set("a", [])
+        self.cache.set("b", [{"id": "1"}])
+        self.clock.now = 6
+        assert self.cache.get("a") is None
+        assert self.cache.get("b") == [{"id": "1"}]
+
+    def test_negatives_not_cached_by_default(self):
+        cache = QueryCache()
+        cache.set("a", [{"id": "1"}])
+        cache.set("a", [])
+        assert cache.get("a") is None
+        assert cache.stats()["size"] == 0
+
+    def test_lru_eviction(self):
+        self.cache.set("a", [])
+        self.cache.set("b", [])
+        self.cache.get("a")
+        self.cache.set("c", [])
+        assert self.cache.get("b") is None
+        assert self.cache.get("a") == []
+        assert self.cache.get("c") == []
+
+    def test_invalidate_page(self):
+        self.cache.set("a", [{"id": "1"}])
+        self.cache.set("b", [{"id": "2"}])
+        self.cache.invalidate_page("1")
+        assert self.cache.get("a") is None
+        assert self.cache.get("b") == [{"id": "2"}]
+
+
+class TestCachedPersistenceLayer:
+    def setup_method(self, test_method):
+        self.notion = FakeNotionManager()
+        self.cache = QueryCache()
+        self.person_database = PersonDatabase(self.notion, "person", cache=self.cache)
+
+    def test_database_id_is_required(self):
+        with pytest.raises(ValueError):
+            PersonDatabase(self.notion, None, cache=self.cache)
+
+    def test_query_is_read_through(self):
+        page = self.notion.create(
+            {"properties": {"Name": {"title": [{"text": {"content": "梁永安"}}]}}}
+        )
+        filter = self.person_database.get_title_filter("梁永安")
+        assert self.person_database.query_pages(filter) == [page]
+        assert self.person_database.query_pages(filter) == [page]
+        assert self.notion.queries == 1
+
+    def test_misses_are_not_cached(self):
+        filter = self.person_database.get_title_filter("梁永安")
+        assert self.person_database.query_pages(filter) == []
+        # Created by another instance.
+        page = self.notion.create(
+            {"properties": {"Name": {"title": [{"text": {"content": "梁永安"}}]}}}
+        )
+        assert self.person_database.query_pages(filter) == [page]
+        assert self.notion.queries == 2
+
+    def test_create_writes_through(self):
+        filter = self.person_database.get_title_filter("梁永安")
+        self.person_database.query_pages(filter)
+        page = self.person_database.create_page({"name": "梁永安"})
+        assert self.person_database.query_pages(filter) == [page]
+        assert self.notion.queries == 1
+
+    def test_delete_invalidates(self):
+        page = self.person_database.create_page({"name": "梁永安"})
+        self.person_database.delete_page(page["id"])
+        filter = self.person_database.get_title_filter("梁永安")
+        assert self.person_database.query_pages(filter) == []
+        assert self.notion.queries == 1
+
+    def test_query_by_titles_uses_cache(self):
+        page = self.person_database.create_page({"name": "梁永安"})
+        pages = self.person_database.query_by_titles(["梁永安", "周飞舟"])
+        assert pages == {"梁永安": page}
+        assert self.notion.queries == 1
+
+        # Only the miss is asked again.
+        self.person_database.query_by_titles(["梁永安", "周飞舟"])
+        assert self.notion.queries == 2
+        assert self.notion.last_names == ["周飞舟"]
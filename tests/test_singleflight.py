@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from logic.commands import GetPersonIDCommand, AsyncGetPersonIDCommand
+from logic.singleflight import SingleFlight, AsyncSingleFlight
+
+
+class FakePersonDatabase:
+    """
+    Slow person database whose create_page makes the page visible to later
+    queries, like the write-through query cache does.
+    """
+
+    database_id = "person-database"
+
+    def __init__(self):
+        self.pages = {}
+        self.created = []
+        self.lock = threading.Lock()
+
+    def get_title_filter(self, title):
+        return title
+
+    def query_pages(self, filter):
+        time.sleep(0.05)
+        return [self.pages[filter]] if filter in self.pages else []
+
+    def create_page(self, data):
+        time.sleep(0.05)
+        with self.lock:
+            self.created.append(data["name"])
+            page = {"id": f"page-{len(self.created)}"}
+            self.pages[data["name"]] = page
+        return page
+
+    async def aquery_pages(self, filter):
+        await asyncio.sleep(0.05)
+        return [self.pages[filter]] if filter in self.pages else []
+
+    async def acreate_page(self, data):
+        await asyncio.sleep(0.05)
+        return self.create_page(data)
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        def work(value):
+            calls.append(value)
+            time.sleep(0.1)
+            return value * 2
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: flight.do("key", work, 21), range(8)))
+
+        assert results == [42] * 8
+        assert calls == [21]
+        assert flight.stats() == {"calls": 1, "shared": 7}
+
+    def test_key_is_released(self):
+        flight = SingleFlight()
+        assert flight.do("key", lambda: 1) == 1
+        assert flight.do("key", lambda: 2) == 2
+
+    def test_error_is_shared(self):
+        flight = SingleFlight()
+
+        def fail():
+            time.sleep(0.1)
+            raise ValueError("Douban is down")
+
+        def call(_):
+            with pytest.raises(ValueError):
+                flight.do("key", fail)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(call, range(4)))
+
+    def test_async(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def work(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            return value * 2
+
+        async def main():
+            return await asyncio.gather(*(flight.do("key", work, 21) for _ in range(5)))
+
+        assert asyncio.run(main()) == [42] * 5
+        assert calls == [21]
+        assert flight.stats() == {"calls": 1, "shared": 4}
+
+
+class TestCoalescedCommands:
+    def test_person_is_created_once(self):
+        database = FakePersonDatabase()
+        command = GetPersonIDCommand(database)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            ids = list(
+                pool.map(lambda _: command.execute({"name": "尼尔 · 布朗"}), range(4))
+            )
+
+        assert database.created == ["尼尔 · 布朗"]
+        assert len(set(ids)) == 1
+
+    def test_person_is_created_once_async(self):
+        database = FakePersonDatabase()
+        command = AsyncGetPersonIDCommand(database)
+
+        async def main():
+            return await asyncio.gather(
+                *(command.execute({"name": "尼尔 · 布朗"}) for _ in range(4))
+            )
+
+        assert len(set(asyncio.run(main()))) == 1
+        assert database.created == ["尼尔 · 布朗"]
@@ -0,0 +1,166 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from extractor.base import Extractor
+from logic.commands import Command
+from telemetry.tracing import (
+    InMemoryExporter,
+    Tracer,
+    bind_context,
+    get_current_span,
+    span,
+    traced,
+)
+
+
+class FakeExtractor(Extractor):
+    def match(self, url):
+        return True
+
+    def extract(self, url):
+        with span("download"):
+            pass
+        return {"url": url}
+
+
+class FakeCommand(Command):
+    def __init__(self, extractor):
+        self.extractor = extractor
+
+    async def execute(self, url):
+        return await asyncio.to_thread(self.extractor.extract, url)
+
+
+def get_tree(trace):
+    names = {span.span_id: span.name for span in trace.spans}
+    return {span.name: names.get(span.parent_id) for span in trace.spans}
+
+
+class TestTracer:
+    def test_nested_spans(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer([exporter])
+
+        @traced("notion.query_database")
+        def query():
+            return get_current_span()
+
+        with tracer.trace("AddByISBN") as trace:
+            with span("lookup", title="Title") as lookup:
+                current = query()
+
+        assert exporter.traces == [trace]
+        assert get_tree(trace) == {
+            "notion.query_database": "lookup",
+            "lookup": "AddByISBN",
+            "AddByISBN": None,
+        }
+        assert current.parent_id == lookup.span_id
+        assert lookup.attributes == {"title": "Title"}
+        assert all(span.duration_ms >= 0 for span in trace.spans)
+        assert get_current_span() is None
+
+    def test_no_trace(self):
+        with span("lookup") as lookup:
+            assert lookup is None
+
+    def test_disabled(self):
+        with Tracer(enabled=False).trace("AddByISBN") as trace:
+            assert trace is None
+            assert get_current_span() is None
+
+    def test_record_error(self):
+        tracer = Tracer()
+
+        with pytest.raises(ValueError):
+            with tracer.trace("AddByISBN") as trace:
+                with span("lookup"):
+                    raise ValueError("Bad title")
+
+        assert [span.error for span in trace.spans] == [
+            "ValueError: Bad title",
+            "ValueError: Bad title",
+        ]
+
+    def test_trace_subclass_methods(self):
+        tracer = Tracer()
+
+        async def run():
+            with tracer.trace("AddByURL") as trace:
+                await FakeCommand(FakeExtractor()).execute("https://example.com")
+            return trace
+
+        trace = asyncio.run(run())
+
+        assert get_tree(trace) == {
+            "download": "FakeExtractor.extract",
+            "FakeExtractor.extract": "FakeCommand.execute",
+            "FakeCommand.execute": "AddByURL",
+            "AddByURL": None,
+        }
+
+    def test_bind_context(self):
+        tracer = Tracer()
+
+        @traced("notion.create")
+        def create(name):
+            return name
+
+        with tracer.trace("AddByISBN") as trace:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(bind_context(create), ["a", "b", "c"]))
+
+        assert [span.name for span in trace.spans].count("notion.create") == 3
+        assert all(
+            span.parent_id == trace.root.span_id
+            for span in trace.spans
+            if span is not trace.root
+        )
+
+
+class TestExport:
+    def get_trace(self):
+        tracer = Tracer()
+        with tracer.trace("AddByISBN", isbn="9787111632306") as trace:
+            with span("DoubanBookExtractor.extract"):
+                pass
+            for _ in range(3):
+                with span("notion.create"):
+                    pass
+        return trace
+
+    def test_server_timing(self):
+        metrics = self.get_trace().server_timing().split(", ")
+
+        assert [metric.split(";")[0] for metric in metrics] == [
+            "total",
+            "DoubanBookExtractor.extract",
+            "notion.create",
+        ]
+        assert 'notion.create;desc="x3";dur=' in metrics[2]
+
+    def test_to_otlp(self):
+        trace = self.get_trace()
+
+        body = trace.to_otlp("test-service")
+        resource_spans = body["resourceSpans"][0]
+        spans = resource_spans["scopeSpans"][0]["spans"]
+
+        assert resource_spans["resource"]["attributes"] == [
+            {"key": "service.name", "value": {"stringValue": "test-service"}}
+        ]
+        assert len(spans) == 5
+        assert {span["traceId"] for span in spans} == {trace.trace_id}
+        root = spans[-1]
+        assert root["name"] == "AddByISBN"
+        assert "parentSpanId" not in root
+        assert root["attributes"] == [
+            {"key": "isbn", "value": {"stringValue": "9787111632306"}}
+        ]
+        assert all(span["parentSpanId"] == root["spanId"] for span in spans[:-1])
+        assert all(
+            int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"])
+            for span in spans
+        )